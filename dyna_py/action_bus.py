@@ -0,0 +1,128 @@
+# action_bus.py
+"""
+Wakeup channel for the action queue.
+
+LanceDB `queue` stays the durable log; this module only tells the queue watcher
+that a new row was written so it polls right away instead of waiting out the
+fallback interval.
+
+Backends (ACTION_BUS_BACKEND):
+- "inproc": producer and consumer share a process (app.py + agents.main thread).
+  Waiters are asyncio.Events woken with call_soon_threadsafe.
+- "udp": producer and consumer live in different processes. Producers send a
+  one-byte datagram to ACTION_BUS_HOST:ACTION_BUS_PORT; the consumer listens
+  there. In-process waiters are still woken too.
+  With ACTION_BUS_LISTENERS > 1 (sharded runtime, `agents.py --workers N`)
+  worker i listens on ACTION_BUS_PORT + i and producers send to every port.
+"""
+import asyncio
+import os
+import socket
+import threading
+
+ACTION_BUS_BACKEND = os.getenv("ACTION_BUS_BACKEND", "inproc")   # "inproc" | "udp"
+ACTION_BUS_HOST = os.getenv("ACTION_BUS_HOST", "127.0.0.1")
+ACTION_BUS_PORT = int(os.getenv("ACTION_BUS_PORT", "47711"))
+ACTION_BUS_LISTENERS = int(os.getenv("ACTION_BUS_LISTENERS", "1"))
+
+# Fallback poll when no wakeup arrives (lost datagram, external writer, ...)
+ACTION_POLL_FALLBACK_S = float(os.getenv("ACTION_POLL_FALLBACK_S", "15"))
+
+_lock = threading.Lock()
+_waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+_udp_sock: socket.socket | None = None
+
+
+class _WakeupProtocol(asyncio.DatagramProtocol):
+    def __init__(self, ev: asyncio.Event):
+        self.ev = ev
+
+    def datagram_received(self, data, addr):
+        self.ev.set()
+
+
+def subscribe() -> asyncio.Event:
+    """
+    Register a wakeup event for the running loop. The event starts set so the
+    first poll happens immediately (picks up anything queued before startup).
+    """
+    loop = asyncio.get_running_loop()
+    ev = asyncio.Event()
+    ev.set()
+    with _lock:
+        _waiters.append((loop, ev))
+    return ev
+
+
+def unsubscribe(ev: asyncio.Event):
+    with _lock:
+        _waiters[:] = [(l, e) for (l, e) in _waiters if e is not ev]
+
+
+async def start_listener(ev: asyncio.Event, index: int = 0):
+    """Bind the cross-process listener (udp backend only). Safe no-op otherwise."""
+    if ACTION_BUS_BACKEND != "udp":
+        return None
+    loop = asyncio.get_running_loop()
+    port = ACTION_BUS_PORT + index
+    try:
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: _WakeupProtocol(ev),
+            local_addr=(ACTION_BUS_HOST, port),
+        )
+        print(f"action_bus listening on udp://{ACTION_BUS_HOST}:{port}")
+        return transport
+    except OSError as e:
+        # Another consumer owns the port; fall back to polling + in-proc wakeups
+        print(f"action_bus listener unavailable ({e}); using fallback polling")
+        return None
+
+
+def notify_action():
+    """Called by producers after a queue row is durably written. Thread-safe."""
+    with _lock:
+        waiters = list(_waiters)
+    for loop, ev in waiters:
+        try:
+            loop.call_soon_threadsafe(ev.set)
+        except RuntimeError:
+            # loop closed; drop it
+            unsubscribe(ev)
+
+    if ACTION_BUS_BACKEND == "udp":
+        global _udp_sock
+        try:
+            if _udp_sock is None:
+                _udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            for i in range(ACTION_BUS_LISTENERS):
+                _udp_sock.sendto(b"!", (ACTION_BUS_HOST, ACTION_BUS_PORT + i))
+        except OSError as e:
+            print(f"action_bus notify error: {e}")
+
+
+async def wait_event(ev: asyncio.Event, timeout: float) -> bool:
+    """
+    Block until `ev` is set or `timeout` elapses; returns True if it was set.
+    Clears the event before returning so a set() during the caller's next poll
+    triggers another one. (call_later rather than wait_for, which can swallow a
+    cancel on 3.10.)
+    """
+    timed_out = False
+
+    def _expire():
+        nonlocal timed_out
+        timed_out = True
+        ev.set()
+
+    timer = asyncio.get_running_loop().call_later(timeout, _expire)
+    try:
+        await ev.wait()
+    finally:
+        timer.cancel()
+    ev.clear()
+    return not timed_out
+
+
+async def wait_for_actions(ev: asyncio.Event, timeout: float = ACTION_POLL_FALLBACK_S) -> bool:
+    """Block until a queue wakeup arrives or the fallback timeout elapses."""
+    return await wait_event(ev, timeout)
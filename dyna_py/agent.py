@@ -1,34 +1,44 @@
 
 import asyncio
 import json
+import os
+import socket
 from datetime import datetime, timezone
 
-from queue_imp import mark_action_processed_async, QUEUE_NAME
+from queue_imp import claim_actions_async, ack_actions_async, QUEUE_NAME
+from action_bus import wait_for_actions, ACTION_POLL_FALLBACK_S
 
 from agent_core import AgentBase, InterruptMixin
 from joke_agent import JokeAgent
 
-from store.agent_state import upsert_agent_state, get_agent_state
+from store.agent_state import upsert_agent_state_async, get_agent_state_async
+from store.state_cache import STATE_CACHE
+from store.db import open_async_table
 from environment import environment_reload as _environment_reload
 from persona_agent import PersonaAgent
-from store.conversations import add_participant_if_absent
+from store.conversations import add_participant_if_absent_async
+from session_registry import SessionRegistry
+import shards
 
 JOKE_AGENTS = {}  # agent_id -> JokeAgent
-SESSIONS = {}              # session_id -> instance
-AGENT_LATEST = {}          # agent_id -> latest session_id
+SESSIONS = SessionRegistry()   # session_id -> instance (+ latest session per agent_id)
+AGENT_LOOP: asyncio.AbstractEventLoop | None = None   # loop running the agents (set by agents.main)
 
 
 async def upsert_state_async(agent_id, status=None, iteration=None, result=None, context=None, history=None,  session_id=None):
-    def do_upsert():
+    # Reads come from the write-behind cache; the table is only consulted the first time
+    prev = STATE_CACHE.get(agent_id, session_id)
+    if prev is None:
         try:
-            prev = get_agent_state(agent_id, session_id=session_id)
-                        
+            prev = await get_agent_state_async(agent_id, session_id=session_id)
         except Exception as e:
             print(f"get_agent_state failed for {agent_id}/{session_id}: {e}")
             prev = {}
 
-        eff_status = status or (prev.get("status") if prev else "running")
-        upsert_agent_state(
+    eff_status = status or (prev.get("status") if prev else "running")
+    if not STATE_CACHE.running:
+        # No flusher in this process (scripts, tests): write through
+        await upsert_agent_state_async(
             agent_id=agent_id,
             session_id=session_id,
             status=eff_status,
@@ -37,7 +47,16 @@ async def upsert_state_async(agent_id, status=None, iteration=None, result=None,
             context=context,
             history=history,
         )
-    await asyncio.to_thread(do_upsert)
+        return
+    STATE_CACHE.put(
+        agent_id,
+        eff_status,
+        session_id=session_id,
+        iteration=iteration,
+        result=result,
+        context=context,
+        history=history,
+    )
 
 
 
@@ -46,9 +65,8 @@ def _resolve_agent(agent_id=None, session_id=None):
     if session_id and session_id in SESSIONS:
         return session_id, SESSIONS.get(session_id)
     # Fallback: latest session for agent_id (only if not stale)
-    if agent_id and agent_id in AGENT_LATEST:
-        sid = AGENT_LATEST[agent_id]
-        agent = SESSIONS.get(sid)
+    if agent_id:
+        sid, agent = SESSIONS.latest(agent_id)
         if agent:
             return sid, agent
     # stale mapping; fall through to legacy
@@ -58,6 +76,47 @@ def _resolve_agent(agent_id=None, session_id=None):
     return None, None
 
 
+# Batched acks: handlers defer their ack; completed ids are flushed together
+# with a single `action_id IN (...)` update instead of one update per action.
+PENDING_ACKS: set[str] = set()
+ACK_FLUSH_DELAY_S = 0.05
+_ack_flush_task: asyncio.Task | None = None
+
+# Lease owner recorded on claimed queue rows
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def defer_ack(action_id):
+    if action_id:
+        PENDING_ACKS.add(action_id)
+
+
+async def flush_acks(async_tbl):
+    if not PENDING_ACKS:
+        return
+    ids = list(PENDING_ACKS)
+    PENDING_ACKS.difference_update(ids)
+    try:
+        await ack_actions_async(async_tbl, ids)
+    except Exception as e:
+        # Put them back; the lease keeps them from being re-dispatched meanwhile
+        print(f"ack flush failed for {len(ids)} action(s): {e}")
+        PENDING_ACKS.update(ids)
+
+
+def _schedule_ack_flush(async_tbl):
+    global _ack_flush_task
+    if _ack_flush_task is not None and not _ack_flush_task.done():
+        return
+
+    async def _later():
+        while PENDING_ACKS:
+            await asyncio.sleep(ACK_FLUSH_DELAY_S)
+            await flush_acks(async_tbl)
+
+    _ack_flush_task = asyncio.create_task(_later())
+
+
 async def environment_reload_handler(db, async_tbl, action):
     action_id = action.get("action_id")
     try:
@@ -65,7 +124,7 @@ async def environment_reload_handler(db, async_tbl, action):
         await _environment_reload(action)
     finally:
         if action_id:
-            await mark_action_processed_async(async_tbl, action_id)
+            defer_ack(action_id)
 
 # Agent action handlers
 
@@ -121,28 +180,28 @@ async def agent_create(db, async_tbl, action):
             )
 
 
-        # Register
-        SESSIONS[session_id] = agent
-        AGENT_LATEST[agent_id] = session_id
+        # Register (the payload is kept so a sharded worker can hand the session off)
+        SESSIONS.register(session_id, agent, spec={**payload, "agent_id": agent_id, "agent_type": agent_type, "session_id": session_id})
         JOKE_AGENTS[agent_id] = agent  # legacy compatibility
 
         try:
             if agent_type == "PersonaAgent" and conversation_id:
-                add_participant_if_absent(conversation_id, agent_id, session_id, persona_config)
+                await add_participant_if_absent_async(conversation_id, agent_id, session_id, persona_config)
 
 
-                from store.conversations import get_conversation_messages_and_participants
-                from queue_imp import agent_interrupt_action
+                from store.conversations import list_participants_async
+                from queue_imp import agent_interrupt_actions
 
                 if agent_type == "PersonaAgent" and conversation_id:
-                    snap = get_conversation_messages_and_participants(conversation_id)
-                    parts = snap.get("participants", [])
-                    for p in parts:
-                        aid = p.get("agent_id")
-                        sid = p.get("session_id")
-                        if not aid or not sid or aid == agent_id:
-                            continue
-                        agent_interrupt_action(aid, sid, "system", {"type": "participants_changed"})
+                    # Participants only; the messages snapshot is not needed here
+                    parts = await list_participants_async(conversation_id)
+                    targets = [
+                        (p["agent_id"], p["session_id"], {"type": "participants_changed"})
+                        for p in parts
+                        if p.get("agent_id") and p.get("session_id") and p.get("agent_id") != agent_id
+                    ]
+                    if targets:
+                        await asyncio.to_thread(agent_interrupt_actions, targets, "system")
 
                 
         except Exception as e:
@@ -170,8 +229,26 @@ async def agent_create(db, async_tbl, action):
 
     finally:
         if action_id:
-            await mark_action_processed_async(async_tbl, action_id)
-            print(f"Marked action_id {action_id} as processed.")
+            defer_ack(action_id)
+            print(f"Queued ack for action_id {action_id}.")
+
+
+async def _stop_agent_task(agent, timeout: float = 5.0):
+    # Ask the loop to stop; cancel it if it doesn't finish in time
+    if hasattr(agent, "resume"):
+        agent.resume()
+    if hasattr(agent, "request_stop"):
+        agent.request_stop()
+    task = getattr(agent, "_task", None)
+    if isinstance(task, asyncio.Task):
+        try:
+            await asyncio.wait_for(task, timeout=timeout)
+        except asyncio.TimeoutError:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
 
 
 async def agent_destroy(db, async_tbl, action):
@@ -188,27 +265,11 @@ async def agent_destroy(db, async_tbl, action):
 
         await upsert_state_async(agent.agent_id, status="stopping", session_id=sid or session_id)
 
-        if hasattr(agent, "resume"):
-            agent.resume()
-        if hasattr(agent, "request_stop"):
-            agent.request_stop()
-        task = getattr(agent, "_task", None)
-        if isinstance(task, asyncio.Task):
-            try:
-                await asyncio.wait_for(task, timeout=5.0)
-            except asyncio.TimeoutError:
-                task.cancel()
-                try:
-                    await task
-                except asyncio.CancelledError:
-                    pass
+        await _stop_agent_task(agent)
 
-        
         # Cleanup
         if sid:
-            SESSIONS.pop(sid, None)
-        if agent_id and AGENT_LATEST.get(agent_id) == sid:
-            AGENT_LATEST.pop(agent_id, None)
+            SESSIONS.unregister(sid)
         if agent_id:
             JOKE_AGENTS.pop(agent_id, None)
 
@@ -216,7 +277,7 @@ async def agent_destroy(db, async_tbl, action):
         print(f"Agent {agent.agent_id}/{sid or session_id} destroyed.")
     finally:
         if action_id:
-            await mark_action_processed_async(async_tbl, action_id)
+            defer_ack(action_id)
 
 
 async def agent_pause(db, async_tbl, action):
@@ -234,7 +295,7 @@ async def agent_pause(db, async_tbl, action):
             print(f"Agent not found for agent_id={agent_id}, session_id={session_id}")
     finally:
         if action_id:
-            await mark_action_processed_async(async_tbl, action_id)
+            defer_ack(action_id)
 
 
 async def agent_resume(db, async_tbl, action):
@@ -252,7 +313,7 @@ async def agent_resume(db, async_tbl, action):
             print(f"Agent not found for agent_id={agent_id}, session_id={session_id}")
     finally:
         if action_id:
-            await mark_action_processed_async(async_tbl, action_id)
+            defer_ack(action_id)
 
 
 async def agent_interrupt(db, async_tbl, action):
@@ -276,9 +337,68 @@ async def agent_interrupt(db, async_tbl, action):
         print(f"agent_interrupt payload error: {e}; raw={payload_raw!r}")
     finally:
         if action_id:
-            await mark_action_processed_async(async_tbl, action_id)
+            defer_ack(action_id)
+
+
+
+# Local fast path: producers in this process (Flask routes, fan-out) hand guidance
+# straight to a resident agent instead of round-tripping through the queue table.
+
+async def _interrupt_resident(agent, session_id, guidance):
+    try:
+        await agent.interrupt(guidance)
+        await upsert_state_async(agent.agent_id, status="running", context={"last_guidance": guidance}, session_id=session_id)
+    except Exception as e:
+        print(f"local interrupt failed for {agent.agent_id}/{session_id}: {e}")
+
+
+def deliver_interrupt_local(agent_id, session_id, guidance) -> bool:
+    """
+    Deliver guidance to the agent owning `session_id` if it lives in this process.
+    Thread-safe; returns False (caller should enqueue instead) when it isn't resident.
+    """
+    loop = AGENT_LOOP
+    if loop is None or loop.is_closed() or not session_id:
+        return False
+    agent = SESSIONS.get(session_id)
+    if agent is None or not hasattr(agent, "interrupt"):
+        return False
+    if agent_id and agent.agent_id != agent_id:
+        return False
+    try:
+        loop.call_soon_threadsafe(lambda: asyncio.ensure_future(_interrupt_resident(agent, session_id, guidance)))
+    except RuntimeError:
+        return False
+    return True
+
 
 
+# Sharded runtime: sessions whose bucket moved to another worker are stopped here
+# and re-created there from the create_agent payload they were started with.
+
+async def handoff_sessions(shard_map) -> int:
+    from queue_imp import build_action_record, create_actions
+
+    moved = []
+    for sid in SESSIONS.not_owned(shard_map):
+        agent = SESSIONS.get(sid)
+        moved.append(SESSIONS.spec(sid))
+        await _stop_agent_task(agent)
+        SESSIONS.unregister(sid)
+        if JOKE_AGENTS.get(agent.agent_id) is agent:
+            JOKE_AGENTS.pop(agent.agent_id, None)
+        print(f"Agent {agent.agent_id}/{sid}: handing off (shard {shards.shard_for(sid)})")
+    if not moved:
+        return 0
+    # The new owner reads state from the table; make sure ours is there first
+    await STATE_CACHE.flush()
+    records = [
+        build_action_record("create_agent", "handoff", payload=json.dumps(spec), session_id=spec.get("session_id"))
+        for spec in moved
+    ]
+    await asyncio.to_thread(create_actions, records)
+    return len(moved)
+
 
 ACTION_HANDLERS = {
 'create_agent': agent_create,
@@ -302,6 +422,9 @@ async def handle_actions(db, async_tbl, actions):
         handler = ACTION_HANDLERS.get(action["type"])
         if not handler:
             print(f"Unknown action type: {action}")
+            # ack so the row is not re-claimed every time its lease expires
+            defer_ack(aid)
+            _schedule_ack_flush(async_tbl)
             continue
         IN_FLIGHT_ACTION_IDS.add(aid)
 
@@ -314,16 +437,20 @@ async def handle_actions(db, async_tbl, actions):
                 traceback.print_exc()
             finally:
                 IN_FLIGHT_ACTION_IDS.discard(aid)
+                _schedule_ack_flush(async_tbl)
         asyncio.create_task(run_one())
 
 
 
-async def poll_lancedb_for_actions(db, async_tbl):
-    await asyncio.sleep(15)
-    print("c")
-    async_tbl = await db.open_table(QUEUE_NAME)
+async def poll_lancedb_for_actions(db, async_tbl, wakeup: asyncio.Event | None = None):
+    # Wait for a push from action_bus (ms after create_action); the timeout is only a safety net
+    if wakeup is None:
+        await asyncio.sleep(ACTION_POLL_FALLBACK_S)
+    else:
+        await wait_for_actions(wakeup, timeout=ACTION_POLL_FALLBACK_S)
+    async_tbl = await open_async_table(QUEUE_NAME)
 
-    result = await async_tbl.query().where("processed == False").to_pandas()
-    return result.to_dict(orient="records")
+    shard_map = shards.SHARDS
+    return await claim_actions_async(async_tbl, WORKER_ID, where=shard_map.claim_filter() if shard_map else None)
     
 
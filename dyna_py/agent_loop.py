@@ -4,6 +4,7 @@ from datetime import datetime, timezone
 from typing import Any, Awaitable, Callable, Optional, Dict, Union
 
 from agent_core import AgentBase, StopMixin
+from tick_scheduler import TickSignal
 
 GuidanceInput = Union[str, dict, list, None]
 GuidanceDict = Optional[dict]
@@ -19,6 +20,7 @@ class StepOutcome:
     latency_ms: Optional[int] = None
     error: Optional[str] = None
     guidance: Optional[dict] = None  # normalized guidance affecting this tick
+    idle: bool = False  # nothing happened: no step row, state written once per idle stretch (see run)
 
 class LoopingAgentBase(AgentBase, StopMixin):
     def __init__ (
@@ -49,7 +51,8 @@ class LoopingAgentBase(AgentBase, StopMixin):
         self._context.setdefault("agent_type", self.__class__.__name__)
         self.current_subject = None
 
-        self._tick_event: Optional[asyncio.Event] = asyncio.Event()
+        # Set by interrupts/resume to wake the loop early; timeouts come from the shared tick scheduler
+        self._tick_event: Optional[TickSignal] = TickSignal()
         self._tick_event.set()  # ensure the first tick runs immediately
         # Paused flag is computed per-tick if PauseMixin is present
         # NEW: simple tool registry (name -> async callable(args)->result)
@@ -92,6 +95,10 @@ class LoopingAgentBase(AgentBase, StopMixin):
         # Put free-form text under a conventional key
         return {"_raw_text": str(raw)}
 
+    def next_tick_interval(self) -> float:
+        # Seconds until the next tick unless woken early; override for an adaptive cadence
+        return self.loop_interval
+
     def should_continue_on_error(self, exc: Exception) -> bool:
         return True  # default: keep going
 
@@ -146,10 +153,8 @@ class LoopingAgentBase(AgentBase, StopMixin):
 
     async def _wait_for_tick_or_timeout(self):
         try:
-        # Wake either by interrupt (event set) or fallback timer
-            await asyncio.wait_for(self._tick_event.wait(), timeout=self.loop_interval)
-        except asyncio.TimeoutError:
-            pass
+        # Wake either by interrupt (event set) or the tick scheduler (loop_interval, jittered)
+            await self._tick_event.wait(timeout=self.next_tick_interval())
         finally:
         # Clear event (if it was set). If new interrupts arrive later, they set it again.
             try:
@@ -239,6 +244,14 @@ class LoopingAgentBase(AgentBase, StopMixin):
                     await self._state_update(status="error", iteration=step, result=outcome.error, context=self._context_snapshot())
                     break
 
+            if outcome.idle and guidance_to_persist is None:
+                # Collapse idle ticks: one state write ("idle since X") when the agent goes idle, then nothing
+                if "idle_since" not in self._context:
+                    self._merge_context({"idle_since": datetime.now(timezone.utc).isoformat()})
+                    await self._state_update(status="running", iteration=step, context=self._context_snapshot())
+                continue
+            self._context.pop("idle_since", None)
+
             # Execute agent intent (silent/speak/stop for now)
             try:
                 if isinstance(outcome.data, dict):
@@ -374,11 +387,11 @@ class LoopingAgentBase(AgentBase, StopMixin):
             conv_id = getattr(self, "conversation_id", None)
             if not conv_id:
                 return
-            from store.messages import append_message
+            from store.messages import append_message_async
             meta = {"session_id": self.session_id}
             if mode:
                 meta["mode"] = mode
-            append_message(conv_id, self.agent_id, "agent", text, meta=meta)
+            await append_message_async(conv_id, self.agent_id, "agent", text, meta=meta)
             if hasattr(self, "_last_spoke_at"):
                 from datetime import datetime as _dt
                 self._last_spoke_at = _dt.now()
@@ -412,10 +425,11 @@ class LoopingAgentBase(AgentBase, StopMixin):
         try:
             conv_id = getattr(self, "conversation_id", None)
             last_seen = getattr(self, "last_seen_iso", None)
-            if not conv_id or not last_seen:
+            last_seq = getattr(self, "last_seen_seq", None)
+            if not conv_id or not (last_seen or last_seq is not None):
                 return False
-            from store.messages import list_messages_since
-            return bool(list_messages_since(conv_id, last_seen, limit=1))
+            from store.message_cache import MESSAGE_CACHE
+            return bool(await MESSAGE_CACHE.since(conv_id, after_seq=last_seq, since_iso=last_seen, limit=1, fresh=True))
         except Exception:
             return False
         
\ No newline at end of file
@@ -1,28 +1,62 @@
 import asyncio
 from agent import handle_actions, poll_lancedb_for_actions
 import lancedb
-from queue_imp import  AGENTS_URI, QUEUE_NAME
+from queue_imp import  AGENTS_URI, QUEUE_NAME, ACTION_CLAIM_BATCH
+import action_bus
+from store.maintenance import run_maintenance_async, MAINTENANCE_INTERVAL_S
 
 import pandas as pd
-from store.schemas import MESSAGES_NAME, PARTICIPANTS_NAME, CONVERSATIONS_NAME
-from queue_imp import agent_interrupt_action, persona_agent_create
-from store.agent_state import get_agent_state
+from store.schemas import MESSAGES_NAME, PARTICIPANTS_NAME, CONVERSATIONS_NAME, migrate_queue_schema, migrate_messages_schema, migrate_agent_steps_schema, ensure_scalar_indexes, ensure_fts_indexes
+from queue_imp import agent_interrupt_action, agent_interrupt_actions, interrupt_action_id, persona_agent_create
+from store.agent_state import get_agent_state_async
+from store.state_cache import STATE_CACHE
+from store.cursors import get_cursor_async, set_cursor_async
+from store.roster import ROSTER
+from store.messages import max_message_seq_async, add_append_hook, remove_append_hook
+from store.step_writer import STEP_WRITER
+from store.summaries import ensure_conversation_summaries_async
+from store.search import embedding_indexer_loop
+from store.db import get_async_db, open_async_table
 import json
+import os
+import signal
+import socket
+import threading
+import multiprocessing
+from datetime import datetime, timezone
 from collections import deque
+import shards
+from store.workers import heartbeat_async, list_live_workers_async, remove_worker_async, ensure_workers_async
 
 
 
 
 
 
-async def queue_watcher(db, async_tbl):
+async def queue_watcher(db, async_tbl, listener_index: int = 0):
+    wakeup = action_bus.subscribe()
+    await action_bus.start_listener(wakeup, index=listener_index)
     while True:
-        actions = await poll_lancedb_for_actions(db, async_tbl)
+        actions = await poll_lancedb_for_actions(db, async_tbl, wakeup=wakeup)
         _ = await handle_actions(db, async_tbl, actions=actions)
-
-async def get_db_tbl(): 
-    db = await lancedb.connect_async(AGENTS_URI)
-    async_tbl = await db.open_table(QUEUE_NAME)
+        if len(actions) >= ACTION_CLAIM_BATCH:
+            # backlog larger than one claim; go again without waiting
+            wakeup.set()
+
+async def migrate_schemas():
+    await asyncio.to_thread(migrate_queue_schema)
+    await asyncio.to_thread(migrate_messages_schema)
+    await asyncio.to_thread(migrate_agent_steps_schema)
+    await ensure_conversation_summaries_async()
+    await ensure_workers_async()
+    await asyncio.to_thread(ensure_scalar_indexes)
+    await asyncio.to_thread(ensure_fts_indexes)
+
+async def get_db_tbl(migrate: bool = True): 
+    if migrate:
+        await migrate_schemas()
+    db = await get_async_db()
+    async_tbl = await open_async_table(QUEUE_NAME)
     return (db, async_tbl)
 
 
@@ -31,106 +65,125 @@ async def get_db_tbl():
 
 
 
-async def conversation_fanout(db, interval_s: float = 1.0):
+FANOUT_CURSOR_ID = "conversation_fanout"
+FANOUT_BATCH = 200
+FANOUT_COLUMNS = ["seq", "message_id", "conversation_id", "author_id", "role", "text", "created_at"]
+
+
+async def _next_fanout_batch(mtbl, cursor: int, batch: int):
+    """
+    Read messages strictly after `cursor` in seq order, at most `batch` rows.
+    Reads a seq window (cursor, cursor + batch] so the work per poll is bounded;
+    if the window is empty but later rows exist (a gap), jump to the next seq.
+    """
+    df = await (
+        mtbl.query()
+        .where(f"seq > {cursor} AND seq <= {cursor + batch}")
+        .select(FANOUT_COLUMNS)
+        .to_pandas()
+    )
+    if df is not None and not df.empty:
+        return df.sort_values("seq")
+    ahead = await mtbl.query().where(f"seq > {cursor + batch}").select(["seq"]).to_arrow()
+    if ahead.num_rows == 0:
+        return None
+    nxt = min(ahead["seq"].to_pylist())
+    return await _next_fanout_batch(mtbl, nxt - 1, batch)
+
+
+async def conversation_fanout(db, interval_s: float = 1.0, batch: int = FANOUT_BATCH):
     """
     Fan-out new conversation messages into agent_interrupt queue actions.
-    Keeps in-memory cursor (last_ts) and a small dedupe set with bounded size.
+    Reads messages strictly by `seq` after a cursor persisted in the cursors table,
+    so a restart resumes where it left off instead of replaying or skipping.
+    The cursor is saved after each batch is enqueued. A crash in between replays
+    the batch; each interrupt has a deterministic action_id per (message, session)
+    (queue_imp.interrupt_action_id) and the ones already queued are skipped, so
+    the queue gets each of them once. A resident session can still see one twice
+    if the crash falls between its direct delivery and the queue write.
+    The bounded dedupe set only skips messages this process already fanned out.
+    Appends made in this process wake the loop straight away (store.messages
+    append hook); `interval_s` is only the fallback poll for other writers.
+    Resident sessions are interrupted directly by agent_interrupt_actions.
     """
-    last_ts: str | None = None
     processed_ids_set: set[str] = set()
     processed_order = deque(maxlen=5000)  # cap memory
 
-    while True:
-        try:
-            mtbl = await db.open_table(MESSAGES_NAME)
-            q = mtbl.query()
-            if last_ts:
-                q = q.where(f"created_at > '{last_ts}'")
-            df = await q.to_pandas()
+    cursor = await get_cursor_async(FANOUT_CURSOR_ID)
+    if cursor is None:
+        # First run ever: start from the current tail rather than replaying history
+        cursor = await max_message_seq_async()
+        await set_cursor_async(FANOUT_CURSOR_ID, cursor)
 
-            if df is None or df.empty:
-                await asyncio.sleep(interval_s)
-                continue
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
 
-            # Bootstrap: advance cursor to latest on first run
-            if last_ts is None:
-                try:
-                    last_ts = df["created_at"].max()
-                except Exception:
-                    last_ts = str(df.iloc[-1]["created_at"])
-                await asyncio.sleep(interval_s)
-                continue
+    def _on_append(conversation_id, seq):
+        loop.call_soon_threadsafe(wakeup.set)
 
+    add_append_hook(_on_append)
+    try:
+        while True:
             try:
-                df = df.sort_values("created_at", ascending=True)
-            except Exception:
-                pass
-
-            for _, r in df.iterrows():
-                mid = str(r.get("message_id"))
-                if not mid:
-                    continue
-
-                # bounded dedupe
-                if mid in processed_ids_set:
-                    continue
-                if len(processed_order) == processed_order.maxlen:
-                    old = processed_order.popleft()
-                    processed_ids_set.discard(old)
-                processed_order.append(mid)
-                processed_ids_set.add(mid)
-
-                last_ts = str(r.get("created_at"))
-                cid = str(r.get("conversation_id"))
-                author_id = str(r.get("author_id") or "")
-                role = str(r.get("role") or "")
-                text = str(r.get("text") or "")
-
-                # Load participants for the conversation
-                ptbl = await db.open_table(PARTICIPANTS_NAME)
-                pdf = await ptbl.query().where(f"conversation_id == '{cid}'").to_pandas()
+                mtbl = await open_async_table(MESSAGES_NAME)
+                df = await _next_fanout_batch(mtbl, cursor, batch)
 
-
-                if pdf is None or pdf.empty:
+                if df is None or df.empty:
+                    await action_bus.wait_event(wakeup, interval_s)
                     continue
 
-                seen_pairs = set()  # (agent_id, session_id)
+                rosters = await ROSTER.members_for(db, df["conversation_id"].astype(str).unique())
+                targets = []   # (agent_id, session_id, guidance) for the whole batch
+                action_ids = []   # one deterministic id per target
 
-                for _, pr in pdf.iterrows():
-                    agent_id_p = str(pr.get("agent_id"))
-                    session_id_p = str(pr.get("session_id"))
-                    pair = (agent_id_p, session_id_p)
-                    if pair in seen_pairs:
+                for r in df.itertuples(index=False):
+                    mid = str(r.message_id)
+                    if not mid:
                         continue
-                    seen_pairs.add(pair)
 
-                    # Skip if the author is the same agent
-                    if author_id and author_id == agent_id_p:
+                    # bounded dedupe
+                    if mid in processed_ids_set:
                         continue
-
+                    if len(processed_order) == processed_order.maxlen:
+                        old = processed_order.popleft()
+                        processed_ids_set.discard(old)
+                    processed_order.append(mid)
+                    processed_ids_set.add(mid)
+
+                    cid = str(r.conversation_id)
+                    author_id = str(r.author_id or "")
                     guidance = {
                         "type": "new_message",
                         "message_id": mid,
+                        "seq": int(r.seq),
                         "conversation_id": cid,
                         "author_id": author_id,
-                        "role": role,
-                        "text": text,
-                        "created_at": last_ts,
+                        "role": str(r.role or ""),
+                        "text": str(r.text or ""),
+                        "created_at": str(r.created_at),
                     }
 
-                    await asyncio.to_thread(
-                        agent_interrupt_action,
-                        agent_id_p,
-                        session_id_p,
-                        "conversation",
-                        guidance
-                    )
+                    for agent_id_p, session_id_p in rosters.get(cid, []):
+                        # Skip if the author is the same agent
+                        if author_id and author_id == agent_id_p:
+                            continue
+                        targets.append((agent_id_p, session_id_p, guidance))
+                        action_ids.append(interrupt_action_id(mid, session_id_p))
 
+                if targets:
+                    # One queue insert for the whole batch instead of messages x participants rows
+                    await asyncio.to_thread(agent_interrupt_actions, targets, "conversation", action_ids)
 
-            await asyncio.sleep(interval_s)
-        except Exception as e:
-            print(f"conversation_fanout error: {e}")
-            await asyncio.sleep(interval_s)
+                cursor = int(df["seq"].max())
+                await set_cursor_async(FANOUT_CURSOR_ID, cursor)
+
+                if len(df) < batch:
+                    await action_bus.wait_event(wakeup, interval_s)
+            except Exception as e:
+                print(f"conversation_fanout error: {e}")
+                await action_bus.wait_event(wakeup, interval_s)
+    finally:
+        remove_append_hook(_on_append)
 
 
 
@@ -139,17 +192,24 @@ async def rehydrate_active_personas(db, interval_s: float = 60.0):
     """
     Rehydrate PersonaAgents for active conversations based on participants table.
     For sessions not already live, enqueue create_agent; then enqueue a rehydrate interrupt
-    carrying last_seen_iso if available from agent_state.context.
+    carrying last_seen_iso / last_seen_seq if available from agent_state.context.
     """
     # Avoid re-enqueueing during our own lifetime
     rehydrated_sessions: set[str] = set()
+    generation = 0
 
     # Late import to avoid cycles
     from agent import SESSIONS
 
     while True:
         try:
-            conv_tbl = await db.open_table(CONVERSATIONS_NAME)
+            shard_map = shards.SHARDS
+            if shard_map is not None and shard_map.generation != generation:
+                # Ownership moved: sessions we gained need rehydrating even if seen before
+                generation = shard_map.generation
+                rehydrated_sessions.clear()
+
+            conv_tbl = await open_async_table(CONVERSATIONS_NAME)
             cdf = await conv_tbl.query().where("status == 'active'").to_pandas()
 
             if cdf is None or cdf.empty:
@@ -157,7 +217,7 @@ async def rehydrate_active_personas(db, interval_s: float = 60.0):
                 continue
 
             # For each active conversation, fetch participants
-            part_tbl = await db.open_table(PARTICIPANTS_NAME)
+            part_tbl = await open_async_table(PARTICIPANTS_NAME)
             for _, c in cdf.iterrows():
                 cid = str(c.get("conversation_id"))
                 pdf = await part_tbl.query().where(f"conversation_id == '{cid}'").to_pandas()
@@ -171,6 +231,8 @@ async def rehydrate_active_personas(db, interval_s: float = 60.0):
                         continue
                     if session_id in SESSIONS or session_id in rehydrated_sessions:
                         continue
+                    if shard_map is not None and not shard_map.owns(session_id):
+                        continue
 
                     # persona_config is JSON string in participants table; load it if present
                     persona_config_raw = pr.get("persona_config")
@@ -196,15 +258,18 @@ async def rehydrate_active_personas(db, interval_s: float = 60.0):
 
                     # Fetch stored state to get last_seen_iso (if any) to avoid replay
                     try:
-                        st = await asyncio.to_thread(get_agent_state, agent_id, session_id)
+                        st = await get_agent_state_async(agent_id, session_id)
                         ctx = (st or {}).get("context") or {}
                         last_seen_iso = ctx.get("last_seen_iso")
+                        last_seen_seq = ctx.get("last_seen_seq")
                     except Exception:
-                        last_seen_iso = None
+                        last_seen_iso = last_seen_seq = None
 
                     guidance = {"type": "rehydrate"}
                     if last_seen_iso:
                         guidance["last_seen_iso"] = last_seen_iso
+                    if last_seen_seq is not None:
+                        guidance["last_seen_seq"] = last_seen_seq
 
                     # Enqueue a rehydrate interrupt
                     await asyncio.to_thread(
@@ -225,15 +290,194 @@ async def rehydrate_active_personas(db, interval_s: float = 60.0):
 
 
 
+async def maintenance_loop(interval_s: float = MAINTENANCE_INTERVAL_S):
+    """
+    Periodically compact fragments, prune old versions and archive processed queue rows.
+    Uses the async table API so optimize() runs off the event loop and doesn't stall agent ticks.
+    """
+    while True:
+        await asyncio.sleep(interval_s)
+        try:
+            await run_maintenance_async()
+        except Exception as e:
+            print(f"maintenance_loop error: {e}")
+
+
+
 async def main():
+    import agent
+    # Lets request threads hand interrupts straight to resident sessions
+    agent.AGENT_LOOP = asyncio.get_running_loop()
     (db, async_tbl) = await get_db_tbl()
 
     await asyncio.gather(
         queue_watcher(db, async_tbl),
         conversation_fanout(db),         # Phase 4
         rehydrate_active_personas(db),   # Phase 5
+        maintenance_loop(),
+        embedding_indexer_loop(),        # no-op unless SEARCH_EMBEDDING_MODEL is set
+        STATE_CACHE.run(),               # write-behind agent_state flusher
+        STEP_WRITER.run(),               # batched agent_steps appends
         # ...other background tasks
     )
 
+
+
+# --------------------
+# Sharded runtime: a supervisor plus N worker processes (see shards.py)
+# --------------------
+
+AGENT_WORKERS = int(os.getenv("AGENT_WORKERS", "1"))
+WORKER_RESTART_DELAY_S = 2.0
+
+
+async def refresh_membership(shard_map, started_at: str, peers=(), grace_until: float = 0.0) -> bool:
+    """
+    Heartbeat, then recompute bucket ownership from the live workers. Until
+    `grace_until` (loop time) the expected `peers` count as live, so the first
+    worker up doesn't take every bucket only to hand them back a moment later.
+    """
+    await heartbeat_async(shard_map.worker_id, host=socket.gethostname(), pid=os.getpid(), started_at=started_at)
+    members = {w["worker_id"] for w in await list_live_workers_async(shards.WORKER_TTL_S)}
+    if asyncio.get_running_loop().time() < grace_until:
+        members.update(peers)
+    gained, lost = shard_map.update(members)
+    if not (gained or lost):
+        return False
+    print(f"{shard_map.worker_id}: owns {len(shard_map.owned)} bucket(s) of {len(shard_map.members)} worker(s) (+{len(gained)} -{len(lost)})")
+    if lost:
+        import agent
+        await agent.handoff_sessions(shard_map)
+    if gained:
+        # Rows for the new buckets may already be waiting
+        action_bus.notify_action()
+    return True
+
+
+async def shard_membership_loop(shard_map, started_at: str, peers=(), grace_until: float = 0.0, supervisor_pid: int | None = None, on_orphaned=None, interval_s: float = shards.WORKER_HEARTBEAT_S):
+    while True:
+        await asyncio.sleep(interval_s)
+        if supervisor_pid is not None and os.getppid() != supervisor_pid:
+            # Supervisor is gone (killed without terminating us); don't linger as an orphan
+            print(f"{shard_map.worker_id}: supervisor exited; shutting down")
+            if on_orphaned is not None:
+                on_orphaned()
+            return
+        try:
+            await refresh_membership(shard_map, started_at, peers, grace_until)
+        except Exception as e:
+            print(f"shard_membership_loop error: {e}")
+
+
+def _cancel_on_sigterm():
+    # Signal handlers can only be installed from the main thread (not under app.py)
+    if threading.current_thread() is threading.main_thread():
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+
+
+async def worker_main(worker_id: str, index: int = 0, peers=(), supervisor_pid: int | None = None):
+    """
+    One shard worker: runs the sessions whose buckets it owns. Queue claims are
+    filtered to those buckets (ShardMap.claim_filter); conversation fan-out and
+    maintenance run once, in the supervisor.
+    """
+    import agent
+    loop = asyncio.get_running_loop()
+    agent.AGENT_LOOP = loop
+    _cancel_on_sigterm()
+
+    shard_map = shards.ShardMap(worker_id)
+    shards.SHARDS = shard_map
+    (db, async_tbl) = await get_db_tbl(migrate=False)
+
+    started_at = datetime.now(timezone.utc).isoformat()
+    grace_until = loop.time() + shards.WORKER_TTL_S
+    await refresh_membership(shard_map, started_at, peers, grace_until)
+    try:
+        await asyncio.gather(
+            queue_watcher(db, async_tbl, listener_index=index),
+            rehydrate_active_personas(db),
+            shard_membership_loop(shard_map, started_at, peers, grace_until, supervisor_pid, on_orphaned=asyncio.current_task().cancel),
+            STATE_CACHE.run(),
+            STEP_WRITER.run(),
+        )
+    finally:
+        # Leave now rather than after WORKER_TTL_S so the others pick up our buckets,
+        # and hand our sessions over if anyone is left to take them
+        try:
+            await remove_worker_async(worker_id)
+            others = await list_live_workers_async(shards.WORKER_TTL_S)
+            if others:
+                shard_map.release()
+                await agent.handoff_sessions(shard_map)
+        except Exception as e:
+            print(f"{worker_id}: shutdown handoff failed: {e}")
+
+
+def run_worker(worker_id: str, index: int = 0, peers=(), supervisor_pid: int | None = None):
+    """Process entry point for one shard worker (started by supervisor_main)."""
+    try:
+        asyncio.run(worker_main(worker_id, index, peers, supervisor_pid))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+
+async def supervisor_main(workers: int = AGENT_WORKERS):
+    """
+    Start `workers` shard worker processes and run the process-wide singletons
+    (conversation fan-out, maintenance) here. A worker that dies is restarted
+    under the same worker_id, so it gets the same buckets back.
+    """
+    _cancel_on_sigterm()
+    await migrate_schemas()   # once, before any worker opens the tables
+
+    # Producers in this process (fan-out, Flask routes) have to wake every worker
+    action_bus.ACTION_BUS_BACKEND = os.environ["ACTION_BUS_BACKEND"] = "udp"
+    action_bus.ACTION_BUS_LISTENERS = workers
+    os.environ["ACTION_BUS_LISTENERS"] = str(workers)
+
+    ctx = multiprocessing.get_context("spawn")
+    ids = [f"worker-{i}" for i in range(workers)]
+    procs = {}
+
+    def _start(i):
+        p = ctx.Process(target=run_worker, args=(ids[i], i, ids, os.getpid()), name=ids[i], daemon=True)
+        p.start()
+        procs[i] = p
+        print(f"supervisor: started {ids[i]} (pid {p.pid})")
+
+    async def _watch():
+        for i in range(workers):
+            _start(i)
+        while True:
+            await asyncio.sleep(WORKER_RESTART_DELAY_S)
+            for i, p in list(procs.items()):
+                if not p.is_alive():
+                    print(f"supervisor: {ids[i]} exited ({p.exitcode}); restarting")
+                    _start(i)
+
+    (db, _) = await get_db_tbl(migrate=False)
+    try:
+        await asyncio.gather(
+            _watch(),
+            conversation_fanout(db),
+            maintenance_loop(),
+            embedding_indexer_loop(),
+        )
+    finally:
+        for p in procs.values():
+            p.terminate()
+        for p in procs.values():
+            await asyncio.to_thread(p.join, 10)
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    import argparse
+    parser = argparse.ArgumentParser(description="Run the agent runtime")
+    parser.add_argument("--workers", type=int, default=AGENT_WORKERS,
+                        help="shard worker processes; 1 runs everything in this process (default: AGENT_WORKERS or 1)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(supervisor_main(args.workers) if args.workers > 1 else main())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
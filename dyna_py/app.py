@@ -8,8 +8,9 @@ from flask_socketio import SocketIO, emit, join_room, leave_room
 import threading, asyncio, time
 from flask import request
 
-from ws_bus import init as ws_init, room_for_run
-from store.sessions import get_last_step_for_session_id
+from ws_bus import init as ws_init, room_for_run, watch_run
+from store.run_stream import replay_run, run_snapshot
+import conversation_bus
 import agents  # your asyncio agent runner (agents.main, etc.)
 
 def configure_ws(socketio: SocketIO):    
@@ -43,22 +44,33 @@ def create_app_and_socket():
         if not run_id:
             emit("error", {"error": "missing run_id"})
             return
+        since_seq = (data or {}).get("since_seq")
+        try:
+            since_seq = int(since_seq) if since_seq is not None else None
+        except (TypeError, ValueError):
+            emit("error", {"error": "since_seq must be an integer"})
+            return
         join_room(room_for_run(run_id))
-        # Send an immediate snapshot if we can figure out session_id
+        # Resuming (since_seq): replay the steps the client missed; otherwise send the latest one.
+        # Replay and live updates may overlap: clients drop deltas with seq <= the last applied.
         try:
-            # run_id is "agent_id::session_id" per your Svelte code
-            parts = run_id.split("::", 1)
-            session_id = parts[1] if len(parts) == 2 else None
-            last_text = ""
-            if session_id:
-                last_text = get_last_step_for_session_id(session_id=session_id) or ""
-            emit("run_update", {
+            if since_seq is not None:
+                replay = replay_run(run_id, since_seq)
+                emit("run_replay", replay)
+                watch_run(run_id, replay["last_seq"])
+                return
+            snapshot = run_snapshot(run_id) or {
                 "run_id": run_id,
-                "last_text": last_text,
+                "seq": 0,
+                "last_text": "",
                 "timestamp": int(time.time() * 1000),
-            })
+            }
+            emit("run_update", snapshot)
+            watch_run(run_id, snapshot["seq"])
         except Exception as e:
-            print(f"subscribe_run snapshot error: {e}")
+            print(f"subscribe_run replay error: {e}")
+            # Subscribed, but without the replay/snapshot: the client should resubscribe
+            emit("error", {"error": f"could not load run {run_id}: {e}", "run_id": run_id})
 
     @socketio.on("unsubscribe_run")
     def on_unsubscribe_run(data):
@@ -67,6 +79,34 @@ def create_app_and_socket():
             return
         leave_room(room_for_run(run_id))
 
+    # Socket.IO: new messages of a conversation (see conversation_bus)
+    conversation_bus.init(socketio)
+
+    @socketio.on("subscribe_conversation")
+    def on_subscribe_conversation(data):
+        conversation_id = (data or {}).get("conversation_id") or ""
+        if not conversation_id:
+            emit("error", {"error": "missing conversation_id"})
+            return
+        since_seq = (data or {}).get("since_seq")
+        try:
+            since_seq = int(since_seq) if since_seq is not None else None
+        except (TypeError, ValueError):
+            emit("error", {"error": "since_seq must be an integer"})
+            return
+        join_room(conversation_bus.room_for_conversation(conversation_id))
+        try:
+            emit("conversation_messages", conversation_bus.subscribe(conversation_id, since_seq))
+        except Exception as e:
+            print(f"subscribe_conversation replay error: {e}")
+
+    @socketio.on("unsubscribe_conversation")
+    def on_unsubscribe_conversation(data):
+        conversation_id = (data or {}).get("conversation_id") or ""
+        if not conversation_id:
+            return
+        leave_room(conversation_bus.room_for_conversation(conversation_id))
+
     configure_http(app)
     configure_ws(socketio=socketio)
     return app, socketio
@@ -74,9 +114,13 @@ def create_app_and_socket():
 def start_background_agents():
 # Run your asyncio agents loop in a dedicated thread
 # agents.main() is async, so run it in its own event loop.
+# AGENT_WORKERS > 1: this thread supervises shard worker processes instead (agents.supervisor_main)
     def runner():
         try:
-            asyncio.run(agents.main())
+            if agents.AGENT_WORKERS > 1:
+                asyncio.run(agents.supervisor_main(agents.AGENT_WORKERS))
+            else:
+                asyncio.run(agents.main())
         except Exception as e:
             print(f"Agents main exited: {e}")
     t = threading.Thread(target=runner, daemon=True)
@@ -0,0 +1,215 @@
+# asgi_app.py
+"""
+ASGI entry point: the same HTTP routes (routes.api_map.MAP_HTTP_FUNCS) and
+Socket.IO events (request_response / MAP_WS_FUNCS, subscribe_run,
+subscribe_conversation) as app.py, on one event loop.
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000      (or: python asgi_app.py)
+
+app.py runs Flask-SocketIO in threading mode: every request holds a thread
+while it blocks on LanceDB, and the agent runtime has a thread of its own.
+Here HTTP handlers are the async ones from routes.asgi_endpoints, Socket.IO is
+python-socketio's AsyncServer on native websockets, and the run / conversation
+pumps (ws_bus, conversation_bus) and the agent runtime (agents.main, or the
+shard supervisor when AGENT_WORKERS > 1) are tasks on the server's loop. Run
+it with a single uvicorn worker: the agent runtime must only be started once.
+
+Routes without an async handler are served through their Flask view in a
+worker thread, so everything added to MAP_HTTP_FUNCS is reachable here too.
+"""
+import asyncio
+import contextlib
+import inspect
+import re
+import time
+
+import flask
+import socketio
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
+
+import agents
+import conversation_bus
+from ws_bus import init as ws_init, room_for_run, watch_run
+from routes.api_map import MAP_HTTP_FUNCS, MAP_WS_FUNCS
+from routes.asgi_endpoints import ASYNC_HTTP_FUNCS
+from store.run_stream import replay_run_async, run_snapshot_async
+
+CORS_ORIGINS = ["http://localhost:5173", "http://127.0.0.1:5173"]
+
+sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins=CORS_ORIGINS)
+
+# Flask views not ported to routes.asgi_endpoints run under this app's request context
+_flask_app = flask.Flask(__name__)
+_FLASK_CONVERTERS = {"path": "path", "int": "int", "float": "float"}
+
+
+def _starlette_path(path: str) -> str:
+    # '/plugins/<path:subpath>' -> '/plugins/{subpath:path}'
+    def convert(m):
+        converter = _FLASK_CONVERTERS.get(m.group(1) or "")
+        return "{%s%s}" % (m.group(2), f":{converter}" if converter else "")
+    return re.sub(r"<(?:(\w+):)?(\w+)>", convert, path)
+
+
+def _flask_endpoint(view):
+    async def endpoint(request: Request):
+        body = await request.body()
+
+        def call():
+            environ = EnvironBuilder(
+                path=request.url.path,
+                method=request.method,
+                query_string=request.url.query,
+                headers=list(request.headers.items()),
+                data=body,
+            ).get_environ()
+            with _flask_app.request_context(environ):
+                try:
+                    rv = _flask_app.make_response(view(**request.path_params))
+                except HTTPException as e:
+                    rv = e.get_response()
+                return rv.status_code, rv.headers, rv.get_data()
+
+        status, headers, content = await asyncio.to_thread(call)
+        return Response(content, status_code=status,
+            headers={k: v for k, v in headers.items() if k.lower() != "content-length"})
+    return endpoint
+
+
+def build_routes() -> list:
+    routes = []
+    for http_func in MAP_HTTP_FUNCS:
+        path, func, *rest = http_func
+        handler = ASYNC_HTTP_FUNCS.get(path) or _flask_endpoint(func)
+        routes.append(Route(_starlette_path(path), handler, methods=rest[0] if rest else ["GET"]))
+    return routes
+
+
+# --------------------
+# Socket.IO
+# --------------------
+
+@sio.on("request_response")
+async def on_request_response(sid, data):
+    real_request = (data or {}).get('realRequest')
+    if real_request not in MAP_WS_FUNCS:
+        await sio.emit('response', {'error': 'Unknown ws request: ' + str(real_request)}, to=sid)
+        return
+    try:
+        result = MAP_WS_FUNCS[real_request](data=data, socketio=sio, sid=sid)
+        if inspect.isawaitable(result):
+            await result
+    except Exception as e:
+        await sio.emit('response', {'error': str(e)}, to=sid)
+
+
+@sio.on("subscribe_run")
+async def on_subscribe_run(sid, data):
+    run_id = (data or {}).get("run_id") or ""
+    if not run_id:
+        await sio.emit("error", {"error": "missing run_id"}, to=sid)
+        return
+    since_seq = (data or {}).get("since_seq")
+    try:
+        since_seq = int(since_seq) if since_seq is not None else None
+    except (TypeError, ValueError):
+        await sio.emit("error", {"error": "since_seq must be an integer"}, to=sid)
+        return
+    await sio.enter_room(sid, room_for_run(run_id))
+    # Same protocol as app.py: since_seq -> run_replay, otherwise the latest delta
+    try:
+        if since_seq is not None:
+            replay = await replay_run_async(run_id, since_seq)
+            await sio.emit("run_replay", replay, to=sid)
+            watch_run(run_id, replay["last_seq"])
+            return
+        snapshot = await run_snapshot_async(run_id) or {
+            "run_id": run_id,
+            "seq": 0,
+            "last_text": "",
+            "timestamp": int(time.time() * 1000),
+        }
+        await sio.emit("run_update", snapshot, to=sid)
+        watch_run(run_id, snapshot["seq"])
+    except Exception as e:
+        print(f"subscribe_run replay error: {e}")
+        await sio.emit("error", {"error": f"could not load run {run_id}: {e}", "run_id": run_id}, to=sid)
+
+
+@sio.on("unsubscribe_run")
+async def on_unsubscribe_run(sid, data):
+    run_id = (data or {}).get("run_id") or ""
+    if run_id:
+        await sio.leave_room(sid, room_for_run(run_id))
+
+
+@sio.on("subscribe_conversation")
+async def on_subscribe_conversation(sid, data):
+    conversation_id = (data or {}).get("conversation_id") or ""
+    if not conversation_id:
+        await sio.emit("error", {"error": "missing conversation_id"}, to=sid)
+        return
+    since_seq = (data or {}).get("since_seq")
+    try:
+        since_seq = int(since_seq) if since_seq is not None else None
+    except (TypeError, ValueError):
+        await sio.emit("error", {"error": "since_seq must be an integer"}, to=sid)
+        return
+    await sio.enter_room(sid, conversation_bus.room_for_conversation(conversation_id))
+    try:
+        await sio.emit("conversation_messages", await conversation_bus.subscribe_async(conversation_id, since_seq), to=sid)
+    except Exception as e:
+        print(f"subscribe_conversation replay error: {e}")
+
+
+@sio.on("unsubscribe_conversation")
+async def on_unsubscribe_conversation(sid, data):
+    conversation_id = (data or {}).get("conversation_id") or ""
+    if conversation_id:
+        await sio.leave_room(sid, conversation_bus.room_for_conversation(conversation_id))
+
+
+# --------------------
+# App
+# --------------------
+
+def _report_exit(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Agents main exited: {task.exception()}")
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_app):
+    ws_init(sio)
+    conversation_bus.init(sio)
+    if agents.AGENT_WORKERS > 1:
+        runtime = asyncio.create_task(agents.supervisor_main(agents.AGENT_WORKERS))
+    else:
+        runtime = asyncio.create_task(agents.main())
+    runtime.add_done_callback(_report_exit)
+    try:
+        yield
+    finally:
+        runtime.cancel()
+        with contextlib.suppress(asyncio.CancelledError, Exception):
+            await runtime
+
+
+http_app = Starlette(
+    routes=build_routes(),
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+    lifespan=lifespan,
+)
+app = socketio.ASGIApp(sio, other_asgi_app=http_app)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=5000)
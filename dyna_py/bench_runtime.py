@@ -0,0 +1,291 @@
+"""
+Agent runtime benchmark.
+
+Spins up N JokeAgent sessions whose LLM call is replaced by a fixed sleep,
+wired to the same state/steps persistence path agents.main uses (write-behind
+state cache, batched step writer), against a throwaway LanceDB directory.
+
+Reports, per run, as JSON:
+- ticks/sec and p50/p99 tick latency (do_tick start -> state update returned)
+- event-loop lag (p50/p99/max overshoot of a 50ms probe sleep)
+- default threadpool queue depth (p50/max, sampled)
+- bytes written per table
+
+    python bench_runtime.py --sessions 1000 10000 --duration 30 --out bench.json
+
+AGENTS_URI is pointed at a temp directory before any store module is imported,
+so this never touches a real database.
+"""
+import argparse
+import asyncio
+import contextlib
+import functools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+PROBE_INTERVAL_S = 0.05
+
+
+def _percentile(values: list[float], p: float) -> float | None:
+    if not values:
+        return None
+    s = sorted(values)
+    k = min(len(s) - 1, max(0, int(round(p / 100.0 * (len(s) - 1)))))
+    return s[k]
+
+
+def _dir_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return total
+
+
+def _table_bytes(uri: str) -> dict[str, int]:
+    out = {}
+    if not os.path.isdir(uri):
+        return out
+    for name in sorted(os.listdir(uri)):
+        if name.endswith(".lance"):
+            out[name[: -len(".lance")]] = _dir_bytes(os.path.join(uri, name))
+    return out
+
+
+def _make_bench_agent_class():
+    # Late import: agent modules read AGENTS_URI at import time
+    from joke_agent import JokeAgent
+    from agent_loop import StepOutcome
+
+    class BenchJokeAgent(JokeAgent):
+        """JokeAgent with the LLM call replaced by a fixed sleep."""
+
+        def __init__(self, *args, llm_latency_s: float = 0.05, tick_latencies: list | None = None, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.llm_latency_s = llm_latency_s
+            self.tick_latencies = tick_latencies if tick_latencies is not None else []
+            self._tick_started: float | None = None
+
+        async def do_tick(self, step: int) -> StepOutcome:
+            self._tick_started = time.perf_counter()
+            await asyncio.sleep(self.llm_latency_s)
+            return StepOutcome(
+                status="ok",
+                text=f"bench joke {step} about {self.current_subject}",
+                state={"subject": self.current_subject, "paused": self._paused_flag()},
+            )
+
+        async def _state_update(self, status=None, iteration=None, result=None, context=None, history=None):
+            await super()._state_update(status=status, iteration=iteration, result=result, context=context, history=history)
+            # The per-tick state update is the last thing a tick does
+            if status == "running" and self._tick_started is not None:
+                self.tick_latencies.append((time.perf_counter() - self._tick_started) * 1000.0)
+                self._tick_started = None
+
+    return BenchJokeAgent
+
+
+async def _probe_loop_lag(samples: list[float], stop: asyncio.Event):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        t0 = loop.time()
+        await asyncio.sleep(PROBE_INTERVAL_S)
+        samples.append(max(0.0, (loop.time() - t0 - PROBE_INTERVAL_S) * 1000.0))
+
+
+async def _probe_threadpool(executor: ThreadPoolExecutor, samples: list[int], stop: asyncio.Event):
+    while not stop.is_set():
+        samples.append(executor._work_queue.qsize())
+        await asyncio.sleep(PROBE_INTERVAL_S)
+
+
+async def run_once(
+    sessions: int,
+    *,
+    duration_s: float,
+    loop_interval: float,
+    llm_latency_s: float,
+    interrupts_per_s: float,
+    max_workers: int | None,
+) -> dict:
+    from agent import upsert_state_async
+    from store.steps_async import append_step_async
+    from store.state_cache import STATE_CACHE
+    from store.step_writer import STEP_WRITER
+
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bench")
+    loop.set_default_executor(executor)
+
+    BenchJokeAgent = _make_bench_agent_class()
+    uri = os.environ["AGENTS_URI"]
+    bytes_before = _table_bytes(uri)
+
+    stop = asyncio.Event()
+    lag_samples: list[float] = []
+    pool_samples: list[int] = []
+    tick_latencies: list[float] = []
+
+    background = [
+        asyncio.create_task(STATE_CACHE.run()),
+        asyncio.create_task(STEP_WRITER.run()),
+        asyncio.create_task(_probe_loop_lag(lag_samples, stop)),
+        asyncio.create_task(_probe_threadpool(executor, pool_samples, stop)),
+    ]
+    await asyncio.sleep(0)
+
+    agents = []
+    for i in range(sessions):
+        agent_id = f"bench-agent-{i}"
+        session_id = f"bench-session-{i}"
+        agents.append(BenchJokeAgent(
+            agent_id,
+            session_id,
+            state_updater=functools.partial(upsert_state_async, session_id=session_id),
+            steps_appender=functools.partial(append_step_async, agent_id, session_id=session_id),
+            loop_interval=loop_interval,
+            llm_latency_s=llm_latency_s,
+            tick_latencies=tick_latencies,
+        ))
+
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(a.run()) for a in agents]
+
+    interrupts_sent = 0
+    if interrupts_per_s > 0:
+        gap = 1.0 / interrupts_per_s
+        deadline = started + duration_s
+        while time.perf_counter() < deadline:
+            await agents[interrupts_sent % sessions].interrupt({"subject": f"topic {interrupts_sent}"})
+            interrupts_sent += 1
+            await asyncio.sleep(gap)
+    else:
+        await asyncio.sleep(duration_s)
+
+    measured_s = time.perf_counter() - started
+    ticks = len(tick_latencies)
+    latencies = list(tick_latencies)
+
+    for a in agents:
+        a.request_stop()
+        a._tick_event.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    stop.set()
+    for t in background:
+        t.cancel()
+    # Writers drain on cancel; wait so the byte counts include everything
+    await asyncio.gather(*background, return_exceptions=True)
+    executor.shutdown(wait=True)
+
+    bytes_after = _table_bytes(uri)
+    return {
+        "sessions": sessions,
+        "duration_s": round(measured_s, 3),
+        "loop_interval_s": loop_interval,
+        "llm_latency_s": llm_latency_s,
+        "interrupts_sent": interrupts_sent,
+        "ticks": ticks,
+        "ticks_per_s": round(ticks / measured_s, 2) if measured_s > 0 else None,
+        "tick_latency_ms": {
+            "p50": _percentile(latencies, 50),
+            "p99": _percentile(latencies, 99),
+            "max": max(latencies) if latencies else None,
+        },
+        "loop_lag_ms": {
+            "p50": _percentile(lag_samples, 50),
+            "p99": _percentile(lag_samples, 99),
+            "max": max(lag_samples) if lag_samples else None,
+        },
+        "threadpool_queue_depth": {
+            "p50": _percentile(pool_samples, 50),
+            "max": max(pool_samples) if pool_samples else None,
+        },
+        "bytes_written": {
+            name: bytes_after.get(name, 0) - bytes_before.get(name, 0)
+            for name in sorted(set(bytes_before) | set(bytes_after))
+        },
+    }
+
+
+def _fresh_db(uri: str):
+    # uri is always a directory this script created (see main), never one it was given
+    shutil.rmtree(uri, ignore_errors=True)
+    os.makedirs(uri, exist_ok=True)
+    from store import schemas
+    schemas.create_all_schemas()
+    schemas.create_agents_config_schema()
+    schemas.create_conversation_schemas()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark LoopingAgentBase sessions against a temp LanceDB")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1000])
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per run")
+    parser.add_argument("--loop-interval", type=float, default=1.5, help="agent fallback tick interval (s)")
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0, help="stubbed LLM call duration")
+    parser.add_argument("--interrupts-per-s", type=float, default=0.0)
+    parser.add_argument("--max-workers", type=int, default=None, help="default threadpool size")
+    parser.add_argument("--db-dir", default=None,
+                        help="new or empty directory to keep the LanceDB in (default: a temp dir, removed after)")
+    parser.add_argument("--out", default=None, help="write JSON results here instead of stdout")
+    parser.add_argument("--verbose", action="store_true", help="keep agent/store prints")
+    args = parser.parse_args(argv)
+
+    tmp = None
+    if args.db_dir:
+        root = os.path.abspath(args.db_dir)
+        if os.path.exists(root) and (not os.path.isdir(root) or os.listdir(root)):
+            parser.error(f"--db-dir {args.db_dir} is not empty; give a new or empty directory")
+        uri = os.path.join(root, "db")
+    else:
+        tmp = tempfile.mkdtemp(prefix="dyna-bench-")
+        uri = os.path.join(tmp, "db")
+    os.environ["AGENTS_URI"] = uri
+
+    results = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "runs": [],
+    }
+    out = sys.stdout
+    try:
+        for n in args.sessions:
+            _fresh_db(uri)
+            with contextlib.ExitStack() as quiet:
+                if not args.verbose:
+                    quiet.enter_context(contextlib.redirect_stdout(quiet.enter_context(open(os.devnull, "w"))))
+                run = asyncio.run(run_once(
+                    n,
+                    duration_s=args.duration,
+                    loop_interval=args.loop_interval,
+                    llm_latency_s=args.llm_latency_ms / 1000.0,
+                    interrupts_per_s=args.interrupts_per_s,
+                    max_workers=args.max_workers,
+                ))
+            results["runs"].append(run)
+            print(f"sessions={n} ticks/s={run['ticks_per_s']} p99={run['tick_latency_ms']['p99']}ms "
+                  f"lag p99={run['loop_lag_ms']['p99']}ms", file=sys.stderr)
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text, file=out)
+
+
+if __name__ == "__main__":
+    main()
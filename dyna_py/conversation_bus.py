@@ -0,0 +1,212 @@
+"""
+New messages for Socket.IO clients watching a conversation (room conv::<conversation_id>).
+
+Chat windows used to poll /api/conversation-messages for new replies, reading
+the whole page again each time. A client now sends subscribe_conversation
+({"conversation_id", "since_seq"?}) and receives "conversation_messages"
+events:
+
+    {"conversation_id", "messages": [...], "last_seq", "has_more"?}
+
+- on subscribe, the messages after since_seq (at most CONVERSATION_REPLAY_MAX;
+  has_more says to resubscribe from last_seq for the rest); without since_seq
+  just the conversation's current last_seq, to use as the cursor
+- afterwards, batches of new messages as they are written, once per frame per
+  conversation whatever the number of watchers
+
+Each watched conversation has one cursor (the last seq pushed to its room).
+append_message in this process marks the conversation (store.messages append
+hook), and the pump sends what lies past the cursor within CONVERSATION_FRAME_S.
+Messages written by other processes (sharded agent workers) are picked up by a
+sweep of every watched conversation each CONVERSATION_SWEEP_S. Either way a
+conversation costs one `seq > cursor` read per frame. Under the ASGI server
+(asgi_app.py) the reads go through MESSAGE_CACHE, shared with the personas on
+the same loop; the threaded server reads the store, since the cache's windows
+belong to the agent thread's loop.
+
+Replay and pushes may overlap around a subscribe: clients drop messages with a
+seq they already hold.
+"""
+import asyncio
+import os
+import threading
+import time
+
+from ws_bus import has_subscribers, is_async
+from store.db import run_sync
+from store.messages import add_append_hook, page_messages_async, latest_message_async, list_messages_after_seq_async
+from store.message_cache import MESSAGE_CACHE
+from store.conversations import message_payload, MESSAGE_PAGE_COLUMNS
+
+CONVERSATION_FRAME_S = float(os.getenv("CONVERSATION_FRAME_S", "0.2"))
+CONVERSATION_SWEEP_S = float(os.getenv("CONVERSATION_SWEEP_S", "2.0"))
+CONVERSATION_BATCH_MAX = int(os.getenv("CONVERSATION_BATCH_MAX", "100"))
+CONVERSATION_REPLAY_MAX = int(os.getenv("CONVERSATION_REPLAY_MAX", "500"))
+
+socketio = None
+_lock = threading.Lock()
+_cursors: dict = {}     # conversation_id -> last seq pushed to its room (watched conversations only)
+_dirty: set = set()     # watched conversations with messages past their cursor
+_last_sweep = 0.0
+_pump_started = False
+
+
+def room_for_conversation(conversation_id: str) -> str:
+    return f"conv::{conversation_id}"
+
+
+def init(sio):
+    global socketio, _pump_started
+    socketio = sio
+    if sio is not None and not _pump_started:
+        _pump_started = True
+        sio.start_background_task(_pump_async if is_async(sio) else _pump)
+
+
+def note_message(conversation_id: str, seq):
+    # store.messages append hook: O(1), called on the store loop
+    with _lock:
+        if conversation_id in _cursors:
+            _dirty.add(conversation_id)
+
+
+add_append_hook(note_message)
+
+
+async def _latest_seq(conversation_id: str) -> int:
+    latest = await latest_message_async(conversation_id)
+    return int(latest["seq"]) if latest else 0
+
+
+async def subscribe_async(conversation_id: str, since_seq: int | None) -> dict:
+    """Start pushing to the conversation's room; the reply for the subscriber (see module doc)."""
+    with _lock:
+        watched = conversation_id in _cursors
+    if not watched:
+        # Pushes start after the current tail; anything older is the replay's job
+        cursor = await _latest_seq(conversation_id)
+        with _lock:
+            _cursors.setdefault(conversation_id, cursor)
+    if since_seq is None:
+        return {"conversation_id": conversation_id, "messages": [], "last_seq": await _latest_seq(conversation_id)}
+    rows, has_more = await page_messages_async(
+        conversation_id,
+        after_seq=max(0, int(since_seq)),
+        limit=CONVERSATION_REPLAY_MAX,
+        columns=MESSAGE_PAGE_COLUMNS,
+    )
+    return {
+        "conversation_id": conversation_id,
+        "messages": [message_payload(r) for r in rows],
+        "last_seq": rows[-1]["seq"] if rows else int(since_seq),
+        "has_more": has_more,
+    }
+
+
+def subscribe(conversation_id: str, since_seq: int | None = None) -> dict:
+    return run_sync(subscribe_async(conversation_id, since_seq))
+
+
+def _take_targets(sweep: bool) -> dict:
+    with _lock:
+        # Forget conversations nobody watches any more
+        for cid in [c for c in _cursors if not has_subscribers(room_for_conversation(c))]:
+            _cursors.pop(cid, None)
+            _dirty.discard(cid)
+        targets = list(_cursors) if sweep else [c for c in _dirty if c in _cursors]
+        _dirty.clear()
+        return {cid: _cursors[cid] for cid in targets}
+
+
+async def _collect(targets: dict, fresh: bool, cached: bool) -> dict:
+    async def one(cid, cursor):
+        if cached:
+            return cid, await MESSAGE_CACHE.since(cid, after_seq=cursor, limit=CONVERSATION_BATCH_MAX, fresh=fresh)
+        return cid, await list_messages_after_seq_async(cid, cursor, CONVERSATION_BATCH_MAX)
+    results = await asyncio.gather(*(one(c, s) for c, s in targets.items()), return_exceptions=True)
+    out = {}
+    for res in results:
+        if isinstance(res, Exception):
+            print(f"conversation push read failed: {res}")
+            continue
+        cid, rows = res
+        out[cid] = rows
+    return out
+
+
+def _advance(targets: dict, collected: dict) -> list:
+    """Move the cursors past the collected rows; the (conversation_id, payload) pairs to push."""
+    out = []
+    for cid, rows in collected.items():
+        if not rows:
+            continue
+        last_seq = int(rows[-1]["seq"])
+        with _lock:
+            if cid not in _cursors or _cursors[cid] != targets[cid]:
+                continue   # unwatched (or another flush moved it) meanwhile
+            _cursors[cid] = last_seq
+            if len(rows) >= CONVERSATION_BATCH_MAX:
+                _dirty.add(cid)   # more to send next frame
+        out.append((cid, {
+            "conversation_id": cid,
+            "messages": [message_payload(r) for r in rows],
+            "last_seq": last_seq,
+        }))
+    return out
+
+
+def flush(sweep: bool = False) -> int:
+    """Push one frame now. Returns the number of conversations pushed to."""
+    targets = _take_targets(sweep)
+    if not targets:
+        return 0
+    sent = 0
+    for cid, payload in _advance(targets, run_sync(_collect(targets, fresh=sweep, cached=False))):
+        try:
+            socketio.emit("conversation_messages", payload, to=room_for_conversation(cid))
+            sent += 1
+        except Exception as e:
+            print(f"conversation push error for {cid}: {e}")
+    return sent
+
+
+async def flush_async(sweep: bool = False) -> int:
+    """flush() for an AsyncServer (reads on the server's own loop)."""
+    targets = _take_targets(sweep)
+    if not targets:
+        return 0
+    sent = 0
+    for cid, payload in _advance(targets, await _collect(targets, fresh=sweep, cached=True)):
+        try:
+            await socketio.emit("conversation_messages", payload, to=room_for_conversation(cid))
+            sent += 1
+        except Exception as e:
+            print(f"conversation push error for {cid}: {e}")
+    return sent
+
+
+def _sweep_due() -> bool:
+    global _last_sweep
+    now = time.monotonic()
+    if now - _last_sweep < CONVERSATION_SWEEP_S:
+        return False
+    _last_sweep = now
+    return True
+
+
+def _pump():
+    while True:
+        socketio.sleep(CONVERSATION_FRAME_S)
+        try:
+            flush(_sweep_due())
+        except Exception as e:
+            print(f"conversation_bus pump error: {e}")
+
+
+async def _pump_async():
+    while True:
+        await socketio.sleep(CONVERSATION_FRAME_S)
+        try:
+            await flush_async(_sweep_due())
+        except Exception as e:
+            print(f"conversation_bus pump error: {e}")
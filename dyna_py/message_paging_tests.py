@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+# The store reads AGENTS_URI at import: point it at a throwaway directory first
+AGENTS_URI = tempfile.mkdtemp(prefix="dyna-paging-tests-")
+os.environ["AGENTS_URI"] = AGENTS_URI
+
+import pyarrow as pa
+
+from store import schemas
+from store.db import open_async_table, run_sync
+from store.messages import page_messages_async
+
+CONVERSATION = "conv-paging"
+# Message seqs are global, so a conversation's seqs have gaps where other conversations wrote
+SEQS = [2, 3, 5, 8, 9, 11, 14, 15, 20, 21]
+
+
+def _message(conversation_id, seq):
+    return {
+        "message_id": f"{conversation_id}-{seq}",
+        "conversation_id": conversation_id,
+        "seq": seq,
+        "author_id": "user",
+        "role": "user",
+        "text": f"message {seq}",
+        "created_at": f"2026-01-01T00:00:{seq:02d}+00:00",
+        "reply_to": None,
+        "meta": None,
+    }
+
+
+async def _seed():
+    tbl = await open_async_table(schemas.MESSAGES_NAME)
+    rows = [_message(CONVERSATION, s) for s in SEQS]
+    rows += [_message("conv-other", s) for s in (1, 4, 6, 7, 10, 12, 13)]
+    await tbl.add(pa.Table.from_pylist(rows, schema=schemas.MESSAGES_SCHEMA))
+
+
+def page(**kwargs):
+    rows, has_more = run_sync(page_messages_async(CONVERSATION, **kwargs))
+    return [r["seq"] for r in rows], has_more
+
+
+class PageMessagesTestCases(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        schemas.create_conversation_schemas()
+        run_sync(_seed())
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(AGENTS_URI, ignore_errors=True)
+
+    def test_first_page_asc(self):
+        self.assertEqual(page(limit=3), ([2, 3, 5], True))
+
+    def test_keyset_walks_every_row_once(self):
+        seen, after = [], None
+        while True:
+            seqs, has_more = page(limit=4, after_seq=after)
+            seen += seqs
+            if not has_more:
+                break
+            after = seqs[-1]
+        self.assertEqual(seen, SEQS)
+
+    def test_has_more_false_on_exact_fit(self):
+        self.assertEqual(page(limit=len(SEQS)), (SEQS, False))
+        self.assertEqual(page(limit=2, after_seq=15), ([20, 21], False))
+
+    def test_after_seq_in_a_gap(self):
+        # 6 belongs to another conversation: the page starts at the next seq of this one
+        self.assertEqual(page(limit=2, after_seq=6), ([8, 9], True))
+
+    def test_after_last_seq_is_empty(self):
+        self.assertEqual(page(limit=5, after_seq=21), ([], False))
+
+    def test_desc_order(self):
+        self.assertEqual(page(limit=3, order="desc"), ([21, 20, 15], True))
+
+    def test_desc_keyset_with_before_seq(self):
+        seen, before = [], None
+        while True:
+            seqs, has_more = page(limit=3, order="desc", before_seq=before)
+            seen += seqs
+            if not has_more:
+                break
+            before = seqs[-1]
+        self.assertEqual(seen, SEQS[::-1])
+
+    def test_before_seq_asc(self):
+        self.assertEqual(page(limit=2, before_seq=9), ([2, 3], True))
+        self.assertEqual(page(before_seq=3, limit=5), ([2], False))
+
+    def test_after_and_before_seq(self):
+        self.assertEqual(page(after_seq=5, before_seq=15, limit=10), ([8, 9, 11, 14], False))
+
+    def test_offset(self):
+        self.assertEqual(page(limit=3, offset=2), ([5, 8, 9], True))
+        self.assertEqual(page(limit=3, offset=8), ([20, 21], False))
+        self.assertEqual(page(limit=3, order="desc", offset=1), ([20, 15, 14], True))
+
+    def test_offset_past_the_end(self):
+        self.assertEqual(page(limit=3, offset=len(SEQS)), ([], False))
+        self.assertEqual(page(limit=3, offset=50), ([], False))
+
+    def test_no_limit(self):
+        self.assertEqual(page(limit=None), (SEQS, False))
+        self.assertEqual(page(limit=None, offset=7), ([15, 20, 21], False))
+
+    def test_zero_limit(self):
+        self.assertEqual(page(limit=0), ([], True))
+
+    def test_columns_projection_keeps_seq(self):
+        rows, _ = run_sync(page_messages_async(CONVERSATION, limit=1, columns=["text"]))
+        self.assertEqual(rows, [{"text": "message 2", "seq": 2}])
+
+    def test_unknown_conversation(self):
+        rows, has_more = run_sync(page_messages_async("conv-missing", limit=5))
+        self.assertEqual((rows, has_more), ([], False))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,8 +2,16 @@ from typing import Optional, Dict, Any, List
 
 from agent_core import PauseMixin, InterruptMixin
 from agent_loop import LoopingAgentBase, StepOutcome
-from store.messages import list_messages_since
+from store.message_cache import MESSAGE_CACHE
+from store.memories import add_memory_episode_async, retrieve_episodes_async
 from datetime import datetime, timedelta
+from collections import Counter
+import re
+
+_STOPWORDS = frozenset("""
+a an and are as at be but by for from has have i in is it its me my of on or our so that the their them
+they this to was we were what when which who will with you your just about there then than into also
+""".split())
 
 
 class PersonaAgent(PauseMixin, InterruptMixin, LoopingAgentBase):
@@ -16,11 +24,17 @@ class PersonaAgent(PauseMixin, InterruptMixin, LoopingAgentBase):
         persona_config: dict,
         loop_interval: float = 1.5,
         cooldown_seconds: float = 2.0,
+        idle_backoff: float = 2.0,        # wait grows by this factor per idle tick (1.0 = fixed cadence)
+        max_idle_interval: float = 30.0,  # ceiling for the idle wait
+        episode_every: int = 50,          # messages per memory episode (0 = don't record episodes)
+        memory_k: int = 3,                # episodes recalled per reply
+        memory_token_budget: int = 400,   # token budget for recalled episodes
         **kwargs
     ):
         self.conversation_id = conversation_id
         self.persona_config = dict(persona_config or {})
         self.last_seen_iso: Optional[str] = None
+        self.last_seen_seq: Optional[int] = None   # cursor into MESSAGE_CACHE; last_seen_iso kept for rehydrate
         self.cooldown_seconds = cooldown_seconds
         self._last_spoke_at: Optional[datetime] = None
         self._force_tick = False
@@ -28,7 +42,15 @@ class PersonaAgent(PauseMixin, InterruptMixin, LoopingAgentBase):
         self.participants: dict[str, dict] = {}
         self._participants_last_fetch = None
         self.participants_refresh_secs = 5.0  # tune as you like
+        self.idle_backoff = idle_backoff
+        self.max_idle_interval = max_idle_interval
+        self.episode_every = episode_every
+        self.memory_k = memory_k
+        self.memory_token_budget = memory_token_budget
+        self._episode_msgs: list[dict] = []   # messages seen since the last recorded episode
+        self._last_topics: set[str] = set()
         super().__init__(agent_id, session_id, loop_interval=loop_interval, **kwargs)
+        self._idle_interval = self.loop_interval
 
 
 
@@ -48,8 +70,8 @@ class PersonaAgent(PauseMixin, InterruptMixin, LoopingAgentBase):
             return None
         try:
             # Option 1:
-            from store.conversations import list_participants
-            plist = list_participants(self.conversation_id)
+            from store.conversations import list_participants_async
+            plist = await list_participants_async(self.conversation_id)
             # Option 2:
             # from store.conversations import get_conversation_messages_and_participants
             # plist = get_conversation_messages_and_participants(self.conversation_id)["participants"]
@@ -84,12 +106,69 @@ class PersonaAgent(PauseMixin, InterruptMixin, LoopingAgentBase):
 
 
 
+    def next_tick_interval(self) -> float:
+        return self._idle_interval
+
+    def _reset_idle_backoff(self):
+        self._idle_interval = self.loop_interval
+
     def _can_speak_now(self) -> bool:
         if self._last_spoke_at is None:
             return True
         return (datetime.now() - self._last_spoke_at) >= timedelta(seconds=self.cooldown_seconds)
 
-    async def _generate_reply(self, window: List[dict]) -> str:
+    def _summarize_episode(self, msgs: List[dict]) -> dict:
+        """
+        Extractive episode for a stretch of messages: who spoke, the longest lines as
+        salient points and the most frequent words as topics. Override (e.g. with an
+        LLM call) for abstractive summaries; the keys are add_memory_episode's.
+        """
+        names = list(dict.fromkeys(self.participants.get(m.get("author_id"), {}).get("name", m.get("author_id")) for m in msgs))
+        words = Counter(
+            w for m in msgs for w in re.findall(r"[a-z][a-z']{3,}", (m.get("text") or "").lower()) if w not in _STOPWORDS
+        )
+        topics = [w for w, _ in words.most_common(5)]
+        salient = [(m.get("text") or "")[:200] for m in sorted(msgs, key=lambda m: len(m.get("text") or ""), reverse=True)[:3]]
+        novelty = (len(set(topics) - self._last_topics) / len(topics)) if topics else 0.0
+        return {
+            "summary": f"{len(msgs)} messages from {', '.join(map(str, names))} about {', '.join(topics) or 'nothing in particular'}.",
+            "salient_points": salient,
+            "topics": topics,
+            "novelty_hint": novelty,
+        }
+
+    async def _remember(self, msgs: List[dict]):
+        """Fold newly seen messages into the pending episode; record it every episode_every messages."""
+        if self.episode_every <= 0:
+            return
+        self._episode_msgs.extend(msgs)
+        while len(self._episode_msgs) >= self.episode_every:
+            chunk = self._episode_msgs[:self.episode_every]
+            self._episode_msgs = self._episode_msgs[self.episode_every:]
+            ep = self._summarize_episode(chunk)
+            try:
+                await add_memory_episode_async(
+                    self.conversation_id, self.agent_id, self.session_id,
+                    chunk[0].get("created_at"), chunk[-1].get("created_at"),
+                    ep["summary"], ep["salient_points"], ep["topics"], ep.get("novelty_hint"),
+                )
+                self._last_topics = set(ep["topics"])
+            except Exception as e:
+                print(f"PersonaAgent {self.agent_id}: recording memory episode failed: {e}")
+
+    async def _recall(self, query: str) -> List[dict]:
+        if self.memory_k <= 0:
+            return []
+        try:
+            return await retrieve_episodes_async(
+                query, conversation_id=self.conversation_id, agent_id=self.agent_id,
+                k=self.memory_k, token_budget=self.memory_token_budget,
+            )
+        except Exception as e:
+            print(f"PersonaAgent {self.agent_id}: memory recall failed: {e}")
+            return []
+
+    async def _generate_reply(self, window: List[dict], memories: List[dict] = ()) -> str:
         # Minimal template; plug in your baml client/tool here
         persona = self.persona_config.get("name") or self.agent_id
         tone = self.persona_config.get("tone") or "default"
@@ -97,21 +176,28 @@ class PersonaAgent(PauseMixin, InterruptMixin, LoopingAgentBase):
         return f"[{persona} | tone={tone}] {last_user}"
 
     async def do_tick(self, step: int) -> StepOutcome:
-        
-        await self._refresh_participants()
 
-        msgs = list_messages_since(self.conversation_id, self.last_seen_iso, limit=50)
+        # Shared per-conversation window: only messages past the last cursor are ever read from the store
+        msgs = await MESSAGE_CACHE.since(self.conversation_id, after_seq=self.last_seen_seq, since_iso=self.last_seen_iso, limit=50)
 
         if not msgs:
-            return StepOutcome(status="info", text=None, state={"idle": True, "conversation_id": self.conversation_id})
+            # Back off while nothing happens; a new_message interrupt wakes us and resets the cadence
+            self._idle_interval = min(self._idle_interval * self.idle_backoff, self.max_idle_interval)
+            return StepOutcome(status="info", text=None, idle=True, state={"idle": True, "conversation_id": self.conversation_id})
+
+        self._reset_idle_backoff()
+        # Participants only matter when there is something to answer (participants_changed forces a refresh)
+        await self._refresh_participants()
+        await self._remember(msgs)
 
         self.last_seen_iso = msgs[-1]["created_at"]
+        self.last_seen_seq = msgs[-1].get("seq")
         last_msg_id = msgs[-1].get("message_id")
 
 
         try:
             # Merge into agent context so agent_state.context carries it
-            self._merge_context({"last_seen_iso": self.last_seen_iso, "last_msg_id": last_msg_id})
+            self._merge_context({"last_seen_iso": self.last_seen_iso, "last_seen_seq": self.last_seen_seq, "last_msg_id": last_msg_id})
         except Exception:
             pass
 
@@ -128,13 +214,15 @@ class PersonaAgent(PauseMixin, InterruptMixin, LoopingAgentBase):
             return StepOutcome(status="info", data={"intent": {"type": "silent", "reason": "cooldown"}}, state={"conversation_id": self.conversation_id})
 
         window = msgs[-10:]
-        reply = await self._generate_reply(window)
+        # Older context comes from memory episodes rather than re-reading the history
+        memories = await self._recall(last.get("text") or "")
+        reply = await self._generate_reply(window, memories)
         reply = f"{reply}\n\n(p.s. I heard {author_name}; participants: {', '.join(sorted([v['name'] for v in self.participants.values()]))})"
 
 
         return StepOutcome(
             status="ok",
-            data={"intent": {"type": "speak", "mode": "answer", "text": reply}},
+            data={"intent": {"type": "speak", "mode": "answer", "text": reply}, "memory_episode_ids": [m["episode_id"] for m in memories]},
             state={"conversation_id": self.conversation_id}
         )
     
@@ -152,9 +240,11 @@ class PersonaAgent(PauseMixin, InterruptMixin, LoopingAgentBase):
 
         if t in ("rehydrate", "set_last_seen"):
             lsi = g.get("last_seen_iso") or g.get("last_seen")
-            if lsi:
-                self.last_seen_iso = str(lsi)
-                return {"last_seen_iso": self.last_seen_iso}
+            lss = g.get("last_seen_seq")
+            if lsi or lss is not None:
+                self.last_seen_iso = str(lsi) if lsi else None
+                self.last_seen_seq = int(lss) if lss is not None else None
+                return {"last_seen_iso": self.last_seen_iso, "last_seen_seq": self.last_seen_seq}
 
 
         if t == "participants_changed": 
@@ -169,6 +259,7 @@ class PersonaAgent(PauseMixin, InterruptMixin, LoopingAgentBase):
 
         if t == "speak_now":
             self._force_tick = True
+            self._reset_idle_backoff()
             return {"force_tick": True}
 
         if t == "set_cooldown":
@@ -180,7 +271,9 @@ class PersonaAgent(PauseMixin, InterruptMixin, LoopingAgentBase):
 
         # NEW: When a new_message arrives, wake the agent and bypass cooldown for this tick
         if t == "new_message":
+            MESSAGE_CACHE.note(self.conversation_id, g.get("seq"))
             self._force_tick = True
+            self._reset_idle_backoff()
             # optionally include a tiny breadcrumb for observability
             return {"force_tick": True, "last_new_message_id": g.get("message_id")}
 
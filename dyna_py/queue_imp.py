@@ -1,25 +1,28 @@
-import lancedb
 import pyarrow as pa
 import pandas as pd
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 import uuid
 import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
 from store.schemas import AGENTS_URI, AGENTS_CONFIG_NAME, QUEUE_NAME
 from store.sessions import get_agent_id_for_session_id
+from action_bus import notify_action
+from shards import shard_for
 
 # --------------------
 # Database Setup
 # --------------------
 
-AGENTS_DB = lancedb.connect(AGENTS_URI)
+from store.db import open_table
 
 
 # --------------------
 # Agent Config (Metadata) Management
 # --------------------
 def create_agent_config(agent_id, agent_type, agent_description="", agents_metadata=None):
-    tbl = AGENTS_DB.open_table(AGENTS_CONFIG_NAME)
+    tbl = open_table(AGENTS_CONFIG_NAME)
     record = {
         "agent_id": agent_id,
         "agent_type": agent_type,
@@ -30,7 +33,7 @@ def create_agent_config(agent_id, agent_type, agent_description="", agents_metad
     print(f"AgentConfig for {agent_id} ({agent_type}) created.")
 
 def update_agent_config(agent_id, agent_type=None, agent_description=None, agents_metadata=None):
-    tbl = AGENTS_DB.open_table(AGENTS_CONFIG_NAME)
+    tbl = open_table(AGENTS_CONFIG_NAME)
     updates = {}
     if agent_type is not None: updates["agent_type"] = agent_type
     if agent_description is not None: updates["agent_description"] = agent_description
@@ -42,12 +45,12 @@ def update_agent_config(agent_id, agent_type=None, agent_description=None, agent
     print(f"Updated {count} AgentConfig record(s) for {agent_id}.")
 
 def delete_agent_config(agent_id):
-    tbl = AGENTS_DB.open_table(AGENTS_CONFIG_NAME)
+    tbl = open_table(AGENTS_CONFIG_NAME)
     count = tbl.delete(where=f"agent_id == '{agent_id}'")
     print(f"Deleted {count} AgentConfig record(s) for {agent_id}.")
 
 def list_agent_configs():
-    tbl = AGENTS_DB.open_table(AGENTS_CONFIG_NAME)
+    tbl = open_table(AGENTS_CONFIG_NAME)
     df = tbl.to_pandas()
     if df.empty:
         print("No agent configs found.")
@@ -67,7 +70,7 @@ def list_agent_configs():
 # --------------------
 # Action Queue Management
 # --------------------
-def create_action(
+def build_action_record(
     action_type: str,
     actor: str,
     payload: str = None,
@@ -78,9 +81,8 @@ def create_action(
     action_id: str = None,
     created_at: str = None,
     session_id: str | None = None
-):
-    queue_tbl = AGENTS_DB.open_table(QUEUE_NAME)
-    record = {
+) -> dict:
+    return {
         "action_id": action_id or str(uuid.uuid4()),
         "type": action_type,
         "created_at": created_at or datetime.now(timezone.utc).isoformat(),
@@ -91,18 +93,68 @@ def create_action(
         "payload": payload,
         "metadata": metadata,
         "session_id": session_id,
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "shard": shard_for(session_id),
     }
+
+def create_actions(records: list[dict], if_absent: bool = False) -> int:
+    """
+    Queue many actions with one add (one table version) and a single wakeup.
+    With if_absent, records whose action_id is already queued are left out
+    (one insert-only merge on action_id), so re-queueing a batch is harmless.
+    """
+    if not records:
+        return 0
+    queue_tbl = open_table(QUEUE_NAME)
+    if if_absent:
+        data = pa.Table.from_pylist(records, schema=queue_tbl.schema)
+        queue_tbl.merge_insert("action_id").when_not_matched_insert_all().execute(data)
+    else:
+        queue_tbl.add(data=records, mode="append")
+    if any(not r["processed"] for r in records):
+        notify_action()
+    print(f"{len(records)} action(s) queued.")
+    return len(records)
+
+def create_action(
+    action_type: str,
+    actor: str,
+    payload: str = None,
+    metadata: str = None,
+    urgency: str = "normal",
+    description: str = "",
+    processed: bool = False,
+    action_id: str = None,
+    created_at: str = None,
+    session_id: str | None = None
+):
+    queue_tbl = open_table(QUEUE_NAME)
+    record = build_action_record(
+        action_type,
+        actor,
+        payload=payload,
+        metadata=metadata,
+        urgency=urgency,
+        description=description,
+        processed=processed,
+        action_id=action_id,
+        created_at=created_at,
+        session_id=session_id,
+    )
     queue_tbl.add(data=[record], mode="append")
+    if not processed:
+        notify_action()
     print(f"Action '{action_type}' for actor '{actor}' queued.")
 
 def list_actions():
-    queue_tbl = AGENTS_DB.open_table(QUEUE_NAME)
+    queue_tbl = open_table(QUEUE_NAME)
     df = queue_tbl.to_pandas()
     print(df)
     return df.to_dict(orient="records")
 
 def delete_all_actions():
-    queue_tbl = AGENTS_DB.open_table(QUEUE_NAME)
+    queue_tbl = open_table(QUEUE_NAME)
     queue_tbl.delete("1 == 1")
 
 # --------------------
@@ -127,13 +179,80 @@ def stop_agent(session_id, reason=None):
 
 
 
+# Audit rows for locally delivered interrupts are written off the caller's path
+_AUDIT_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="queue-audit")
+
+
+def _deliver_local(agent_id, session_id, guidance) -> bool:
+    # Only when the agent runtime is loaded in this process (app.py starts it in a thread)
+    runtime = sys.modules.get("agent")
+    if runtime is None:
+        return False
+    try:
+        return runtime.deliver_interrupt_local(agent_id, session_id, guidance)
+    except Exception as e:
+        print(f"local interrupt delivery failed: {e}")
+        return False
+
+
 def agent_interrupt_action(agent_id, session_id, actor="user", guidance: dict = {} ):
     payload = json.dumps({ "agent_id": agent_id, "session_id": session_id, "guidance": guidance})
+    if _deliver_local(agent_id, session_id, guidance):
+        # Already delivered; record it as processed so the watcher never re-dispatches it
+        _AUDIT_EXECUTOR.submit(create_action, action_type="agent_interrupt", actor=actor, payload=payload, session_id=session_id, processed=True)
+        return("ok")
     create_action( action_type="agent_interrupt", actor=actor, payload=payload,session_id=session_id)
     
     return("ok")
 
 
+# Namespace of the deterministic action_ids given to fanned-out interrupts
+INTERRUPT_ACTION_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "dyna:agent_interrupt")
+
+
+def interrupt_action_id(message_id: str, session_id: str | None) -> str:
+    """The action_id of the interrupt for one message to one session (same inputs, same id)."""
+    return str(uuid.uuid5(INTERRUPT_ACTION_NAMESPACE, f"{message_id}:{session_id or ''}"))
+
+
+def _queued_action_ids(action_ids) -> set:
+    queue_tbl = open_table(QUEUE_NAME)
+    found = set()
+    ids = list(dict.fromkeys(action_ids))
+    for i in range(0, len(ids), 1000):
+        rows = queue_tbl.search().where(f"action_id IN ({_sql_in(ids[i:i + 1000])})").select(["action_id"]).to_arrow()
+        found.update(rows["action_id"].to_pylist())
+    return found
+
+
+def agent_interrupt_actions(targets, actor="user", action_ids=None):
+    """
+    Bulk variant: targets is an iterable of (agent_id, session_id, guidance).
+    action_ids, if given, holds a deterministic id per target (interrupt_action_id):
+    targets whose action is already queued are neither delivered nor queued again,
+    and the rest are inserted only if absent.
+    """
+    targets = list(targets)
+    ids = list(action_ids) if action_ids is not None else [None] * len(targets)
+    if action_ids is not None:
+        queued = _queued_action_ids(ids)
+        keep = [i for i, aid in enumerate(ids) if aid not in queued]
+        targets, ids = [targets[i] for i in keep], [ids[i] for i in keep]
+    records = [
+        build_action_record(
+            "agent_interrupt",
+            actor,
+            payload=json.dumps({"agent_id": agent_id, "session_id": session_id, "guidance": guidance}),
+            session_id=session_id,
+            processed=_deliver_local(agent_id, session_id, guidance),
+            action_id=aid,
+        )
+        for (agent_id, session_id, guidance), aid in zip(targets, ids)
+    ]
+    create_actions(records, if_absent=action_ids is not None)
+    return("ok")
+
+
 def agent_pause_action(agent_id, session_id: str , reason="user initiated", actor="user"):
     payload = json.dumps({"agent_id": agent_id, "reason": reason, "session_id": session_id})
     create_action(action_type="agent_pause", actor=actor, payload=payload, session_id=session_id)
@@ -148,8 +267,58 @@ def agent_resume_action(agent_id, session_id: str , actor="user", ):
 # Async Helper
 # --------------------
 
+ACTION_LEASE_S = 60.0
+ACTION_CLAIM_BATCH = 100
+
+
+def _sql_in(values) -> str:
+    return ", ".join("'" + str(v).replace("'", "''") + "'" for v in values)
+
+
+async def claim_actions_async(async_tbl, owner: str, *, limit: int = ACTION_CLAIM_BATCH, lease_s: float = ACTION_LEASE_S, where: str | None = None) -> list[dict]:
+    """
+    Claim up to `limit` unprocessed actions for `owner` with a lease of `lease_s` seconds.
+    Rows are claimable when unleased or when a previous lease has expired (crashed worker).
+    The claim is a single update that re-checks the free condition, then the rows we
+    actually won are read back by (owner, expiry) so concurrent claimers never share a row.
+    `where` narrows the candidates further (a sharded worker passes ShardMap.claim_filter()).
+    """
+    now = datetime.now(timezone.utc)
+    now_iso = now.isoformat()
+    expires_iso = (now + timedelta(seconds=lease_s)).isoformat()
+    free = f"processed == False AND (lease_owner IS NULL OR lease_expires_at < '{now_iso}')"
+    if where:
+        free = f"{free} AND {where}"
+
+    # The handle is long-lived (store.db); make sure it sees rows other writers added
+    await async_tbl.checkout_latest()
+    cand = await async_tbl.query().where(free).select(["action_id"]).limit(limit).to_arrow()
+    ids = cand["action_id"].to_pylist()
+    if not ids:
+        return []
+
+    await async_tbl.update(
+        {"lease_owner": owner, "lease_expires_at": expires_iso},
+        where=f"action_id IN ({_sql_in(ids)}) AND ({free})",
+    )
+    df = await async_tbl.query().where(
+        f"processed == False AND lease_owner == '{owner}' AND lease_expires_at == '{expires_iso}'"
+    ).to_pandas()
+    return df.to_dict(orient="records")
+
+
+async def ack_actions_async(async_tbl, action_ids) -> int:
+    """Mark a whole batch processed with one update (one new table version)."""
+    ids = [a for a in action_ids if a]
+    if not ids:
+        return 0
+    await async_tbl.checkout_latest()
+    res = await async_tbl.update({"processed": True}, where=f"action_id IN ({_sql_in(ids)})")
+    return getattr(res, "rows_updated", 0)
+
+
 async def mark_action_processed_async(async_tbl, action_id: str):
-    await async_tbl.update(where=f'action_id == "{action_id}"', updates={"processed": True})
+    await ack_actions_async(async_tbl, [action_id])
 
 
 
@@ -4,8 +4,13 @@ from flask import Flask, request
 
 from store.agent_config import list_agent_configs as store_list_agent_configs
 from store.agent_config import upsert_agent_config as store_upsert_agent_config
+from store.schemas import AGENTS_CONFIG_NAME
+from .response_cache import cached_view
 
+AGENT_CONFIG_TABLES = [AGENTS_CONFIG_NAME]
 
+
+@cached_view(AGENT_CONFIG_TABLES)
 def list_agent_configs():
     return store_list_agent_configs("all")
 
@@ -7,8 +7,14 @@ from store.sessions import get_agent_id_for_session_id
 from queue_imp import stop_agent as store_stop_agent, agent_create as store_create_agent
 from queue_imp import agent_pause_action as store_pause_agent, agent_resume_action as store_resume_agent
 from queue_imp import agent_interrupt_action as store_interrupt_agent
+from store.schemas import AGENT_STATE_NAME, AGENT_STEPS_NAME
+from .response_cache import cached_view
 
+# Sessions and their last steps are read from these (response_cache validates against them)
+SESSION_TABLES = [AGENT_STATE_NAME, AGENT_STEPS_NAME]
 
+
+@cached_view(SESSION_TABLES)
 def list_sessions_for_agent():
 
     agent_id = request.args.get('agent_id')
@@ -64,6 +70,7 @@ def interrupt_agent():
     return jsonify(retVal)
 
 
+@cached_view(SESSION_TABLES)
 def get_last_step_for_session_id(): 
     session_id = request.args.get('session_id')
     return (jsonify(store_get_last_step_for_session_id(session_id=session_id)))
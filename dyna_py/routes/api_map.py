@@ -18,12 +18,14 @@ from .form_api import prompt_to_schema_endpoint
 from .not_impl import not_implemented
 
 from .conversations_endpoints import list_conversations_endpoint, conversation_messages_endpoint
+from .search_endpoints import search_endpoint
 from goal_agent import api_generate_task_graph
 
 # 1. All your websocket handlers go here.
+# Return what socketio.emit returns: under asgi_app.py it is a coroutine, which the dispatcher awaits.
 def ws_test(data, socketio, sid):
     # Example simple echo
-    socketio.emit('response', {'msg': 'Echo: ' + str(data)}, room=sid)
+    return socketio.emit('response', {'msg': 'Echo: ' + str(data)}, room=sid)
 
 def handle_request_response(data, socketio: SocketIO):
     sid = request.sid  # Session ID for this websocket connection
@@ -66,6 +68,7 @@ MAP_HTTP_FUNCS = [
 
     ["/api/conversations", list_conversations_endpoint, ['GET']],
     ["/api/conversation-messages", conversation_messages_endpoint, ['GET']],
+    ["/api/search", search_endpoint, ['GET']],
     ["/api/generate-task-graph",api_generate_task_graph ,['GET', 'POST']]  
     # ...add more
 ]
\ No newline at end of file
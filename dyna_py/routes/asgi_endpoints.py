@@ -0,0 +1,246 @@
+# routes/asgi_endpoints.py
+"""
+Async versions of the routes in api_map.MAP_HTTP_FUNCS, for asgi_app.py.
+
+Same paths, parameters and JSON as the Flask views; they await the *_async
+store functions on the server's event loop instead of blocking a request
+thread. Calls that only exist as sync code (queue_imp action writers, the BAML
+form logic, the chat reply) run in a worker thread. Routes not listed in
+ASYNC_HTTP_FUNCS are served by asgi_app through their Flask view.
+"""
+import asyncio
+import json
+import os
+
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response, StreamingResponse
+
+from store.agent_config import list_agent_configs_async, upsert_agent_config_async
+from store.sessions import list_sessions_for_agent_async, get_agent_id_for_session_id_async, get_last_step_for_session_id_async
+from store.conversations import list_conversations_for_window_async, get_conversation_messages_and_participants_async
+from store.search import search_async
+from queue_imp import stop_agent as store_stop_agent, agent_create as store_create_agent
+from queue_imp import agent_pause_action as store_pause_agent, agent_resume_action as store_resume_agent
+from queue_imp import agent_interrupt_action as store_interrupt_agent
+from logic.chat_logic import sanitize_messages, build_reply, stream_text
+from logic.form_logic import prompt_to_schema
+from .static_endpoints import PLUGINS_ROOT
+from .agent_configs_endpoints import AGENT_CONFIG_TABLES
+from .agents_endpoints import SESSION_TABLES
+from .conversations_endpoints import conversation_list_tables
+from .response_cache import cached_endpoint
+
+
+def _jsonify(data, status_code: int = 200) -> Response:
+    # Like flask.jsonify (NaN passes through, unknown types are stringified)
+    return Response(json.dumps(data, default=str), status_code=status_code, media_type="application/json")
+
+
+def _safe_json(data, status_code: int = 200) -> Response:
+    return Response(json.dumps(data, ensure_ascii=False, allow_nan=False), status_code=status_code,
+        media_type="application/json")
+
+
+async def _json_body(request: Request):
+    # Like request.get_json(silent=True): None for a missing or malformed body
+    try:
+        return await request.json()
+    except Exception:
+        return None
+
+
+def _int_arg(request: Request, name: str, default: int) -> int:
+    try:
+        return int(request.query_params.get(name, str(default)))
+    except ValueError:
+        return default
+
+
+# Static
+
+async def serve_plugin_file(request: Request):
+    subpath = request.path_params["subpath"]
+    full = os.path.abspath(os.path.join(PLUGINS_ROOT, subpath))
+    if not full.startswith(PLUGINS_ROOT + os.sep) or not os.path.isfile(full):
+        return Response(status_code=404)
+    if full.endswith('.js'):
+        return FileResponse(full, media_type='text/javascript')
+    if full.endswith('.json'):
+        return FileResponse(full, media_type='application/json')
+    return FileResponse(full)
+
+
+# Chat / forms
+
+async def chat_endpoint(request: Request):
+    data = await _json_body(request) or {}
+    chat_type = data.get("type") or "default"
+    if chat_type not in {"default", "support", "analysis"}:
+        chat_type = "default"
+    messages = sanitize_messages(data.get("messages"))
+    config = data.get("config") if isinstance(data.get("config"), dict) else {}
+
+    if not messages:
+        reply = "No messages received. Please say something to start the chat."
+    else:
+        reply = await asyncio.to_thread(build_reply, messages, chat_type, config)
+
+    # stream_text is a sync generator; Starlette iterates it in its threadpool
+    return StreamingResponse(stream_text(reply), media_type="text/plain; charset=utf-8",
+        headers={"Cache-Control": "no-store"})
+
+
+async def prompt_to_schema_endpoint(request: Request):
+    data = await _json_body(request) or {}
+    prompt = (data.get("prompt") or "").strip()
+    if not prompt:
+        return _jsonify({"error": "prompt is required"}, 400)
+    result = await asyncio.to_thread(prompt_to_schema, prompt)
+    if not result:
+        return _jsonify({"error": "invalid response"}, 500)
+    return _jsonify(result)
+
+
+# Agent configs
+
+@cached_endpoint(AGENT_CONFIG_TABLES)
+async def list_agent_configs(request: Request):
+    return _jsonify(await list_agent_configs_async("all"))
+
+
+async def upsert_agent_config(request: Request):
+    all_json = await _json_body(request)
+    return _jsonify(await upsert_agent_config_async(
+        agent_id=all_json['agent_id'],
+        agent_description=all_json['agent_description'],
+        agent_type=all_json['agent_type'],
+        agents_metadata=all_json['agents_metadata']))
+
+
+# Agents / sessions
+
+@cached_endpoint(SESSION_TABLES)
+async def list_sessions_for_agent(request: Request):
+    agent_id = request.query_params.get('agent_id')
+    return _jsonify(await list_sessions_for_agent_async(agent_id=agent_id))
+
+
+@cached_endpoint(SESSION_TABLES)
+async def get_last_step_for_session_id(request: Request):
+    session_id = request.query_params.get('session_id')
+    return _jsonify(await get_last_step_for_session_id_async(session_id=session_id))
+
+
+async def create_agent(request: Request):
+    all_json = await _json_body(request)
+    await asyncio.to_thread(store_create_agent, agent_id=all_json['agent_id'], actor="user", initial_subject=all_json['input'])
+    return _jsonify("ok")
+
+
+async def stop_agent(request: Request):
+    session_id = await _json_body(request)
+    return _jsonify(await asyncio.to_thread(store_stop_agent, session_id=session_id))
+
+
+async def pause_agent(request: Request):
+    session_id = await _json_body(request)
+    agent_id = await get_agent_id_for_session_id_async(session_id=session_id)
+    return _jsonify(await asyncio.to_thread(store_pause_agent, agent_id=agent_id, session_id=session_id, actor="user"))
+
+
+async def resume_agent(request: Request):
+    session_id = await _json_body(request)
+    agent_id = await get_agent_id_for_session_id_async(session_id=session_id)
+    return _jsonify(await asyncio.to_thread(store_resume_agent, agent_id=agent_id, session_id=session_id))
+
+
+async def interrupt_agent(request: Request):
+    all_json = await _json_body(request)
+    session_id = all_json['session_id']
+    agent_id = await get_agent_id_for_session_id_async(session_id=session_id)
+    # In a thread: local delivery hands the interrupt to the agent loop thread-safely
+    return _jsonify(await asyncio.to_thread(
+        store_interrupt_agent, agent_id=agent_id, session_id=session_id, guidance=all_json['guidance']))
+
+
+# Conversations / search
+
+@cached_endpoint(conversation_list_tables)
+async def list_conversations_endpoint(request: Request):
+    order = request.query_params.get("order", "desc")
+    if order not in ("asc", "desc"):
+        order = "desc"
+    data = await list_conversations_for_window_async(
+        status=request.query_params.get("status", "all"),
+        q=request.query_params.get("q"),
+        limit=_int_arg(request, "limit", 100),
+        offset=_int_arg(request, "offset", 0),
+        order=order,
+    )
+    return _jsonify(data)
+
+
+async def conversation_messages_endpoint(request: Request):
+    args = request.query_params
+    conversation_id = args.get("conversation_id")
+    if not conversation_id:
+        return _safe_json({"messages": [], "participants": [], "error": "missing conversation_id"}, 400)
+    order = args.get("order", "asc")
+    if order not in ("asc", "desc"):
+        order = "asc"
+    try:
+        after_seq = int(args["after_seq"]) if args.get("after_seq") else None
+        before_seq = int(args["before_seq"]) if args.get("before_seq") else None
+    except ValueError:
+        return _safe_json({"messages": [], "participants": [], "error": "after_seq/before_seq must be integers"}, 400)
+
+    data = await get_conversation_messages_and_participants_async(
+        conversation_id,
+        limit=_int_arg(request, "limit", 500),
+        offset=_int_arg(request, "offset", 0),
+        order=order,
+        after_seq=after_seq,
+        before_seq=before_seq,
+    )
+    return _safe_json(data)
+
+
+async def search_endpoint(request: Request):
+    args = request.query_params
+    try:
+        data = await search_async(
+            args.get("q", ""),
+            type=args.get("type", "messages"),
+            mode=args.get("mode", "auto"),
+            conversation_id=args.get("conversation_id") or None,
+            limit=max(1, min(_int_arg(request, "limit", 20), 100)),
+            offset=max(0, _int_arg(request, "offset", 0)),
+        )
+    except ValueError as e:
+        return _safe_json({"hits": [], "error": str(e)}, 400)
+    return _safe_json(data)
+
+
+# path (as in MAP_HTTP_FUNCS) -> async handler
+ASYNC_HTTP_FUNCS = {
+    '/plugins/<path:subpath>': serve_plugin_file,
+
+    "/api/prompt-to-schema": prompt_to_schema_endpoint,
+    "/api/chat": chat_endpoint,
+
+    "/api/list-agent-configs": list_agent_configs,
+    "/api/upsert-agent-config": upsert_agent_config,
+
+    "/api/list-sessions-for-agent": list_sessions_for_agent,
+    "/api/get-last-step-for-session_id": get_last_step_for_session_id,
+
+    "/api/create-agent": create_agent,
+    "/api/stop-agent": stop_agent,
+    "/api/pause-agent": pause_agent,
+    "/api/resume-agent": resume_agent,
+    "/api/interrupt-agent": interrupt_agent,
+
+    "/api/conversations": list_conversations_endpoint,
+    "/api/conversation-messages": conversation_messages_endpoint,
+    "/api/search": search_endpoint,
+}
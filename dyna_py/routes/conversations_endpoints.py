@@ -4,8 +4,17 @@ from store.conversations import list_conversations_for_window
 from store.conversations import get_conversation_messages_and_participants
 import json
 from flask import Response
+from store.schemas import CONVERSATIONS_NAME, CONVERSATION_SUMMARIES_NAME, PARTICIPANTS_NAME, MESSAGES_NAME
+from .response_cache import cached_view
 
 
+def conversation_list_tables(args) -> list[str]:
+    # The list comes from conversations + summaries + participants; a `q` also searches messages
+    tables = [CONVERSATIONS_NAME, CONVERSATION_SUMMARIES_NAME, PARTICIPANTS_NAME]
+    return tables + [MESSAGES_NAME] if args.get("q") else tables
+
+
+@cached_view(conversation_list_tables)
 def list_conversations_endpoint():
     status = request.args.get("status", "all")
     q = request.args.get("q")
@@ -53,12 +62,20 @@ def conversation_messages_endpoint():
     order = request.args.get("order", "asc")
     if order not in ("asc", "desc"):
         order = "asc"
+    # Keyset paging: pass meta.next_after_seq / meta.next_before_seq from the previous page
+    try:
+        after_seq = int(request.args["after_seq"]) if request.args.get("after_seq") else None
+        before_seq = int(request.args["before_seq"]) if request.args.get("before_seq") else None
+    except ValueError:
+        return _safe_jsonify({"messages": [], "participants": [], "error": "after_seq/before_seq must be integers"}), 400
 
     data = get_conversation_messages_and_participants(
         conversation_id,
         limit=limit,
         offset=offset,
         order=order,
+        after_seq=after_seq,
+        before_seq=before_seq,
     )
     return _safe_jsonify(data)
     
\ No newline at end of file
@@ -0,0 +1,148 @@
+# routes/response_cache.py
+"""
+Cached GET responses for read endpoints that only change when their tables do.
+
+An endpoint declares the tables its answer is derived from. Each request reads
+their change tokens (store.table_versions: LanceDB version + in-process write
+count, well under a millisecond) and:
+
+- answers 304 if If-None-Match carries the ETag for those tokens, without
+  computing anything
+- otherwise returns the body cached under (path, args) if it was computed at
+  the same tokens, or computes, caches and returns it
+
+The ETag is a digest of path, args and tokens, so it changes with any write to
+those tables. Cache-Control: no-cache makes browsers revalidate each time (a
+304 is cheap). Tokens are read before the body is computed: a write that lands
+meanwhile can only make the cached body newer than its tokens, never older, and
+the next request sees new tokens and recomputes.
+
+cached_view decorates Flask views; cached_endpoint the Starlette handlers of
+routes.asgi_endpoints. Only 200 responses are cached.
+"""
+import functools
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import flask
+from flask import request
+
+from store.db import run_sync
+from store.table_versions import table_versions_async
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()   # key -> (tokens, body, media_type)
+        self._stats = {"hits": 0, "misses": 0, "not_modified": 0}
+
+    def get(self, key: tuple, tokens: tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != tokens:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[1], entry[2]
+
+    def put(self, key: tuple, tokens: tuple, body: bytes, media_type: str):
+        with self._lock:
+            self._entries[key] = (tokens, body, media_type)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def not_modified(self):
+        with self._lock:
+            self._stats["not_modified"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+
+RESPONSE_CACHE = ResponseCache()
+
+
+def _key(path: str, args) -> tuple:
+    return (path, tuple(sorted(args)))
+
+
+def _etag(key: tuple, tokens: tuple) -> str:
+    return 'W/"%s"' % hashlib.sha1(repr((key, tokens)).encode()).hexdigest()[:24]
+
+
+def _matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = {t.strip() for t in if_none_match.split(",")}
+    # Weak comparison: W/"x" and "x" are the same tag
+    return "*" in tags or etag in tags or etag[2:] in tags
+
+
+def _headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+def _tables_for(tables, args) -> list[str]:
+    # `tables` is a list of table names, or a callable(args) -> list for args-dependent reads
+    return list(tables(args) if callable(tables) else tables)
+
+
+def cached_view(tables):
+    """Flask view decorator; see the module docstring."""
+    def deco(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = _key(request.path, request.args.items(multi=True))
+            tokens = run_sync(table_versions_async(_tables_for(tables, request.args)))
+            etag = _etag(key, tokens)
+            if _matches(request.headers.get("If-None-Match"), etag):
+                RESPONSE_CACHE.not_modified()
+                return flask.Response(status=304, headers=_headers(etag))
+            hit = RESPONSE_CACHE.get(key, tokens)
+            if hit is None:
+                resp = flask.current_app.make_response(view(*args, **kwargs))
+                if resp.status_code != 200 or resp.is_streamed:
+                    return resp
+                hit = (resp.get_data(), resp.mimetype)
+                RESPONSE_CACHE.put(key, tokens, *hit)
+            return flask.Response(hit[0], mimetype=hit[1], headers=_headers(etag))
+        return wrapper
+    return deco
+
+
+def cached_endpoint(tables):
+    """The same for an async Starlette handler(request)."""
+    from starlette.responses import Response
+
+    def deco(handler):
+        @functools.wraps(handler)
+        async def wrapper(req):
+            key = _key(req.url.path, req.query_params.multi_items())
+            tokens = await table_versions_async(_tables_for(tables, req.query_params))
+            etag = _etag(key, tokens)
+            if _matches(req.headers.get("if-none-match"), etag):
+                RESPONSE_CACHE.not_modified()
+                return Response(status_code=304, headers=_headers(etag))
+            hit = RESPONSE_CACHE.get(key, tokens)
+            if hit is None:
+                resp = await handler(req)
+                if resp.status_code != 200 or not hasattr(resp, "body"):
+                    return resp
+                hit = (resp.body, resp.media_type)
+                RESPONSE_CACHE.put(key, tokens, *hit)
+            return Response(hit[0], media_type=hit[1], headers=_headers(etag))
+        return wrapper
+    return deco
@@ -0,0 +1,38 @@
+from flask import request, Response
+import json
+
+from store.search import search
+
+
+def _safe_jsonify(data):
+    return Response(json.dumps(data, ensure_ascii=False, allow_nan=False),
+        mimetype="application/json")
+
+def search_endpoint():
+    """
+    GET /api/search?q=...&type=messages|conversations&mode=auto|fts|vector|hybrid
+                   &conversation_id=...&limit=20&offset=0
+    Ranked hits with snippets; page with meta.next_offset.
+    """
+    q = request.args.get("q", "")
+    try:
+        limit = max(1, min(int(request.args.get("limit", "20")), 100))
+    except ValueError:
+        limit = 20
+    try:
+        offset = max(0, int(request.args.get("offset", "0")))
+    except ValueError:
+        offset = 0
+
+    try:
+        data = search(
+            q,
+            type=request.args.get("type", "messages"),
+            mode=request.args.get("mode", "auto"),
+            conversation_id=request.args.get("conversation_id") or None,
+            limit=limit,
+            offset=offset,
+        )
+    except ValueError as e:
+        return _safe_jsonify({"hits": [], "error": str(e)}), 400
+    return _safe_jsonify(data)
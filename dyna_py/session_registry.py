@@ -0,0 +1,59 @@
+# session_registry.py
+"""
+Agent sessions resident in this process (agent.SESSIONS).
+
+Replaces the old SESSIONS / AGENT_LATEST dicts. Next to the session -> instance
+map it keeps the create_agent payload each session was started from, so a
+sharded worker can hand a session whose bucket it no longer owns to the new
+owner by re-queueing that payload (agent.handoff_sessions).
+
+Reads (get / in) are plain dict lookups and safe from other threads, which
+agent.deliver_interrupt_local relies on; writes happen on the agent loop.
+"""
+from shards import ShardMap
+
+
+class SessionRegistry:
+    def __init__(self):
+        self._sessions: dict = {}   # session_id -> agent instance
+        self._specs: dict = {}      # session_id -> create_agent payload
+        self._latest: dict = {}     # agent_id -> latest session_id
+
+    def __contains__(self, session_id) -> bool:
+        return session_id in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id, default=None):
+        return self._sessions.get(session_id, default)
+
+    def items(self):
+        return list(self._sessions.items())
+
+    def register(self, session_id: str, agent, spec: dict | None = None):
+        self._sessions[session_id] = agent
+        self._specs[session_id] = spec or {}
+        self._latest[agent.agent_id] = session_id
+
+    def unregister(self, session_id: str):
+        agent = self._sessions.pop(session_id, None)
+        self._specs.pop(session_id, None)
+        if agent is not None and self._latest.get(agent.agent_id) == session_id:
+            self._latest.pop(agent.agent_id, None)
+        return agent
+
+    def latest(self, agent_id: str):
+        """(session_id, agent) of the agent's most recently started session, or (None, None)."""
+        sid = self._latest.get(agent_id)
+        agent = self._sessions.get(sid) if sid else None
+        return (sid, agent) if agent is not None else (None, None)
+
+    def spec(self, session_id: str) -> dict:
+        return self._specs.get(session_id) or {}
+
+    def not_owned(self, shards: ShardMap | None) -> list[str]:
+        """Resident sessions whose bucket `shards` no longer assigns to this worker."""
+        if shards is None:
+            return []
+        return [sid for sid in self._sessions if not shards.owns(sid)]
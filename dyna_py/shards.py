@@ -0,0 +1,97 @@
+# shards.py
+"""
+Session sharding for the multi-process agent runtime (`python agents.py --workers N`).
+
+Every session_id hashes to one of SHARD_BUCKETS fixed buckets (shard_for). Queue
+rows carry that bucket in their `shard` column, so a worker's claim filters on it
+inside LanceDB instead of claiming rows and handing them back.
+
+Buckets are assigned to live workers with a consistent-hash ring (SHARD_VNODES
+points per worker): a worker joining or leaving only moves the buckets next to
+its own points; everybody else keeps their sessions. Membership comes from the
+heartbeats in the `workers` table (store.workers), so every worker computes the
+same assignment without talking to the others.
+
+Rows without a session (environment_reload, rows queued before the shard column
+existed) have a NULL shard and go to whichever worker owns bucket 0.
+
+SHARDS stays None in the default single-process runtime: no filtering at all.
+"""
+import bisect
+import hashlib
+import os
+import zlib
+
+SHARD_BUCKETS = int(os.getenv("SHARD_BUCKETS", "1024"))
+SHARD_VNODES = int(os.getenv("SHARD_VNODES", "160"))
+WORKER_HEARTBEAT_S = float(os.getenv("WORKER_HEARTBEAT_S", "5"))
+WORKER_TTL_S = float(os.getenv("WORKER_TTL_S", "20"))   # no heartbeat for this long = gone
+
+
+def shard_for(session_id) -> int | None:
+    if not session_id:
+        return None
+    return zlib.crc32(str(session_id).encode()) % SHARD_BUCKETS
+
+
+def _point(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    def __init__(self, members, vnodes: int = SHARD_VNODES):
+        ring = sorted((_point(f"{m}#{i}"), m) for m in set(members) for i in range(vnodes))
+        self._points = [p for p, _ in ring]
+        self._owners = [m for _, m in ring]
+
+    def owner(self, key: str) -> str | None:
+        if not self._points:
+            return None
+        i = bisect.bisect(self._points, _point(key)) % len(self._points)
+        return self._owners[i]
+
+
+class ShardMap:
+    """This worker's view of which buckets it owns; recomputed on every membership change."""
+
+    def __init__(self, worker_id: str):
+        self.worker_id = worker_id
+        self.members: list[str] = []
+        self.owned: frozenset[int] = frozenset()
+        self.generation = 0   # bumped on every change, for consumers that memoise per assignment
+
+    def update(self, members) -> tuple[set[int], set[int]]:
+        """Recompute ownership for the live `members` (always including us). Returns (gained, lost)."""
+        members = sorted(set(members) | {self.worker_id})
+        if members == self.members:
+            return set(), set()
+        ring = HashRing(members)
+        owned = frozenset(b for b in range(SHARD_BUCKETS) if ring.owner(f"bucket:{b}") == self.worker_id)
+        gained, lost = set(owned - self.owned), set(self.owned - owned)
+        self.members, self.owned = members, owned
+        self.generation += 1
+        return gained, lost
+
+    def release(self) -> set[int]:
+        """Give up every bucket (worker shutting down). Returns the buckets released."""
+        lost = set(self.owned)
+        self.members, self.owned = [], frozenset()
+        self.generation += 1
+        return lost
+
+    def owns(self, session_id) -> bool:
+        b = shard_for(session_id)
+        return (0 if b is None else b) in self.owned
+
+    def claim_filter(self) -> str:
+        """SQL predicate selecting the queue rows this worker may claim."""
+        if not self.owned:
+            return "false"
+        clause = f"shard IN ({', '.join(str(b) for b in sorted(self.owned))})"
+        if 0 in self.owned:
+            clause = f"({clause} OR shard IS NULL)"
+        return clause
+
+
+# Set by agents.worker_main; None when one process runs every session
+SHARDS: ShardMap | None = None
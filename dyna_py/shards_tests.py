@@ -0,0 +1,129 @@
+import unittest
+
+from shards import SHARD_BUCKETS, HashRing, ShardMap, shard_for
+
+
+def _ownership(members) -> dict:
+    """bucket -> owning worker, as every worker computes it for `members`."""
+    out = {}
+    for m in members:
+        shard_map = ShardMap(m)
+        shard_map.update(members)
+        for b in shard_map.owned:
+            out[b] = m
+    return out
+
+
+class HashRingTestCases(unittest.TestCase):
+    def test_empty_ring_has_no_owner(self):
+        self.assertIsNone(HashRing([]).owner("bucket:0"))
+
+    def test_single_member_owns_everything(self):
+        ring = HashRing(["w1"])
+        self.assertEqual({ring.owner(f"bucket:{b}") for b in range(64)}, {"w1"})
+
+    def test_owner_is_deterministic_and_order_free(self):
+        ring_a = HashRing(["w1", "w2", "w3"])
+        ring_b = HashRing(["w3", "w1", "w2", "w2"])
+        for b in range(SHARD_BUCKETS):
+            self.assertEqual(ring_a.owner(f"bucket:{b}"), ring_b.owner(f"bucket:{b}"))
+
+    def test_buckets_spread_over_members(self):
+        ring = HashRing(["w1", "w2", "w3", "w4"])
+        counts = {}
+        for b in range(SHARD_BUCKETS):
+            owner = ring.owner(f"bucket:{b}")
+            counts[owner] = counts.get(owner, 0) + 1
+        self.assertEqual(set(counts), {"w1", "w2", "w3", "w4"})
+        # 160 virtual nodes each: no worker should get less than half or more than twice its share
+        share = SHARD_BUCKETS / 4
+        for n in counts.values():
+            self.assertGreater(n, share / 2)
+            self.assertLess(n, share * 2)
+
+
+class ShardMapTestCases(unittest.TestCase):
+    def test_workers_partition_the_buckets(self):
+        members = ["w1", "w2", "w3"]
+        owners = _ownership(members)
+        self.assertEqual(set(owners), set(range(SHARD_BUCKETS)))
+        self.assertEqual(set(owners.values()), set(members))
+
+    def test_join_only_moves_buckets_to_the_new_worker(self):
+        before = _ownership(["w1", "w2", "w3"])
+        after = _ownership(["w1", "w2", "w3", "w4"])
+        moved = {b for b in before if before[b] != after[b]}
+        self.assertTrue(moved)
+        self.assertEqual({after[b] for b in moved}, {"w4"})
+
+    def test_leave_only_moves_the_leaving_workers_buckets(self):
+        before = _ownership(["w1", "w2", "w3"])
+        after = _ownership(["w1", "w3"])
+        moved = {b for b in before if before[b] != after[b]}
+        self.assertEqual(moved, {b for b, m in before.items() if m == "w2"})
+
+    def test_update_reports_gained_and_lost(self):
+        shard_map = ShardMap("w1")
+        gained, lost = shard_map.update([])
+        self.assertEqual((gained, lost), (set(range(SHARD_BUCKETS)), set()))
+        self.assertEqual(shard_map.members, ["w1"])
+
+        generation = shard_map.generation
+        gained, lost = shard_map.update(["w2"])
+        self.assertEqual(gained, set())
+        self.assertEqual(lost, set(range(SHARD_BUCKETS)) - shard_map.owned)
+        self.assertEqual(shard_map.members, ["w1", "w2"])
+        self.assertEqual(shard_map.generation, generation + 1)
+
+    def test_unchanged_membership_is_a_no_op(self):
+        shard_map = ShardMap("w1")
+        shard_map.update(["w2", "w3"])
+        generation = shard_map.generation
+        self.assertEqual(shard_map.update(["w3", "w2", "w1"]), (set(), set()))
+        self.assertEqual(shard_map.generation, generation)
+
+    def test_release_gives_up_everything(self):
+        shard_map = ShardMap("w1")
+        shard_map.update(["w2"])
+        owned = set(shard_map.owned)
+        self.assertEqual(shard_map.release(), owned)
+        self.assertEqual(shard_map.owned, frozenset())
+        self.assertEqual(shard_map.claim_filter(), "false")
+        self.assertFalse(shard_map.owns("any-session"))
+
+    def test_owns_follows_shard_for(self):
+        shard_map = ShardMap("w1")
+        shard_map.update(["w2", "w3"])
+        for i in range(200):
+            session_id = f"session-{i}"
+            self.assertEqual(shard_map.owns(session_id), shard_for(session_id) in shard_map.owned)
+
+    def test_sessionless_rows_go_to_the_owner_of_bucket_0(self):
+        owners = _ownership(["w1", "w2", "w3"])
+        for m in ("w1", "w2", "w3"):
+            shard_map = ShardMap(m)
+            shard_map.update(["w1", "w2", "w3"])
+            self.assertEqual(shard_map.owns(None), owners[0] == m)
+            self.assertEqual("shard IS NULL" in shard_map.claim_filter(), owners[0] == m)
+
+    def test_claim_filter_lists_owned_buckets(self):
+        shard_map = ShardMap("w1")
+        shard_map.update(["w2"])
+        clause = shard_map.claim_filter()
+        listed = clause[clause.index("shard IN (") + len("shard IN ("):].split(")")[0]
+        self.assertEqual({int(b) for b in listed.split(", ")}, set(shard_map.owned))
+
+
+class ShardForTestCases(unittest.TestCase):
+    def test_no_session_has_no_bucket(self):
+        self.assertIsNone(shard_for(None))
+        self.assertIsNone(shard_for(""))
+
+    def test_bucket_is_stable_and_in_range(self):
+        self.assertEqual(shard_for("abc"), shard_for("abc"))
+        for i in range(500):
+            self.assertIn(shard_for(f"s{i}"), range(SHARD_BUCKETS))
+
+
+if __name__ == "__main__":
+    unittest.main()
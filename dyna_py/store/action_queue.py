@@ -1,11 +1,9 @@
 
-import lancedb
 import uuid
 from datetime import datetime, timezone
 
-from schemas import AGENTS_URI, QUEUE_NAME
-
-AGENTS_DB = lancedb.connect(AGENTS_URI)
+from .schemas import QUEUE_NAME
+from .db import open_async_table, run_sync
 
 
 # --------------------
@@ -13,7 +11,7 @@ AGENTS_DB = lancedb.connect(AGENTS_URI)
 # --------------------
 
 
-def create_action(
+async def create_action_async(
     action_type: str,
     actor: str,
     payload: str = None,
@@ -24,7 +22,7 @@ def create_action(
     action_id: str = None,
     created_at: str = None,
 ):
-    queue_tbl = AGENTS_DB.open_table(QUEUE_NAME)
+    queue_tbl = await open_async_table(QUEUE_NAME)
     record = {
         "action_id": action_id or str(uuid.uuid4()),
         "type": action_type,
@@ -36,18 +34,27 @@ def create_action(
         "payload": payload,
         "metadata": metadata,
     }
-    queue_tbl.add(data=[record], mode="append")
+    await queue_tbl.add([record], mode="append")
     print(f"Action '{action_type}' for actor '{actor}' queued.")
 
-def list_actions():
-    queue_tbl = AGENTS_DB.open_table(QUEUE_NAME)
-    df = queue_tbl.to_pandas()
+def create_action(action_type: str, actor: str, **kwargs):
+    return run_sync(create_action_async(action_type, actor, **kwargs))
+
+async def list_actions_async():
+    queue_tbl = await open_async_table(QUEUE_NAME)
+    df = await queue_tbl.to_pandas()
     print(df)
     return df.to_dict(orient="records")
 
+def list_actions():
+    return run_sync(list_actions_async())
+
+async def delete_all_actions_async():
+    queue_tbl = await open_async_table(QUEUE_NAME)
+    await queue_tbl.delete("1 == 1")
+
 def delete_all_actions():
-    queue_tbl = AGENTS_DB.open_table(QUEUE_NAME)
-    queue_tbl.delete("1 == 1")
+    return run_sync(delete_all_actions_async())
 
 if __name__ == "__main__":
     create_action("create_agent", "user")
@@ -1,23 +1,27 @@
-import lancedb
 import json
 
 from .schemas import AGENTS_URI, AGENTS_CONFIG_NAME
 
-AGENTS_DB = lancedb.connect(AGENTS_URI)
+from .db import open_async_table, run_sync
+from .table_versions import note_write
 
-def create_agent_config(agent_id, agent_type, agent_description="", agents_metadata=None):
-    tbl = AGENTS_DB.open_table(AGENTS_CONFIG_NAME)
+async def create_agent_config_async(agent_id, agent_type, agent_description="", agents_metadata=None):
+    tbl = await open_async_table(AGENTS_CONFIG_NAME)
     record = {
         "agent_id": agent_id,
         "agent_type": agent_type,
         "agent_description": agent_description,
         "agents_metadata": json.dumps(agents_metadata) if agents_metadata else None,
     }
-    tbl.add(data=[record], mode="append")
+    await tbl.add([record], mode="append")
+    note_write(AGENTS_CONFIG_NAME)
     print(f"AgentConfig for {agent_id} ({agent_type}) created.")
 
-def update_agent_config(agent_id, agent_type=None, agent_description=None, agents_metadata=None):
-    tbl = AGENTS_DB.open_table(AGENTS_CONFIG_NAME)
+def create_agent_config(agent_id, agent_type, agent_description="", agents_metadata=None):
+    return run_sync(create_agent_config_async(agent_id, agent_type, agent_description, agents_metadata))
+
+async def update_agent_config_async(agent_id, agent_type=None, agent_description=None, agents_metadata=None):
+    tbl = await open_async_table(AGENTS_CONFIG_NAME)
     updates = {}
     if agent_type is not None: updates["agent_type"] = agent_type
     if agent_description is not None: updates["agent_description"] = agent_description
@@ -25,20 +29,30 @@ def update_agent_config(agent_id, agent_type=None, agent_description=None, agent
     if not updates:
         print("No updates provided.")
         return
-    count = tbl.update(where=f"agent_id == '{agent_id}'", updates=updates)
+    res = await tbl.update(updates, where=f"agent_id == '{agent_id}'")
+    note_write(AGENTS_CONFIG_NAME)
+    count = getattr(res, "rows_updated", res)
     print(f"Updated {count} AgentConfig record(s) for {agent_id}.")
 
-def delete_agent_config(agent_id):
-    tbl = AGENTS_DB.open_table(AGENTS_CONFIG_NAME)
-    count = tbl.delete(where=f"agent_id == '{agent_id}'")
+def update_agent_config(agent_id, agent_type=None, agent_description=None, agents_metadata=None):
+    return run_sync(update_agent_config_async(agent_id, agent_type, agent_description, agents_metadata))
+
+async def delete_agent_config_async(agent_id):
+    tbl = await open_async_table(AGENTS_CONFIG_NAME)
+    res = await tbl.delete(f"agent_id == '{agent_id}'")
+    note_write(AGENTS_CONFIG_NAME)
+    count = getattr(res, "num_deleted_rows", res)
     print(f"Deleted {count} AgentConfig record(s) for {agent_id}.")
 
-def list_agent_configs(agent_type="JokeAgent"):
-    tbl = AGENTS_DB.open_table(AGENTS_CONFIG_NAME)
+def delete_agent_config(agent_id):
+    return run_sync(delete_agent_config_async(agent_id))
+
+async def list_agent_configs_async(agent_type="JokeAgent"):
+    tbl = await open_async_table(AGENTS_CONFIG_NAME)
     if agent_type != "all":
-        df = tbl.search().where(f"agent_type = '{agent_type}'").to_pandas()
+        df = await tbl.query().where(f"agent_type = '{agent_type}'").to_pandas()
     else:
-        df = tbl.search().to_pandas()
+        df = await tbl.query().to_pandas()
 
     if df.empty:
         print("No agent configs found.")
@@ -55,9 +69,12 @@ def list_agent_configs(agent_type="JokeAgent"):
         })
     return configs
 
+def list_agent_configs(agent_type="JokeAgent"):
+    return run_sync(list_agent_configs_async(agent_type))
 
 
-def upsert_agent_config(agent_id, agent_type, agent_description: str = "", agents_metadata=None):
+
+async def upsert_agent_config_async(agent_id, agent_type, agent_description: str = "", agents_metadata=None):
     """
     Upsert an agent config by agent_id. If a record exists, update it; otherwise create a new one.
     - agents_metadata may be dict/list (will be json-dumped) or a JSON string. If it's a string,
@@ -66,7 +83,7 @@ def upsert_agent_config(agent_id, agent_type, agent_description: str = "", agent
     """
     import json
     from .schemas import AGENTS_CONFIG_NAME
-    tbl = AGENTS_DB.open_table(AGENTS_CONFIG_NAME)
+    tbl = await open_async_table(AGENTS_CONFIG_NAME)
 
 
     # Normalize metadata to a JSON string for storage
@@ -100,7 +117,7 @@ def upsert_agent_config(agent_id, agent_type, agent_description: str = "", agent
         where = f"agent_id == '{agent_id}'"
         print(where)
 
-        updated = tbl.update(where=where, values=updates)
+        updated = await tbl.update(updates, where=where)
         # Some LanceDB versions return an object; others return an int. Coerce to int if possible.
         try:
             rows_updated = int(getattr(updated, "rows_updated", updated))
@@ -114,6 +131,7 @@ def upsert_agent_config(agent_id, agent_type, agent_description: str = "", agent
         rows_updated = 0
 
     if rows_updated and rows_updated > 0:
+        note_write(AGENTS_CONFIG_NAME)
         print(f"Upsert updated {rows_updated} record(s) for {agent_id}.")
         return "updated"
 
@@ -124,10 +142,14 @@ def upsert_agent_config(agent_id, agent_type, agent_description: str = "", agent
         "agent_description": agent_description,
         "agents_metadata": meta_str,
     }
-    tbl.add([rec], mode="append")
+    await tbl.add([rec], mode="append")
+    note_write(AGENTS_CONFIG_NAME)
     print(f"Upsert created agent config for {agent_id}.")
     return "created"
 
+def upsert_agent_config(agent_id, agent_type, agent_description: str = "", agents_metadata=None):
+    return run_sync(upsert_agent_config_async(agent_id, agent_type, agent_description, agents_metadata))
+
 
 
 
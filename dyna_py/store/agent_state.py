@@ -1,11 +1,10 @@
-import lancedb
 import pyarrow as pa
 from datetime import datetime, timezone
 import json
-import pandas as pd
 
-from .schemas import AGENT_STATE_NAME, AGENTS_URI
-AGENTS_DB = lancedb.connect(AGENTS_URI)
+from .schemas import AGENT_STATE_NAME, AGENT_STATE_SCHEMA, AGENTS_URI
+from .db import open_async_table, run_sync
+from .table_versions import note_write
 
 
 def _safe_json_loads(s, *, default_if_fail=None):
@@ -18,8 +17,8 @@ def _safe_json_loads(s, *, default_if_fail=None):
     except Exception:
         return default_if_fail if default_if_fail is not None else s
 
-def upsert_agent_state(agent_id, status,*, iteration=None, result=None, context=None, history=None,session_id: str | None = None,):
-    tbl = AGENTS_DB.open_table(AGENT_STATE_NAME)
+async def upsert_agent_state_async(agent_id, status,*, iteration=None, result=None, context=None, history=None,session_id: str | None = None,):
+    tbl = await open_async_table(AGENT_STATE_NAME)
     now = datetime.now(timezone.utc).isoformat()
 
     updates = {
@@ -39,7 +38,8 @@ def upsert_agent_state(agent_id, status,*, iteration=None, result=None, context=
         where += " and session_id IS NULL"
 
     try:
-        count = tbl.update(where=where, updates=updates)
+        res = await tbl.update(updates, where=where)
+        count = getattr(res, "rows_updated", 0)
     except Exception:
         count = 0
 
@@ -54,49 +54,108 @@ def upsert_agent_state(agent_id, status,*, iteration=None, result=None, context=
             "history": json.dumps(history) if history is not None else None,
             "context": json.dumps(context) if context is not None else None,
         }
-        tbl.add(data=[rec], mode="append")
+        await tbl.add([rec], mode="append")
+    note_write(AGENT_STATE_NAME)
     print(f"Agent {agent_id} session={session_id} state={status} iter={iteration} @ {now}")
 
-def get_agent_state(agent_id, session_id: str | None = None):
-    tbl = AGENTS_DB.open_table(AGENT_STATE_NAME)
-    df = tbl.to_pandas().query(f"agent_id == '{agent_id}'")
-    if df.empty:
+def upsert_agent_state(agent_id, status,*, iteration=None, result=None, context=None, history=None,session_id: str | None = None,):
+    return run_sync(upsert_agent_state_async(agent_id, status, iteration=iteration, result=result, context=context, history=history, session_id=session_id))
+
+def build_agent_state_record(agent_id, status, *, session_id=None, iteration=None, result=None, context=None, history=None, last_updated=None):
+    return {
+        "agent_id": agent_id,
+        "session_id": session_id,
+        "status": status,
+        "iteration": int(iteration) if iteration is not None else None,
+        "result": json.dumps(result) if isinstance(result, (dict, list)) else result,
+        "last_updated": last_updated or datetime.now(timezone.utc).isoformat(),
+        "history": json.dumps(history) if history else None,
+        "context": json.dumps(context) if context else None,
+    }
+
+async def upsert_agent_states_async(records: list[dict]) -> int:
+    """
+    Bulk upsert of full agent_state rows keyed by (agent_id, session_id) in one merge-insert
+    (one table version for the whole batch). Records come from build_agent_state_record.
+
+    A NULL session_id never equals anything in the merge join, so records without a
+    session would be appended again on every flush; they go through an update on
+    `session_id IS NULL` instead, as in upsert_agent_state_async, and are added only
+    if no row was updated.
+    """
+    if not records:
+        return 0
+    tbl = await open_async_table(AGENT_STATE_NAME)
+    keyed = [r for r in records if r.get("session_id") is not None]
+    if keyed:
+        data = pa.Table.from_pylist(keyed, schema=AGENT_STATE_SCHEMA)
+        await (
+            tbl.merge_insert(["agent_id", "session_id"])
+            .when_matched_update_all()
+            .when_not_matched_insert_all()
+            .execute(data)
+        )
+    # Legacy session-less rows: one per agent, the last record of the batch wins
+    unkeyed = {r["agent_id"]: r for r in records if r.get("session_id") is None}
+    missing = []
+    for agent_id, rec in unkeyed.items():
+        updates = {k: v for k, v in rec.items() if k not in ("agent_id", "session_id")}
+        try:
+            res = await tbl.update(updates, where=f"agent_id == '{agent_id}' and session_id IS NULL")
+            count = getattr(res, "rows_updated", 0)
+        except Exception:
+            count = 0
+        if not count:
+            missing.append(rec)
+    if missing:
+        await tbl.add(pa.Table.from_pylist(missing, schema=AGENT_STATE_SCHEMA), mode="append")
+    note_write(AGENT_STATE_NAME)
+    return len(keyed) + len(unkeyed)
+
+def upsert_agent_states(records: list[dict]) -> int:
+    return run_sync(upsert_agent_states_async(records))
+
+STATE_COLUMNS = ["agent_id", "session_id", "status", "iteration", "result", "last_updated", "history", "context"]
+
+async def get_agent_state_async(agent_id, session_id: str | None = None):
+    # Point lookup: filter and projection are pushed into LanceDB (agent_id/session_id are
+    # BTREE-indexed, see schemas.ensure_scalar_indexes), so cost tracks matches, not history.
+    tbl = await open_async_table(AGENT_STATE_NAME)
+    where = f"agent_id == '{agent_id}'"
+    if session_id is not None:
+        where += f" and session_id == '{session_id}'"
+    # Arrow rows rather than a DataFrame: this runs on the agent event loop, and
+    # building a DataFrame per lookup is most of the cost when many sessions start at once.
+    rows = (await tbl.query().where(where).select(STATE_COLUMNS).to_arrow()).to_pylist()
+    if not rows:
         return None
-    if session_id is not None and "session_id" in df.columns:
-        sdf = df.query(f"agent_id == '{agent_id}' and session_id == '{session_id}'")
-        if sdf.empty:
-            return None
-        row = sdf.sort_values("last_updated").iloc[-1]
-    else:
-        # legacy fallback: most recent row by agent_id (session_id may be null or absent)
-        sdf = df.query(f"agent_id == '{agent_id}'")
-        if sdf.empty:
-            return None
-        # sort by last_updated if present
-        if "last_updated" in sdf.columns:
-            try:
-                sdf["last_updated_dt"] = pd.to_datetime(sdf["last_updated"], errors="coerce")
-                sdf = sdf.sort_values("last_updated_dt")
-            except Exception:
-                pass
-        row = sdf.iloc[-1]
+    # Most recent row (without session_id: the legacy fallback across the agent's rows).
+    # last_updated is a UTC isoformat() string, so it orders lexicographically.
+    row = max(rows, key=lambda r: r["last_updated"] or "")
 
     return {
-        "agent_id": row.agent_id,
-        "session_id": getattr(row, "session_id", None) if hasattr(row, "session_id") else None,
-        "status": row.status,
-        "iteration": row.iteration,
-        "result": _safe_json_loads(getattr(row, "result", None), default_if_fail=getattr(row, "result", None)),
-        "last_updated": row.last_updated,
-        "history": _safe_json_loads(getattr(row, "history", None), default_if_fail=[]),
-        "context": _safe_json_loads(getattr(row, "context", None), default_if_fail={}),
+        "agent_id": row["agent_id"],
+        "session_id": row["session_id"],
+        "status": row["status"],
+        "iteration": row["iteration"],
+        "result": _safe_json_loads(row["result"], default_if_fail=row["result"]),
+        "last_updated": row["last_updated"],
+        "history": _safe_json_loads(row["history"], default_if_fail=[]),
+        "context": _safe_json_loads(row["context"], default_if_fail={}),
     }
 
 
-def list_agent_states():
-    tbl = AGENTS_DB.open_table(AGENT_STATE_NAME)
-    df = tbl.to_pandas()
+def get_agent_state(agent_id, session_id: str | None = None):
+    return run_sync(get_agent_state_async(agent_id, session_id))
+
+
+async def list_agent_states_async():
+    tbl = await open_async_table(AGENT_STATE_NAME)
+    df = await tbl.to_pandas()
     if df.empty:
         return []
     return df
 
+def list_agent_states():
+    return run_sync(list_agent_states_async())
+
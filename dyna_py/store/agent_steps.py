@@ -1,11 +1,13 @@
-import lancedb, uuid, json
+import uuid, json
+import pyarrow as pa
 from datetime import datetime, timezone
-from .schemas import AGENTS_URI, AGENT_STEPS_NAME
+from .schemas import AGENTS_URI, AGENT_STEPS_NAME, AGENT_STEPS_SCHEMA
 import json as _json
 from ws_bus import emit_run_update
+from .run_stream import RUN_STREAMS, step_delta
+from .table_versions import note_write
 
-
-AGENTS_DB = lancedb.connect(AGENTS_URI)
+from .db import open_async_table, run_sync
 JSON_FIELDS = ("data", "state", "guidance")
 
 
@@ -78,7 +80,7 @@ def _normalize_rows(df):
         out.append(r)
     return out
 
-def list_agent_steps(
+async def list_agent_steps_async(
     *,
     session_id: str | None = None,
     agent_id: str | None = None,
@@ -94,7 +96,7 @@ def list_agent_steps(
     Returns a list of agent step rows filtered by the provided criteria.
     Ordering is by iteration, ascending by default.
     """
-    tbl = AGENTS_DB.open_table(AGENT_STEPS_NAME)
+    tbl = await open_async_table(AGENT_STEPS_NAME)
     where = _build_where(
         session_id=session_id,
         agent_id=agent_id,
@@ -105,11 +107,11 @@ def list_agent_steps(
     )
     # LanceDB doesn't support offset directly; fetch a window and slice in pandas.
     fetch_n = max(limit + offset, limit)
-    q = tbl.search()
+    q = tbl.query()
     if where:
         q = q.where(where)
     # Fetch to pandas then sort and slice
-    df = q.limit(fetch_n).to_pandas()
+    df = await q.limit(fetch_n).to_pandas()
     if df is None or df.empty:
         return []
 # Order by iteration; created_at is a tiebreaker
@@ -121,7 +123,11 @@ def list_agent_steps(
         df = df.iloc[:limit]
     return _normalize_rows(df)
 
-def list_agent_steps_since_iteration(
+def list_agent_steps(**filters):
+    """Sync facade for list_agent_steps_async (same keyword arguments)."""
+    return run_sync(list_agent_steps_async(**filters))
+
+async def list_agent_steps_since_iteration_async(
     *,
     session_id: str,
     after_iteration: int,
@@ -131,14 +137,17 @@ def list_agent_steps_since_iteration(
     """
     Convenience: get steps strictly after the given iteration for a session.
     """
-    return list_agent_steps(
+    return await list_agent_steps_async(
     session_id=session_id,
     min_iteration=after_iteration + 1,
     limit=limit,
     order=order,
     )
 
-def list_agent_steps_latest(
+def list_agent_steps_since_iteration(**kwargs):
+    return run_sync(list_agent_steps_since_iteration_async(**kwargs))
+
+async def list_agent_steps_latest_async(
     *,
     session_id: str | None = None,
     agent_id: str | None = None,
@@ -147,18 +156,21 @@ def list_agent_steps_latest(
     """
     Convenience: latest N steps for a session or agent.
     """
-    return list_agent_steps(
+    return await list_agent_steps_async(
     session_id=session_id,
     agent_id=agent_id,
     limit=limit,
     order="desc",
     )
 
+def list_agent_steps_latest(**kwargs):
+    return run_sync(list_agent_steps_latest_async(**kwargs))
 
 
 
 
-def append_agent_step(
+
+def build_step_record(
     agent_id: str,
     iteration: int,
     *,
@@ -173,9 +185,8 @@ def append_agent_step(
     notes: str | None = None,
     latency_ms: int | None = None,
     error: str | None = None,
-):
-    tbl = AGENTS_DB.open_table(AGENT_STEPS_NAME)
-    rec = {
+) -> dict:
+    return {
     "id": str(uuid.uuid4()),
     "created_at": datetime.now(timezone.utc).isoformat(),
     "agent_id": agent_id,
@@ -191,15 +202,44 @@ def append_agent_step(
     "notes": notes,
     "latency_ms": latency_ms,
     "error": error,
+    "seq": None,
     }
-    tbl.add([rec], mode="append")
-
-    # Notify subscribed UI clients
-    run_id = f"{agent_id}::{session_id or ''}"
-    payload = {
-        "run_id": run_id,
-        "last_text": text,
-        "timestamp": rec["created_at"],
-    }
-    print(f"now emitting: {payload}")
-    emit_run_update(run_id, payload)
+
+
+async def build_step_record_async(agent_id: str, iteration: int, **fields) -> dict:
+    """build_step_record, numbered with the run's next step seq."""
+    rec = build_step_record(agent_id, iteration, **fields)
+    rec["seq"] = await RUN_STREAMS.next_seq(agent_id, rec["session_id"])
+    return rec
+
+
+def emit_step_update(rec: dict):
+    # Notify subscribed UI clients; the delta is kept for since_seq replays
+    delta = step_delta(rec)
+    RUN_STREAMS.record(delta)
+    note_write(AGENT_STEPS_NAME)   # snapshots read the ring before the row is flushed
+    emit_run_update(delta["run_id"], delta)   # coalesced per run by ws_bus
+
+
+async def append_agent_steps_async(records: list[dict]) -> int:
+    """Write many step rows with a single add (one Arrow batch, one table version)."""
+    if not records:
+        return 0
+    tbl = await open_async_table(AGENT_STEPS_NAME)
+    await tbl.add(pa.Table.from_pylist(records, schema=AGENT_STEPS_SCHEMA), mode="append")
+    return len(records)
+
+
+def append_agent_steps(records: list[dict]) -> int:
+    return run_sync(append_agent_steps_async(records))
+
+
+async def append_agent_step_async(agent_id: str, iteration: int, **fields):
+    rec = await build_step_record_async(agent_id, iteration, **fields)
+    tbl = await open_async_table(AGENT_STEPS_NAME)
+    await tbl.add([rec], mode="append")
+    emit_step_update(rec)
+
+
+def append_agent_step(agent_id: str, iteration: int, **fields):
+    return run_sync(append_agent_step_async(agent_id, iteration, **fields))
@@ -3,16 +3,21 @@ import json
 from typing import Optional, Literal, Dict, Any, List
 from datetime import datetime, timezone
 
-import lancedb
 import pandas as pd
 
 from .schemas import AGENTS_URI, CONVERSATIONS_NAME, PARTICIPANTS_NAME, MESSAGES_NAME
+from .roster import ROSTER
+from .messages import page_messages_async
+from .summaries import SUMMARIES, get_conversation_summaries_async
+from .search import matching_conversation_ids_async
 import math
 
-DB = lancedb.connect(AGENTS_URI)
+from .db import open_async_table, run_sync
+from .table_versions import note_write
 
 VALID_CONVERSATION_STATUSES = {"active", "ended", "archived"}
 ORDER_VALUES = {"asc", "desc"}
+MESSAGE_PAGE_COLUMNS = ["message_id", "conversation_id", "author_id", "role", "text", "created_at", "reply_to", "meta"]
 
 def _is_nan(v):
     try:
@@ -46,36 +51,50 @@ def _loads_or(obj, default):
 
 
 
-def create_conversation(title: Optional[str] = None) -> str:
+async def create_conversation_async(title: Optional[str] = None) -> str:
     cid = str(uuid.uuid4())
-    DB.open_table(CONVERSATIONS_NAME).add([{
+    await (await open_async_table(CONVERSATIONS_NAME)).add([{
     "conversation_id": cid,
     "title": (title or f"Conversation {cid[:8]}").strip(),
     "status": "active",
     "created_at": _now_iso(),
     }])
+    note_write(CONVERSATIONS_NAME)
     return cid
 
-def set_conversation_status(conversation_id: str, status: str) -> int:
+def create_conversation(title: Optional[str] = None) -> str:
+    return run_sync(create_conversation_async(title))
+
+async def set_conversation_status_async(conversation_id: str, status: str) -> int:
     if status not in VALID_CONVERSATION_STATUSES:
         raise ValueError(f"Invalid status: {status}. Allowed: {sorted(VALID_CONVERSATION_STATUSES)}")
-    res = DB.open_table(CONVERSATIONS_NAME).update(
+    res = await (await open_async_table(CONVERSATIONS_NAME)).update(
+    {"status": status},
     where=f"conversation_id == '{_escape(conversation_id)}'",
-    values={"status": status},
     )
+    note_write(CONVERSATIONS_NAME)
     return getattr(res, "rows_updated", 0)
 
-def add_participant(conversation_id: str, agent_id: str, session_id: str, persona_config: dict | None = None) -> int:
-    DB.open_table(PARTICIPANTS_NAME).add([{
+def set_conversation_status(conversation_id: str, status: str) -> int:
+    return run_sync(set_conversation_status_async(conversation_id, status))
+
+async def add_participant_async(conversation_id: str, agent_id: str, session_id: str, persona_config: dict | None = None) -> int:
+    await (await open_async_table(PARTICIPANTS_NAME)).add([{
     "conversation_id": conversation_id,
     "agent_id": agent_id,
     "session_id": session_id,
     "persona_config": json.dumps(persona_config or {}),
     "joined_at": _now_iso(),
     }])
+    ROSTER.on_participant_added(conversation_id, agent_id, session_id)
+    SUMMARIES.note_participant(conversation_id)
+    note_write(PARTICIPANTS_NAME)
     return 1
 
-def conversations(
+def add_participant(conversation_id: str, agent_id: str, session_id: str, persona_config: dict | None = None) -> int:
+    return run_sync(add_participant_async(conversation_id, agent_id, session_id, persona_config))
+
+async def conversations_async(
     status: Optional[str] = "all",
     limit: int = 100,
     offset: int = 0,
@@ -92,13 +111,13 @@ def conversations(
     if order not in ORDER_VALUES:
         raise ValueError(f"order must be one of {sorted(ORDER_VALUES)}")
 
-    q = DB.open_table(CONVERSATIONS_NAME).search()
+    q = (await open_async_table(CONVERSATIONS_NAME)).query()
     if status and status != "all":
         if status not in VALID_CONVERSATION_STATUSES:
             raise ValueError(f"Invalid status: {status}. Allowed: {sorted(VALID_CONVERSATION_STATUSES)}")
         q = q.where(f"status == '{_escape(status)}'")
 
-    df = q.to_pandas()
+    df = await q.to_pandas()
     total = int(len(df))
 
     if df.empty:
@@ -138,7 +157,7 @@ def conversations(
         cids = [i["conversation_id"] for i in items]
         # Build an OR where clause for small pages
         or_clause = " OR ".join([f"conversation_id == '{_escape(cid)}'" for cid in cids])
-        part_df = DB.open_table(PARTICIPANTS_NAME).search().where(or_clause).to_pandas()
+        part_df = await (await open_async_table(PARTICIPANTS_NAME)).query().where(or_clause).to_pandas()
         if not part_df.empty:
             # Parse persona_config JSON safely
             def _to_json(val):
@@ -181,53 +200,53 @@ def conversations(
         },
     }
 
-def list_conversations_for_window(
+def conversations(*args, **kwargs) -> Dict[str, Any]:
+    return run_sync(conversations_async(*args, **kwargs))
+
+async def list_conversations_for_window_async(
     status: str | None = "all",
     q: str | None = None,
     limit: int = 100,
     offset: int = 0,
     order: str = "desc",  # by updated_at
 ):
-    conv_tbl = DB.open_table(CONVERSATIONS_NAME)
-    msg_tbl = DB.open_table(MESSAGES_NAME)
-    q_conv = conv_tbl.search()
+    """
+    Conversations for the sidebar, newest activity first. Last-message time and
+    preview come from conversation_summaries (store.summaries), one row per
+    conversation, rather than from the messages table.
+    """
+    conv_tbl = await open_async_table(CONVERSATIONS_NAME)
+    q_conv = conv_tbl.query()
     if status and status != "all":
         q_conv = q_conv.where(f"status == '{status}'")       # FIXME FOR PROD
-    conv_df = q_conv.to_pandas()
+    conv_df = await q_conv.to_pandas()
 
     if conv_df.empty:
         return []
 
     conv_df["created_at"] = pd.to_datetime(conv_df["created_at"], errors="coerce")
 
-    try:
-        msg_df = msg_tbl.search().to_pandas()
-    except Exception:
-        msg_df = pd.DataFrame()
-
-    if not msg_df.empty:
-        msg_df["created_at"] = pd.to_datetime(msg_df["created_at"], errors="coerce")
-        msg_df = msg_df.sort_values("created_at")
-        last_msg = msg_df.drop_duplicates(subset=["conversation_id"], keep="last")
-        last_msg = last_msg[["conversation_id", "created_at", "text"]].rename(
-            columns={"created_at": "last_msg_at", "text": "preview"}
+    summaries = await get_conversation_summaries_async()
+    if summaries:
+        sum_df = pd.DataFrame.from_records(
+            [(cid, s["last_msg_at"], s["preview"], s["message_count"], s["participant_count"]) for cid, s in summaries.items()],
+            columns=["conversation_id", "last_msg_at", "preview", "message_count", "participant_count"],
         )
-        merged = conv_df.merge(last_msg, on="conversation_id", how="left")
+        sum_df["last_msg_at"] = pd.to_datetime(sum_df["last_msg_at"], errors="coerce")
+        merged = conv_df.merge(sum_df, on="conversation_id", how="left")
     else:
         merged = conv_df.copy()
         merged["last_msg_at"] = pd.NaT
         merged["preview"] = ""
+        merged["message_count"] = 0
+        merged["participant_count"] = 0
 
     merged["updated_at"] = merged["last_msg_at"].fillna(merged["created_at"])
 
-    # Optional search
-    if q:
-        ql = q.strip().lower()
-        merged["__t"] = (merged["title"].fillna("").astype(str).str.lower()) + " " + (
-            merged["preview"].fillna("").astype(str).str.lower()
-        )
-        merged = merged[merged["__t"].str.contains(ql, na=False)]
-        merged = merged.drop(columns=["__t"])
+    # Optional search: title or any message (FTS, store.search), not just the preview
+    if q and q.strip():
+        ids = await matching_conversation_ids_async(q.strip())
+        merged = merged[merged["conversation_id"].isin(ids)]
 
     # Ensure JSON-safe columns (no NaN/NaT)
     merged["preview"] = merged["preview"].astype(object)
@@ -258,50 +277,71 @@ def list_conversations_for_window(
             "updated_at": updated_at,
             "last_updated": updated_at,   # UI fallback
             "preview": preview,
+            "message_count": 0 if _is_nan(r.get("message_count")) else int(r.get("message_count")),
+            "participant_count": 0 if _is_nan(r.get("participant_count")) else int(r.get("participant_count")),
         })
     return items
 
-def get_conversation_messages_and_participants(
+def list_conversations_for_window(*args, **kwargs):
+    return run_sync(list_conversations_for_window_async(*args, **kwargs))
+
+def message_payload(r: dict) -> dict:
+    """A messages row as sent to the UI (HTTP pages and conversation pushes)."""
+    return {
+        "id": r.get("message_id"),
+        "message_id": r.get("message_id"),
+        "seq": r.get("seq"),
+        "conversation_id": r.get("conversation_id"),
+        "author_id": r.get("author_id"),
+        "role": r.get("role"),
+        "text": r.get("text") or "",
+        "created_at": r.get("created_at") or None,   # already ISO-8601 UTC
+        "reply_to": r.get("reply_to"),
+        "meta": _loads_or(r.get("meta"), default={}),
+    }
+
+
+async def get_conversation_messages_and_participants_async(
     conversation_id: str,
     *,
     limit: int = 500,
     offset: int = 0,
-    order: str = "asc",   # messages in time order
+    order: str = "asc",   # messages in seq (time) order
+    after_seq: int | None = None,
+    before_seq: int | None = None,
     ):
-    msg_tbl = DB.open_table(MESSAGES_NAME)
-    part_tbl = DB.open_table(PARTICIPANTS_NAME)
+    """
+    A page of messages plus the participants. Page with the seq keyset: pass
+    meta.next_after_seq (asc) / meta.next_before_seq (desc) back as after_seq /
+    before_seq; the cost is one page of rows however long the conversation is.
+    `offset` still works on top of the keyset but is no longer needed.
+    """
+    part_tbl = await open_async_table(PARTICIPANTS_NAME)
 
     # Messages
-    mdf = (
-        msg_tbl.search()
-        .where(f"conversation_id == '{_escape(conversation_id)}'")
-        .to_pandas()
+    rows, has_more = await page_messages_async(
+        conversation_id,
+        limit=limit,
+        order=order,
+        after_seq=after_seq,
+        before_seq=before_seq,
+        offset=offset,
+        columns=MESSAGE_PAGE_COLUMNS,
     )
-    if not mdf.empty:
-        mdf["created_at"] = pd.to_datetime(mdf["created_at"], errors="coerce")
-        mdf = mdf.sort_values("created_at", ascending=(order == "asc"))
-        if offset:
-            mdf = mdf.iloc[offset:]
-        if limit is not None:
-            mdf = mdf.iloc[:limit]
-    msgs = []
-    for _, r in mdf.iterrows():
-        ts = r.get("created_at")
-        msgs.append({
-            "id": r.get("message_id"),
-            "message_id": r.get("message_id"),
-            "conversation_id": r.get("conversation_id"),
-            "author_id": r.get("author_id"),
-            "role": r.get("role"),
-            "text": "" if _is_nan(r.get("text")) else r.get("text"),
-            "created_at": ts.isoformat() if pd.notna(ts) else None,
-            "reply_to": None if _is_nan(r.get("reply_to")) else r.get("reply_to"),
-            "meta": _loads_or(r.get("meta"), default={}),
-        })
+    msgs = [message_payload(r) for r in rows]
+    last_seq = msgs[-1]["seq"] if msgs else None
+    meta = {
+        "returned": len(msgs),
+        "limit": limit,
+        "order": order,
+        "has_more": has_more,
+        "next_after_seq": last_seq if (has_more and order == "asc") else None,
+        "next_before_seq": last_seq if (has_more and order == "desc") else None,
+    }
 
     # Participants
-    pdf = (
-        part_tbl.search()
+    pdf = await (
+        part_tbl.query()
         .where(f"conversation_id == '{_escape(conversation_id)}'")
         .to_pandas()
     )
@@ -316,26 +356,35 @@ def get_conversation_messages_and_participants(
             "joined_at": joined if isinstance(joined, str) else (joined.isoformat() if pd.notna(joined) else None),
         })
 
-    return {"messages": msgs, "participants": participants}
+    return {"messages": msgs, "participants": participants, "meta": meta}
 
+def get_conversation_messages_and_participants(conversation_id: str, **kwargs):
+    return run_sync(get_conversation_messages_and_participants_async(conversation_id, **kwargs))
 
 
-def participant_exists(conversation_id: str, agent_id: str, session_id: str) -> bool:
-    tbl = DB.open_table(PARTICIPANTS_NAME)
-    df = tbl.search().where(
+
+async def participant_exists_async(conversation_id: str, agent_id: str, session_id: str) -> bool:
+    tbl = await open_async_table(PARTICIPANTS_NAME)
+    df = await tbl.query().where(
     f"conversation_id == '{_escape(conversation_id)}' AND agent_id == '{_escape(agent_id)}' AND session_id == '{_escape(session_id)}'"
     ).to_pandas()
     return (df is not None) and (not df.empty)
 
-def add_participant_if_absent(conversation_id: str, agent_id: str, session_id: str, persona_config: dict | None = None) -> int:
-    if participant_exists(conversation_id, agent_id, session_id):
+def participant_exists(conversation_id: str, agent_id: str, session_id: str) -> bool:
+    return run_sync(participant_exists_async(conversation_id, agent_id, session_id))
+
+async def add_participant_if_absent_async(conversation_id: str, agent_id: str, session_id: str, persona_config: dict | None = None) -> int:
+    if await participant_exists_async(conversation_id, agent_id, session_id):
         return 0
-    return add_participant(conversation_id, agent_id, session_id, persona_config)
+    return await add_participant_async(conversation_id, agent_id, session_id, persona_config)
 
+def add_participant_if_absent(conversation_id: str, agent_id: str, session_id: str, persona_config: dict | None = None) -> int:
+    return run_sync(add_participant_if_absent_async(conversation_id, agent_id, session_id, persona_config))
 
-def list_participants(conversation_id: str) -> list[dict]:
-    tbl = DB.open_table(PARTICIPANTS_NAME)
-    df = tbl.search().where(f"conversation_id == '{conversation_id}'").to_pandas()
+
+async def list_participants_async(conversation_id: str) -> list[dict]:
+    tbl = await open_async_table(PARTICIPANTS_NAME)
+    df = await tbl.query().where(f"conversation_id == '{conversation_id}'").to_pandas()
     if df is None or df.empty:
         return []
     import json
@@ -358,4 +407,5 @@ def list_participants(conversation_id: str) -> list[dict]:
         })
     return out
 
-
+def list_participants(conversation_id: str) -> list[dict]:
+    return run_sync(list_participants_async(conversation_id))
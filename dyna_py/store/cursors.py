@@ -0,0 +1,38 @@
+from datetime import datetime, timezone
+
+import pyarrow as pa
+
+from .schemas import AGENTS_URI, CURSORS_NAME, CURSORS_SCHEMA
+from .db import open_async_table, async_table_names, create_async_table, run_sync
+
+
+async def _open_cursors():
+    if CURSORS_NAME in await async_table_names():
+        return await open_async_table(CURSORS_NAME)
+    print("creating cursors schema")
+    return await create_async_table(CURSORS_NAME, schema=CURSORS_SCHEMA)
+
+
+async def get_cursor_async(cursor_id: str) -> int | None:
+    tbl = await _open_cursors()
+    df = await tbl.query().where(f"cursor_id == '{cursor_id}'").select(["position"]).limit(1).to_pandas()
+    if df.empty:
+        return None
+    return int(df.iloc[0].position)
+
+
+def get_cursor(cursor_id: str) -> int | None:
+    return run_sync(get_cursor_async(cursor_id))
+
+
+async def set_cursor_async(cursor_id: str, position: int):
+    tbl = await _open_cursors()
+    rec = pa.Table.from_pylist(
+        [{"cursor_id": cursor_id, "position": int(position), "updated_at": datetime.now(timezone.utc).isoformat()}],
+        schema=CURSORS_SCHEMA,
+    )
+    await tbl.merge_insert("cursor_id").when_matched_update_all().when_not_matched_insert_all().execute(rec)
+
+
+def set_cursor(cursor_id: str, position: int):
+    return run_sync(set_cursor_async(cursor_id, position))
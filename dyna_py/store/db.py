@@ -0,0 +1,197 @@
+"""
+One LanceDB connection per process (sync) / per event loop (async), plus a
+cache of open table handles.
+
+Store modules used to connect at import and call open_table() on every
+operation (re-reading the manifest and schema each time). Everything now goes
+through `open_table(name)` / `await open_async_table(name)`, which hand out a
+warm handle. Handles see other writers' commits according to
+LANCEDB_READ_CONSISTENCY_S:
+- 0 (default): check for a newer version on every read (strong consistency,
+  same as opening fresh each time, which the queue claim relies on)
+- N > 0: refresh at most every N seconds (cheaper reads, bounded staleness)
+- unset/"none": never refresh on its own (only for single-writer setups)
+
+At most one handle per table per connection is held, so open file handles stay
+bounded. Dropping or re-creating a table must go through drop_table /
+create_table here (or call invalidate) so stale handles are discarded.
+
+Store functions are written against AsyncTable (`*_async`). The sync versions
+used by Flask routes and scripts are thin facades: run_sync() runs the
+coroutine on a dedicated background "store loop" thread and waits for it (the
+same bridge LanceDB's own sync API uses). on_store_loop() lets async callers
+run a section on that loop too, for state that must be serialised across
+event loops (see store.messages sequence allocation).
+"""
+import asyncio
+import os
+import threading
+from datetime import timedelta
+
+import lancedb
+from dotenv import load_dotenv
+load_dotenv()
+
+AGENTS_URI = os.getenv('AGENTS_URI')
+
+
+def _consistency_interval() -> timedelta | None:
+    raw = os.getenv("LANCEDB_READ_CONSISTENCY_S", "0").strip().lower()
+    if raw in ("", "none", "off"):
+        return None
+    return timedelta(seconds=float(raw))
+
+
+READ_CONSISTENCY_INTERVAL = _consistency_interval()
+
+_lock = threading.Lock()
+_sync_db = None
+_sync_tables: dict = {}                 # name -> LanceTable
+_async_dbs: dict = {}                   # id(loop) -> (loop, AsyncConnection)
+_async_tables: dict = {}                # (id(loop), name) -> AsyncTable
+
+
+def get_db():
+    """The process-wide sync connection."""
+    global _sync_db
+    if _sync_db is None:
+        with _lock:
+            if _sync_db is None:
+                _sync_db = lancedb.connect(AGENTS_URI, read_consistency_interval=READ_CONSISTENCY_INTERVAL)
+    return _sync_db
+
+
+def open_table(name: str):
+    """Cached sync handle for `name`."""
+    tbl = _sync_tables.get(name)
+    if tbl is not None:
+        return tbl
+    db = get_db()
+    with _lock:
+        tbl = _sync_tables.get(name)
+        if tbl is None:
+            tbl = db.open_table(name)
+            _sync_tables[name] = tbl
+    return tbl
+
+
+def table_names() -> list[str]:
+    return list(get_db().table_names())
+
+
+def create_table(name: str, **kwargs):
+    tbl = get_db().create_table(name, **kwargs)
+    invalidate(name)
+    with _lock:
+        _sync_tables[name] = tbl
+    return tbl
+
+
+def drop_table(name: str):
+    invalidate(name)
+    get_db().drop_table(name)
+
+
+def invalidate(name: str | None = None):
+    """Forget cached handles (all tables if name is None), sync and async."""
+    with _lock:
+        if name is None:
+            _sync_tables.clear()
+            _async_tables.clear()
+        else:
+            _sync_tables.pop(name, None)
+            for key in [k for k in _async_tables if k[1] == name]:
+                _async_tables.pop(key, None)
+
+
+async def get_async_db():
+    """The async connection for the running event loop."""
+    loop = asyncio.get_running_loop()
+    entry = _async_dbs.get(id(loop))
+    if entry is not None and entry[0] is loop:
+        return entry[1]
+    db = await lancedb.connect_async(AGENTS_URI, read_consistency_interval=READ_CONSISTENCY_INTERVAL)
+    with _lock:
+        # Drop connections (and their handles) that belonged to loops that have gone away
+        for key, (l, _) in list(_async_dbs.items()):
+            if l.is_closed() or key == id(loop):
+                _async_dbs.pop(key, None)
+                for tkey in [k for k in _async_tables if k[0] == key]:
+                    _async_tables.pop(tkey, None)
+        _async_dbs[id(loop)] = (loop, db)
+    return db
+
+
+async def open_async_table(name: str):
+    """Cached async handle for `name` on the running event loop."""
+    db = await get_async_db()
+    key = (id(asyncio.get_running_loop()), name)
+    tbl = _async_tables.get(key)
+    if tbl is None:
+        tbl = await db.open_table(name)
+        with _lock:
+            _async_tables[key] = tbl
+    return tbl
+
+
+async def async_table_names() -> list[str]:
+    db = await get_async_db()
+    return list(await db.table_names())
+
+
+async def create_async_table(name: str, **kwargs):
+    db = await get_async_db()
+    tbl = await db.create_table(name, **kwargs)
+    invalidate(name)
+    with _lock:
+        _async_tables[(id(asyncio.get_running_loop()), name)] = tbl
+    return tbl
+
+
+# --------------------
+# Sync facade
+# --------------------
+
+_store_loop: asyncio.AbstractEventLoop | None = None
+
+
+def _get_store_loop() -> asyncio.AbstractEventLoop:
+    global _store_loop
+    if _store_loop is None:
+        with _lock:
+            if _store_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="store-loop", daemon=True).start()
+                _store_loop = loop
+    return _store_loop
+
+
+def run_sync(coro):
+    """Run a store coroutine to completion from synchronous code."""
+    loop = _get_store_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("sync store call made from the store loop; await the *_async function instead")
+    fut = asyncio.run_coroutine_threadsafe(coro, loop)
+    try:
+        return fut.result()
+    except BaseException:
+        fut.cancel()
+        raise
+
+
+async def on_store_loop(coro):
+    """Await `coro` on the store loop (directly if we are already on it)."""
+    loop = _get_store_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
+def spawn_on_store_loop(coro):
+    """Start `coro` on the store loop without waiting for it (thread-safe)."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_store_loop())
@@ -0,0 +1,185 @@
+"""
+Housekeeping for the append-heavy tables.
+
+Agents tick every couple of seconds and every tick appends/updates rows, so
+`queue`, `agent_steps`, `agent_state` and `messages` accumulate tiny fragments
+and old versions. This module:
+- archives processed queue rows older than a retention window into `queue_archive`
+- compacts fragments and prunes old versions (Table.optimize), which also folds
+  new rows into the scalar / FTS / vector indexes; conversations, their summaries,
+  message embeddings and memory episodes are compacted too
+- builds the ANN indexes on message_embeddings / memory_episodes once they are
+  large enough (store.search, store.memories)
+- reports fragment/version counts before and after
+
+Run from agents.main via `maintenance_loop` (run_maintenance_async), or by hand:
+    python -m store.maintenance --queue-retention-hours 24 --version-retention-minutes 60
+"""
+import argparse
+import json
+import os
+from datetime import datetime, timezone, timedelta
+
+from .schemas import (
+    AGENTS_URI,
+    QUEUE_NAME,
+    QUEUE_ARCHIVE_NAME,
+    QUEUE_SCHEMA,
+    AGENT_STEPS_NAME,
+    AGENT_STATE_NAME,
+    MESSAGES_NAME,
+    CONVERSATIONS_NAME,
+    CONVERSATION_SUMMARIES_NAME,
+    MESSAGE_EMBEDDINGS_NAME,
+    MEMORY_EPISODES_NAME,
+)
+from .db import open_async_table, async_table_names, create_async_table, run_sync
+from .search import ensure_embedding_index_async
+from .memories import ensure_memory_index_async
+
+MAINTAINED_TABLES = (
+    QUEUE_NAME, AGENT_STEPS_NAME, AGENT_STATE_NAME, MESSAGES_NAME,
+    CONVERSATIONS_NAME, CONVERSATION_SUMMARIES_NAME, MESSAGE_EMBEDDINGS_NAME, MEMORY_EPISODES_NAME,
+)
+
+QUEUE_RETENTION = timedelta(hours=float(os.getenv("MAINT_QUEUE_RETENTION_HOURS", "24")))
+VERSION_RETENTION = timedelta(minutes=float(os.getenv("MAINT_VERSION_RETENTION_MINUTES", "60")))
+MAINTENANCE_INTERVAL_S = float(os.getenv("MAINT_INTERVAL_S", "3600"))
+ARCHIVE_DELETE_CHUNK = 1000   # action_ids per delete predicate
+
+
+async def _fragment_count(tbl) -> int | None:
+    try:
+        stats = await tbl.stats()
+        frag = stats["fragment_stats"] if isinstance(stats, dict) else stats.fragment_stats
+        return int(frag["num_fragments"] if isinstance(frag, dict) else frag.num_fragments)
+    except Exception:
+        return None
+
+
+async def _version_count(tbl) -> int | None:
+    try:
+        return len(await tbl.list_versions())
+    except Exception:
+        return None
+
+
+async def _open_archive():
+    if QUEUE_ARCHIVE_NAME in await async_table_names():
+        return await open_async_table(QUEUE_ARCHIVE_NAME)
+    print("creating queue archive schema")
+    return await create_async_table(QUEUE_ARCHIVE_NAME, schema=QUEUE_SCHEMA)
+
+
+def _sql_in(values) -> str:
+    return ", ".join("'" + str(v).replace("'", "''") + "'" for v in values)
+
+
+async def archive_processed_actions_async(retention: timedelta = QUEUE_RETENTION) -> int:
+    """Move processed queue rows created before now - retention into queue_archive."""
+    cutoff = (datetime.now(timezone.utc) - retention).isoformat()
+    queue_tbl = await open_async_table(QUEUE_NAME)
+    rows = await queue_tbl.query().where(f"processed == True AND created_at < '{cutoff}'").to_arrow()
+    if rows.num_rows == 0:
+        return 0
+    archive = await _open_archive()
+    # Align to the archive schema (older queue tables may order/lack lease columns)
+    archive_names = (await archive.schema()).names
+    await archive.add(rows.select([n for n in archive_names if n in rows.column_names]))
+    # Delete exactly the rows archived above: re-running the range filter would also
+    # take rows that were marked processed after the read, and lose them
+    ids = rows["action_id"].to_pylist()
+    for i in range(0, len(ids), ARCHIVE_DELETE_CHUNK):
+        await queue_tbl.delete(f"action_id IN ({_sql_in(ids[i:i + ARCHIVE_DELETE_CHUNK])})")
+    return rows.num_rows
+
+
+def archive_processed_actions(retention: timedelta = QUEUE_RETENTION) -> int:
+    return run_sync(archive_processed_actions_async(retention))
+
+
+async def compact_table_async(name: str, cleanup_older_than: timedelta = VERSION_RETENTION) -> dict:
+    """Compact fragments and prune versions older than `cleanup_older_than`."""
+    tbl = await open_async_table(name)
+    before = {"fragments": await _fragment_count(tbl), "versions": await _version_count(tbl)}
+    await tbl.optimize(cleanup_older_than=cleanup_older_than)
+    after = {"fragments": await _fragment_count(tbl), "versions": await _version_count(tbl)}
+    return {
+        "table": name,
+        "fragments_before": before["fragments"],
+        "fragments_after": after["fragments"],
+        "versions_before": before["versions"],
+        "versions_after": after["versions"],
+    }
+
+
+def compact_table(name: str, cleanup_older_than: timedelta = VERSION_RETENTION) -> dict:
+    return run_sync(compact_table_async(name, cleanup_older_than))
+
+
+async def run_maintenance_async(
+    *,
+    tables=MAINTAINED_TABLES,
+    queue_retention: timedelta = QUEUE_RETENTION,
+    version_retention: timedelta = VERSION_RETENTION,
+) -> dict:
+    started = datetime.now(timezone.utc)
+    report = {"started_at": started.isoformat(), "archived_actions": 0, "tables": []}
+
+    try:
+        report["archived_actions"] = await archive_processed_actions_async(queue_retention)
+    except Exception as e:
+        print(f"archive_processed_actions failed: {e}")
+        report["archive_error"] = str(e)
+
+    existing = set(await async_table_names())
+    for name in tables:
+        if name not in existing:
+            continue
+        try:
+            report["tables"].append(await compact_table_async(name, version_retention))
+        except Exception as e:
+            print(f"compact_table({name}) failed: {e}")
+            report["tables"].append({"table": name, "error": str(e)})
+
+    try:
+        report["ann_index_created"] = await ensure_embedding_index_async()
+    except Exception as e:
+        print(f"ensure_embedding_index failed: {e}")
+        report["ann_index_error"] = str(e)
+
+    try:
+        report["memory_ann_index_created"] = await ensure_memory_index_async()
+    except Exception as e:
+        print(f"ensure_memory_index failed: {e}")
+        report["memory_ann_index_error"] = str(e)
+
+    report["elapsed_ms"] = int((datetime.now(timezone.utc) - started).total_seconds() * 1000)
+    for t in report["tables"]:
+        if "error" not in t:
+            print(f"maintenance {t['table']}: fragments {t['fragments_before']} -> {t['fragments_after']}, "
+                  f"versions {t['versions_before']} -> {t['versions_after']}")
+    return report
+
+
+def run_maintenance(**kwargs) -> dict:
+    return run_sync(run_maintenance_async(**kwargs))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compact LanceDB tables and archive processed queue rows")
+    parser.add_argument("--tables", nargs="*", default=list(MAINTAINED_TABLES))
+    parser.add_argument("--queue-retention-hours", type=float, default=QUEUE_RETENTION.total_seconds() / 3600)
+    parser.add_argument("--version-retention-minutes", type=float, default=VERSION_RETENTION.total_seconds() / 60)
+    args = parser.parse_args(argv)
+
+    report = run_maintenance(
+        tables=args.tables,
+        queue_retention=timedelta(hours=args.queue_retention_hours),
+        version_retention=timedelta(minutes=args.version_retention_minutes),
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
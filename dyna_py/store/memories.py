@@ -1,15 +1,207 @@
+"""
+Episodic memory: compact summaries of stretches of a conversation, per agent.
+
+Each episode row holds a summary, salient points, topics and (when embeddings
+are on, see store.search) a vector of the summary. retrieve_episodes_async
+returns the episodes most relevant to a query, best first, packed into a token
+budget, so an agent can carry a long conversation in a few hundred tokens
+instead of rereading its history.
+
+Ranking is vector similarity (ANN once the table has SEARCH_ANN_MIN_ROWS rows,
+built by maintenance) when the table has a vector column and embeddings are
+enabled, and full text over the summary otherwise. The vector column is decided
+when the table is created: a table created without embeddings stays full-text.
+"""
+import json
+import uuid
+from datetime import datetime, timezone
+
+import pyarrow as pa
+
+from .schemas import MEMORY_EPISODES_NAME, memory_episodes_schema
+from .db import open_async_table, async_table_names, create_async_table, run_sync
+from .search import embeddings_enabled, embed_texts, ensure_ann_index_async, open_fts_table
+
+MEMORY_DEFAULT_K = 5
+MEMORY_DEFAULT_TOKEN_BUDGET = 800
+
+
+def _quote(value) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English; good enough for budgeting
+    return max(1, len(text or "") // 4)
+
+
+def _as_list(value) -> list[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        try:
+            parsed = json.loads(value)
+        except Exception:
+            parsed = [value]
+        value = parsed if isinstance(parsed, list) else [parsed]
+    return [str(v) for v in value if v is not None and str(v).strip()]
+
+
+def _iso(value) -> str | None:
+    if value is None:
+        return None
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def episode_text(ep: dict) -> str:
+    """What an episode contributes to a prompt (and what its token_count measures)."""
+    points = "".join(f"\n- {p}" for p in ep.get("salient_points") or [])
+    return f"{ep.get('summary') or ''}{points}"
+
+
+async def _open_episodes(dim: int | None = None, create: bool = False):
+    if MEMORY_EPISODES_NAME in await async_table_names():
+        return await open_async_table(MEMORY_EPISODES_NAME)
+    if not create:
+        return None
+    print("creating memory episodes schema")
+    return await create_async_table(MEMORY_EPISODES_NAME, schema=memory_episodes_schema(dim), exist_ok=True)
+
+
+async def add_memory_episode_async(
+        conversation_id,
+        agent_id,
+        session_id,
+        start_at,
+        end_at,
+        summary,
+        salient_points,
+        topics,
+        novelty_hint=None) -> str:
+    """Store one episode (embedding its summary when embeddings are on). Returns the episode_id."""
+    rec = {
+        "episode_id": str(uuid.uuid4()),
+        "conversation_id": conversation_id,
+        "agent_id": agent_id,
+        "session_id": session_id,
+        "start_at": _iso(start_at),
+        "end_at": _iso(end_at),
+        "summary": str(summary or ""),
+        "salient_points": _as_list(salient_points),
+        "topics": _as_list(topics),
+        "novelty_hint": float(novelty_hint) if novelty_hint is not None else None,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    rec["token_count"] = estimate_tokens(episode_text(rec))
+
+    tbl = await _open_episodes()
+    schema = await tbl.schema() if tbl is not None else None
+    has_vector = schema is not None and "vector" in schema.names
+    if (tbl is None or has_vector) and embeddings_enabled():
+        rec["vector"] = (await embed_texts([episode_text(rec)]))[0]
+    elif has_vector:
+        # Table created while embeddings were on, and they are off now: the vector column
+        # is required, so store a zero vector. The episode is still found by FTS retrieval.
+        rec["vector"] = [0.0] * schema.field("vector").type.list_size
+    if tbl is None:
+        tbl = await _open_episodes(len(rec["vector"]) if "vector" in rec else None, create=True)
+        schema = await tbl.schema()
+    await tbl.add(pa.Table.from_pylist([rec], schema=schema))
+    return rec["episode_id"]
+
 
 def add_memory_episode(
-        conversation_id, 
-        agent_id, 
-        session_id, 
-        start_at, 
-        end_at, 
-        summary, 
-        salient_points, 
-        topics, 
-        novelty_hint): 
-    pass
-
-def latest_episode(conversation_id, agent_id) -> dict | None :
-    pass
\ No newline at end of file
+        conversation_id,
+        agent_id,
+        session_id,
+        start_at,
+        end_at,
+        summary,
+        salient_points,
+        topics,
+        novelty_hint=None) -> str:
+    return run_sync(add_memory_episode_async(
+        conversation_id, agent_id, session_id, start_at, end_at, summary, salient_points, topics, novelty_hint))
+
+
+def _where(conversation_id, agent_id) -> str | None:
+    clauses = []
+    if conversation_id:
+        clauses.append(f"conversation_id == {_quote(conversation_id)}")
+    if agent_id:
+        clauses.append(f"agent_id == {_quote(agent_id)}")
+    return " AND ".join(clauses) or None
+
+
+EPISODE_COLUMNS = [
+    "episode_id", "conversation_id", "agent_id", "session_id", "start_at", "end_at",
+    "summary", "salient_points", "topics", "novelty_hint", "token_count", "created_at",
+]
+
+
+async def latest_episode_async(conversation_id, agent_id) -> dict | None:
+    tbl = await _open_episodes()
+    if tbl is None:
+        return None
+    rows = (await tbl.query().where(_where(conversation_id, agent_id)).select(EPISODE_COLUMNS).to_arrow()).to_pylist()
+    return max(rows, key=lambda r: (r["end_at"] or "", r["created_at"])) if rows else None
+
+
+def latest_episode(conversation_id, agent_id) -> dict | None:
+    return run_sync(latest_episode_async(conversation_id, agent_id))
+
+
+async def retrieve_episodes_async(
+    query: str,
+    *,
+    conversation_id: str | None = None,
+    agent_id: str | None = None,
+    k: int = MEMORY_DEFAULT_K,
+    token_budget: int | None = MEMORY_DEFAULT_TOKEN_BUDGET,
+) -> list[dict]:
+    """
+    Up to `k` episodes relevant to `query`, best first, whose token_counts fit in
+    `token_budget` together (an episode that doesn't fit is skipped, smaller ones
+    further down may still be taken). Each carries `score` (similarity or FTS score).
+    """
+    tbl = await _open_episodes()
+    if tbl is None or not (query or "").strip():
+        return []
+    where = _where(conversation_id, agent_id)
+    # Over-fetch so the budget can skip large episodes and still fill k
+    n = k * 3
+    if "vector" in (await tbl.schema()).names and embeddings_enabled():
+        vec = (await embed_texts([query]))[0]
+        q = tbl.query().nearest_to(vec).distance_type("cosine").select([*EPISODE_COLUMNS, "_distance"])
+        if where:
+            q = q.where(where)
+        rows = (await q.limit(n).to_arrow()).to_pylist()
+        for r in rows:
+            r["score"] = 1.0 - r.pop("_distance")
+    else:
+        tbl = await open_fts_table(MEMORY_EPISODES_NAME)
+        q = tbl.query().nearest_to_text(query, columns="summary").select([*EPISODE_COLUMNS, "_score"])
+        if where:
+            q = q.where(where)
+        rows = (await q.limit(n).to_arrow()).to_pylist()
+        for r in rows:
+            r["score"] = r.pop("_score")
+
+    out, used = [], 0
+    for r in rows:
+        cost = int(r["token_count"] or 0)
+        if token_budget is not None and used + cost > token_budget:
+            continue
+        out.append(r)
+        used += cost
+        if len(out) >= k:
+            break
+    return out
+
+
+def retrieve_episodes(query: str, **kwargs) -> list[dict]:
+    return run_sync(retrieve_episodes_async(query, **kwargs))
+
+
+async def ensure_memory_index_async() -> bool:
+    return await ensure_ann_index_async(MEMORY_EPISODES_NAME)
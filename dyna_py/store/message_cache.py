@@ -0,0 +1,157 @@
+"""
+In-memory window of recent messages, keyed by conversation_id.
+
+PersonaAgent used to re-read every message of its conversation on each tick
+(list_messages_since_async loads the whole conversation and filters in pandas),
+once per persona. Here each conversation gets one ring buffer of its last
+MESSAGE_WINDOW_SIZE messages, shared by every persona in this process that sits
+in it, plus the highest seq loaded into it.
+
+The buffer is filled from the tail of the conversation on first use and only
+grows incrementally afterwards: a refresh reads `seq > last_seq` for that one
+conversation. It refreshes when it may be behind:
+  - an append in this process (store.messages append hook) or a new_message
+    interrupt from fan-out (note()) announced a higher seq,
+  - or MESSAGE_WINDOW_MAX_AGE_S has passed since it last looked (messages from
+    writers that neither path saw).
+
+Readers whose cursor falls before the start of the buffer fall back to the
+store; a reader without a cursor starts from the buffer (the last
+MESSAGE_WINDOW_SIZE messages), never from the start of a long history.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from .messages import (
+    add_append_hook,
+    list_messages_after_seq_async,
+    list_recent_messages_async,
+    list_messages_since_async,
+)
+
+MESSAGE_WINDOW_SIZE = int(os.getenv("MESSAGE_WINDOW_SIZE", "200"))
+MESSAGE_WINDOW_MAX_AGE_S = float(os.getenv("MESSAGE_WINDOW_MAX_AGE_S", "10"))
+MESSAGE_WINDOW_MAX_CONVERSATIONS = int(os.getenv("MESSAGE_WINDOW_MAX_CONVERSATIONS", "1000"))
+
+
+class ConversationWindow:
+    __slots__ = ("conversation_id", "rows", "last_seq", "known_seq", "complete", "checked_at", "loaded", "lock")
+
+    def __init__(self, conversation_id: str, size: int):
+        self.conversation_id = conversation_id
+        self.rows: deque = deque(maxlen=size)   # message dicts in seq order
+        self.last_seq = 0       # highest seq held (or looked past)
+        self.known_seq = 0      # highest seq announced by hooks / interrupts
+        self.complete = True    # holds the conversation from its first message
+        self.checked_at = 0.0   # monotonic time of the last refresh
+        self.loaded = False
+        self.lock: asyncio.Lock | None = None
+
+    def _extend(self, rows: list[dict]):
+        if len(self.rows) + len(rows) > self.rows.maxlen:
+            self.complete = False
+        self.rows.extend(rows)
+        if rows:
+            self.last_seq = max(self.last_seq, int(rows[-1]["seq"]))
+
+    def stale(self, max_age_s: float) -> bool:
+        return (not self.loaded) or self.known_seq > self.last_seq or (time.monotonic() - self.checked_at) >= max_age_s
+
+    def covers_seq(self, after_seq: int) -> bool:
+        """True if every message with seq > after_seq is in the buffer."""
+        return self.complete or not self.rows or int(self.rows[0]["seq"]) <= after_seq + 1
+
+    def covers_iso(self, since_iso: str) -> bool:
+        return self.complete or not self.rows or str(self.rows[0]["created_at"]) <= since_iso
+
+
+class MessageWindowCache:
+    def __init__(self, size: int = MESSAGE_WINDOW_SIZE, max_age_s: float = MESSAGE_WINDOW_MAX_AGE_S,
+                 max_conversations: int = MESSAGE_WINDOW_MAX_CONVERSATIONS):
+        self.size = size
+        self.max_age_s = max_age_s
+        self.max_conversations = max_conversations
+        self._lock = threading.Lock()
+        self._windows: "OrderedDict[str, ConversationWindow]" = OrderedDict()
+
+    def note(self, conversation_id: str, seq):
+        """A message with `seq` exists in the conversation; the next read refreshes if it is not held yet."""
+        if seq is None:
+            return
+        with self._lock:
+            w = self._windows.get(conversation_id)
+            if w is not None and int(seq) > w.known_seq:
+                w.known_seq = int(seq)
+
+    def invalidate(self, conversation_id: str | None = None):
+        with self._lock:
+            if conversation_id is None:
+                self._windows.clear()
+            else:
+                self._windows.pop(conversation_id, None)
+
+    def _window(self, conversation_id: str) -> ConversationWindow:
+        with self._lock:
+            w = self._windows.get(conversation_id)
+            if w is None:
+                w = self._windows[conversation_id] = ConversationWindow(conversation_id, self.size)
+                while len(self._windows) > self.max_conversations:
+                    self._windows.popitem(last=False)
+            else:
+                self._windows.move_to_end(conversation_id)
+            return w
+
+    async def _refresh(self, w: ConversationWindow, force: bool = False):
+        if not (force or w.stale(self.max_age_s)):
+            return
+        if w.lock is None:
+            w.lock = asyncio.Lock()
+        async with w.lock:
+            # Another reader may have refreshed while we waited for the lock
+            if not (force or w.stale(self.max_age_s)):
+                return
+            started = time.monotonic()
+            if not w.loaded:
+                rows = await list_recent_messages_async(w.conversation_id, self.size)
+                # Fewer than a full window means we hold the whole conversation
+                w.complete = len(rows) < self.size
+                w._extend(rows)
+                w.loaded = True
+            else:
+                w._extend(await list_messages_after_seq_async(w.conversation_id, w.last_seq))
+            w.checked_at = started
+
+    async def since(self, conversation_id: str, *, after_seq: int | None = None, since_iso: str | None = None,
+                    limit: int = 50, fresh: bool = False) -> list[dict]:
+        """
+        Messages after the reader's cursor, oldest first, at most `limit` (same shape as
+        list_messages_since_async). The cursor is `after_seq`, else `since_iso`; with
+        neither, the reader starts at the beginning of the window. `fresh` forces a
+        refresh even if nothing announced a new message.
+        """
+        w = self._window(conversation_id)
+        await self._refresh(w, force=fresh)
+        if after_seq is not None:
+            if not w.covers_seq(after_seq):
+                return await list_messages_after_seq_async(conversation_id, after_seq, limit)
+            rows = [r for r in w.rows if int(r["seq"]) > after_seq]
+        elif since_iso:
+            if not w.covers_iso(since_iso):
+                return await list_messages_since_async(conversation_id, since_iso, limit)
+            rows = [r for r in w.rows if str(r["created_at"]) > since_iso]
+        else:
+            rows = list(w.rows)
+        return rows[:limit]
+
+    async def latest(self, conversation_id: str, k: int = 10) -> list[dict]:
+        """The last `k` messages (k <= window size), oldest first."""
+        w = self._window(conversation_id)
+        await self._refresh(w)
+        return list(w.rows)[-k:] if k else []
+
+
+MESSAGE_CACHE = MessageWindowCache()
+add_append_hook(MESSAGE_CACHE.note)
@@ -1,41 +1,201 @@
-import lancedb, uuid, json
+import uuid, json
+import asyncio
+import os
+import pyarrow.compute as pc
 from datetime import datetime, timezone
-import pandas as pd
 from .schemas import AGENTS_URI, MESSAGES_NAME
-DB = lancedb.connect(AGENTS_URI)
+from .db import open_async_table, run_sync, on_store_loop
+from .summaries import SUMMARIES
 
-def append_message(conversation_id: str, author_id: str, role: str, text: str, reply_to: str | None = None, meta: dict | None = None) -> str:
+try:
+    import fcntl
+except ImportError:  # not POSIX: process-local counter only
+    fcntl = None
+
+# Sequence numbers are handed out under a lock and the row is added while it is held,
+# so rows become visible in seq order and a reader at seq N never misses N-1 later.
+# Allocation always runs on the store loop (store.db.on_store_loop), so one asyncio lock
+# covers every thread and event loop in the process.
+# Across processes (the sharded runtime has every worker appending) the counter lives in
+# SEQ_FILE next to a local database and is held with flock for the allocate + add. The
+# file is bumped before the add, so a failed add leaves a gap (readers skip gaps), never
+# a duplicate. Object-store URIs have no shared file: the counter is then per process
+# and messages must be appended from a single process.
+_SEQ_LOCK: asyncio.Lock | None = None
+_last_seq: int | None = None
+SEQ_FILE = os.path.join(AGENTS_URI, ".messages_seq") if AGENTS_URI and "://" not in AGENTS_URI and fcntl else None
+_seq_fd: int | None = None
+
+# Called as fn(conversation_id, seq) after each append, outside the lock.
+# conversation_fanout uses this to wake up instead of polling.
+_APPEND_HOOKS: list = []
+
+
+def add_append_hook(fn):
+    _APPEND_HOOKS.append(fn)
+
+
+def remove_append_hook(fn):
+    if fn in _APPEND_HOOKS:
+        _APPEND_HOOKS.remove(fn)
+
+
+async def _max_seq(tbl) -> int:
+    col = (await tbl.query().where("seq IS NOT NULL").select(["seq"]).to_arrow())["seq"]
+    m = pc.max(col).as_py() if len(col) else None
+    return int(m) if m is not None else 0
+
+
+async def max_message_seq_async() -> int:
+    return await _max_seq(await open_async_table(MESSAGES_NAME))
+
+
+def max_message_seq() -> int:
+    return run_sync(max_message_seq_async())
+
+
+async def _flock(fd: int):
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        # Another process is appending; wait for it off the loop
+        await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+
+
+async def _add_with_seq_shared(tbl, row: dict) -> int:
+    global _seq_fd
+    if _seq_fd is None:
+        _seq_fd = os.open(SEQ_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+    await _flock(_seq_fd)
+    try:
+        raw = os.pread(_seq_fd, 32, 0).strip()
+        seq = (int(raw) if raw else await _max_seq(tbl)) + 1
+        os.pwrite(_seq_fd, str(seq).ljust(20).encode(), 0)
+        await tbl.add([{**row, "seq": seq}])
+    finally:
+        fcntl.flock(_seq_fd, fcntl.LOCK_UN)
+    return seq
+
+
+async def _add_with_seq(row: dict) -> int:
+    # Runs on the store loop only
+    global _SEQ_LOCK, _last_seq
+    if _SEQ_LOCK is None:
+        _SEQ_LOCK = asyncio.Lock()
+    tbl = await open_async_table(MESSAGES_NAME)
+    async with _SEQ_LOCK:
+        if SEQ_FILE:
+            return await _add_with_seq_shared(tbl, row)
+        if _last_seq is None:
+            _last_seq = await _max_seq(tbl)
+        seq = _last_seq + 1
+        await tbl.add([{**row, "seq": seq}])
+        _last_seq = seq
+    return seq
+
+
+async def append_message_async(conversation_id: str, author_id: str, role: str, text: str, reply_to: str | None = None, meta: dict | None = None) -> str:
     mid = str(uuid.uuid4())
-    DB.open_table(MESSAGES_NAME).add([{
-    "message_id": mid,
-    "conversation_id": conversation_id,
-    "author_id": author_id,
-    "role": role,
-    "text": text,
-    "created_at": datetime.now(timezone.utc).isoformat(),
-    "reply_to": reply_to,
-    "meta": json.dumps(meta) if meta else None,
-    }])
+    seq = await on_store_loop(_add_with_seq({
+        "message_id": mid,
+        "conversation_id": conversation_id,
+        "author_id": author_id,
+        "role": role,
+        "text": text,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "reply_to": reply_to,
+        "meta": json.dumps(meta) if meta else None,
+    }))
+    SUMMARIES.note_message(conversation_id)
+    for hook in list(_APPEND_HOOKS):
+        try:
+            hook(conversation_id, seq)
+        except Exception as e:
+            print(f"append hook error: {e}")
     return mid
 
 
-def list_messages_since(conversation_id: str, since_iso: str | None, limit: int = 50) -> list[dict]:
-    tbl = DB.open_table(MESSAGES_NAME)
-    q = tbl.search().where(f"conversation_id == '{conversation_id}'")
-    df = q.to_pandas()
-    if df is None or df.empty:
-        return []
-    df["created_at_dt"] = pd.to_datetime(df["created_at"], errors="coerce")
+def append_message(conversation_id: str, author_id: str, role: str, text: str, reply_to: str | None = None, meta: dict | None = None) -> str:
+    return run_sync(append_message_async(conversation_id, author_id, role, text, reply_to, meta))
+
+
+def _sql_str(value) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+def _iso_utc(since_iso: str) -> str:
+    """Normalise an ISO timestamp to the form created_at is written in, so the string compare is chronological."""
+    try:
+        dt = datetime.fromisoformat(str(since_iso).replace("Z", "+00:00"))
+    except ValueError:
+        return str(since_iso)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).isoformat()
+
+async def page_messages_async(
+    conversation_id: str,
+    *,
+    limit: int | None = 50,
+    order: str = "asc",
+    after_seq: int | None = None,
+    before_seq: int | None = None,
+    since_iso: str | None = None,
+    offset: int = 0,
+    columns: list[str] | None = None,
+) -> tuple[list[dict], bool]:
+    """
+    One page of a conversation's messages in seq order (`order` asc / desc), and whether
+    more rows follow it. Pages are keyed by seq: pass the last seq of a page as after_seq
+    (asc) or before_seq (desc) for the next one.
+
+    The predicates run in LanceDB; only the seq column of the matching rows is read to
+    place the page, then only the page's rows (with `columns`) are fetched.
+    """
+    clauses = [f"conversation_id == {_sql_str(conversation_id)}", "seq IS NOT NULL"]
+    if after_seq is not None:
+        clauses.append(f"seq > {int(after_seq)}")
+    if before_seq is not None:
+        clauses.append(f"seq < {int(before_seq)}")
     if since_iso:
-        cutoff = pd.to_datetime(since_iso, errors="coerce")
-        df = df[df["created_at_dt"] > cutoff]
-    df = df.sort_values("created_at_dt").iloc[:limit]
-    return df.drop(columns=["created_at_dt"]).to_dict(orient="records")
+        clauses.append(f"created_at > {_sql_str(_iso_utc(since_iso))}")
+    where = " AND ".join(clauses)
+
+    tbl = await open_async_table(MESSAGES_NAME)
+    seqs = (await tbl.query().where(where).select(["seq"]).to_arrow())["seq"]
+    want = len(seqs) if limit is None else min(len(seqs), offset + limit)
+    if want <= offset:
+        return [], len(seqs) > want
+    desc = order == "desc"
+    top = pc.take(seqs, pc.select_k_unstable(seqs, want, [("dummy", "descending" if desc else "ascending")]))
+    picked = sorted(top.to_pylist(), reverse=desc)[offset:]
+
+    q = tbl.query().where(f"{where} AND seq >= {min(picked)} AND seq <= {max(picked)}")
+    if columns:
+        q = q.select(list(dict.fromkeys([*columns, "seq"])))
+    rows = (await q.to_arrow()).to_pylist()
+    rows.sort(key=lambda r: r["seq"], reverse=desc)
+    return rows, len(seqs) > want
+
+async def list_messages_since_async(conversation_id: str, since_iso: str | None, limit: int = 50) -> list[dict]:
+    rows, _ = await page_messages_async(conversation_id, since_iso=since_iso, limit=limit)
+    return rows
+
+def list_messages_since(conversation_id: str, since_iso: str | None, limit: int = 50) -> list[dict]:
+    return run_sync(list_messages_since_async(conversation_id, since_iso, limit))
+
+async def list_messages_after_seq_async(conversation_id: str, after_seq: int | None, limit: int | None = None) -> list[dict]:
+    """Messages with seq > after_seq in seq order; only the rows after the cursor are read."""
+    rows, _ = await page_messages_async(conversation_id, after_seq=after_seq or 0, limit=limit)
+    return rows
+
+async def list_recent_messages_async(conversation_id: str, k: int) -> list[dict]:
+    """The last `k` messages of a conversation in seq order."""
+    rows, _ = await page_messages_async(conversation_id, order="desc", limit=k)
+    return rows[::-1]
+
+async def latest_message_async(conversation_id: str) -> dict | None:
+    rows, _ = await page_messages_async(conversation_id, order="desc", limit=1)
+    return rows[0] if rows else None
 
 def latest_message(conversation_id: str) -> dict | None:
-    tbl = DB.open_table(MESSAGES_NAME)
-    df = tbl.search().where(f"conversation_id == '{conversation_id}'").to_pandas()
-    if df is None or df.empty: return None
-    df["created_at_dt"] = pd.to_datetime(df["created_at"], errors="coerce")
-    row = df.sort_values("created_at_dt").iloc[-1]
-    return row.to_dict()
+    return run_sync(latest_message_async(conversation_id))
@@ -0,0 +1,92 @@
+"""
+In-memory participant roster, keyed by conversation_id.
+
+Fan-out needs the participants of a conversation for every new message. The
+roster loads a conversation's participants once and is kept current by
+store.conversations.add_participant (which calls on_participant_added), so the
+participants table is not re-scanned per message.
+
+Participants added by other processes (sharded agent workers, AGENT_WORKERS > 1)
+never reach on_participant_added here, so each roster remembers the participants
+table version it was read at. members_for checks the table's current version
+once per call and reloads the conversations whose rosters predate it.
+"""
+import threading
+
+from .schemas import PARTICIPANTS_NAME
+from .db import open_async_table
+from .table_versions import table_versions_async
+
+ROSTER_COLUMNS = ["conversation_id", "agent_id", "session_id"]
+
+
+def _sql_in(values) -> str:
+    return ", ".join("'" + str(v).replace("'", "''") + "'" for v in values)
+
+
+class ParticipantRoster:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_conv: dict[str, list[tuple[str, str]]] = {}   # cid -> [(agent_id, session_id)]
+        self._versions: dict[str, int] = {}   # cid -> participants table version its roster was read at
+        self._adds: dict[str, int] = {}   # cid -> adds seen; detects an add racing a load
+
+    def get(self, conversation_id: str) -> list[tuple[str, str]] | None:
+        with self._lock:
+            members = self._by_conv.get(conversation_id)
+            return list(members) if members is not None else None
+
+    def on_participant_added(self, conversation_id: str, agent_id: str, session_id: str):
+        # Only patch conversations we already hold; others load fresh on first use
+        with self._lock:
+            self._adds[conversation_id] = self._adds.get(conversation_id, 0) + 1
+            members = self._by_conv.get(conversation_id)
+            if members is not None and (agent_id, session_id) not in members:
+                members.append((agent_id, session_id))
+
+    def invalidate(self, conversation_id: str | None = None):
+        with self._lock:
+            if conversation_id is None:
+                self._by_conv.clear()
+                self._versions.clear()
+            else:
+                self._by_conv.pop(conversation_id, None)
+                self._versions.pop(conversation_id, None)
+
+    async def members_for(self, db, conversation_ids) -> dict[str, list[tuple[str, str]]]:
+        """
+        Return {conversation_id: [(agent_id, session_id), ...]} for the given ids, loading
+        every conversation not yet held, or held from an older participants table
+        version, in one query (async LanceDB connection).
+        """
+        wanted = set(conversation_ids)
+        (_, version, _), = await table_versions_async([PARTICIPANTS_NAME])
+        with self._lock:
+            out = {c: list(self._by_conv[c]) for c in wanted
+                   if c in self._by_conv and self._versions.get(c) == version}
+            missing = sorted(wanted - out.keys())
+            adds_before = {c: self._adds.get(c, 0) for c in missing}
+        if not missing:
+            return out
+        ptbl = await open_async_table(PARTICIPANTS_NAME)
+        df = await ptbl.query().where(f"conversation_id IN ({_sql_in(missing)})").select(ROSTER_COLUMNS).to_pandas()
+        loaded: dict[str, list[tuple[str, str]]] = {c: [] for c in missing}
+        if df is not None and not df.empty:
+            for cid, aid, sid in df[ROSTER_COLUMNS].itertuples(index=False, name=None):
+                pair = (str(aid), str(sid))
+                if pair not in loaded[cid]:
+                    loaded[cid].append(pair)
+        with self._lock:
+            for cid, members in loaded.items():
+                out[cid] = members
+                # If a participant was added while we were reading, our rows may predate it;
+                # don't cache them so the next call reads the conversation again.
+                if self._adds.get(cid, 0) != adds_before[cid]:
+                    continue
+                # Read at `version` or later: a newer one only means a needless reload
+                self._by_conv[cid] = list(members)
+                self._versions[cid] = version
+        return out
+
+
+ROSTER = ParticipantRoster()
@@ -0,0 +1,227 @@
+"""
+Resumable run updates: a per-run step sequence and a replay buffer.
+
+Every step of a run (room run::<agent_id>::<session_id>) gets the next `seq` of
+that run, stored on its agent_steps row and carried by its run_update. A client
+that reconnects sends subscribe_run with the last seq it applied (`since_seq`)
+and is sent only the steps after it, as compact deltas:
+
+    {"run_id", "seq", "iteration", "status", "last_text", "timestamp"}
+
+Deltas come from RUN_STREAMS, an in-memory ring of the last RUN_RING_SIZE steps
+of each run this process has stepped; when the ring doesn't reach back to the
+client's seq (a restart, another worker process, a long disconnect) they come
+from agent_steps with an indexed `session_id / seq > since_seq` range read.
+
+Live run_updates are coalesced per frame by ws_bus, so the seqs a client sees
+may jump; a client that wants every step resubscribes with since_seq to fill the
+gap. Replay and live updates can overlap around the subscribe: clients apply a
+delta only if its seq is above the last one they applied.
+
+A run's counter starts after the highest seq already stored for it, so a
+session that is rehydrated (iteration restarts at 0) keeps counting upwards.
+
+Steps of runs stepped in another process (sharded agent workers) have no ring
+here; ws_bus reaches them by tailing agent_steps with newest_step_delta_async.
+"""
+import os
+import threading
+from collections import OrderedDict, deque
+
+import pyarrow.compute as pc
+
+from .schemas import AGENT_STEPS_NAME
+from .db import open_async_table, run_sync
+
+RUN_RING_SIZE = int(os.getenv("RUN_RING_SIZE", "256"))
+RUN_RING_MAX_RUNS = int(os.getenv("RUN_RING_MAX_RUNS", "2000"))
+RUN_REPLAY_MAX = int(os.getenv("RUN_REPLAY_MAX", "500"))
+RUN_DELTA_COLUMNS = ["seq", "iteration", "status", "text", "created_at"]
+
+
+def _quote(value) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def run_id_for(agent_id: str, session_id: str | None) -> str:
+    return f"{agent_id}::{session_id or ''}"
+
+
+def split_run_id(run_id: str) -> tuple[str, str | None]:
+    agent_id, _, session_id = run_id.partition("::")
+    return agent_id, (session_id or None)
+
+
+def step_delta(rec: dict) -> dict:
+    """The run_update payload for one agent_steps record."""
+    return {
+        "run_id": run_id_for(rec["agent_id"], rec.get("session_id")),
+        "seq": rec.get("seq"),
+        "iteration": rec.get("iteration"),
+        "status": rec.get("status"),
+        "last_text": rec.get("text"),
+        "timestamp": rec.get("created_at"),
+    }
+
+
+def _run_where(agent_id: str, session_id: str | None) -> str:
+    session = f"session_id == {_quote(session_id)}" if session_id else "session_id IS NULL"
+    return f"{session} AND agent_id == {_quote(agent_id)}"
+
+
+async def max_step_seq_async(agent_id: str, session_id: str | None) -> int:
+    """Highest seq stored for the run (0 if none); reads only the seq column."""
+    tbl = await open_async_table(AGENT_STEPS_NAME)
+    seqs = (await tbl.query().where(f"{_run_where(agent_id, session_id)} AND seq IS NOT NULL")
+            .select(["seq"]).to_arrow())["seq"]
+    return int(pc.max(seqs).as_py() or 0) if len(seqs) else 0
+
+
+async def list_step_deltas_async(agent_id: str, session_id: str | None, since_seq: int = 0,
+                                 limit: int = RUN_REPLAY_MAX) -> tuple[list[dict], bool]:
+    """
+    Deltas for the run's steps with seq > since_seq, in seq order, at most `limit`,
+    and whether more follow. The seqs past the cursor are read first to bound the
+    range, then only that range's rows are fetched.
+    """
+    where = f"{_run_where(agent_id, session_id)} AND seq > {int(since_seq)}"
+    tbl = await open_async_table(AGENT_STEPS_NAME)
+    seqs = (await tbl.query().where(where).select(["seq"]).to_arrow())["seq"]
+    if not len(seqs):
+        return [], False
+    has_more = len(seqs) > limit
+    if has_more:
+        top = pc.take(seqs, pc.select_k_unstable(seqs, limit, [("dummy", "ascending")]))
+        where = f"{where} AND seq <= {pc.max(top).as_py()}"
+    rows = (await tbl.query().where(where).select(RUN_DELTA_COLUMNS).to_arrow()).to_pylist()
+    rows.sort(key=lambda r: r["seq"])
+    return [step_delta({**r, "agent_id": agent_id, "session_id": session_id}) for r in rows], has_more
+
+
+async def newest_step_delta_async(agent_id: str, session_id: str | None, after_seq: int = 0) -> dict | None:
+    """
+    The delta of the run's highest-seq step if that seq is above after_seq, else None.
+    When nothing is newer this costs one read of the seq column past the cursor.
+    """
+    where = f"{_run_where(agent_id, session_id)} AND seq > {int(after_seq)}"
+    tbl = await open_async_table(AGENT_STEPS_NAME)
+    seqs = (await tbl.query().where(where).select(["seq"]).to_arrow())["seq"]
+    if not len(seqs):
+        return None
+    last = pc.max(seqs).as_py()
+    rows = (await tbl.query().where(f"{_run_where(agent_id, session_id)} AND seq == {int(last)}")
+            .select(RUN_DELTA_COLUMNS).limit(1).to_arrow()).to_pylist()
+    return step_delta({**rows[0], "agent_id": agent_id, "session_id": session_id}) if rows else None
+
+
+async def latest_step_delta_async(agent_id: str, session_id: str | None) -> dict | None:
+    return await newest_step_delta_async(agent_id, session_id, 0)
+
+
+class RunRing:
+    __slots__ = ("seq", "floor", "seeded", "deltas")
+
+    def __init__(self, size: int):
+        self.seq = 0          # last seq handed out
+        self.floor = 0        # every delta with seq > floor is in `deltas`
+        self.seeded = False   # seq continues from what the store holds
+        self.deltas: deque = deque(maxlen=size)
+
+
+class RunStreams:
+    """Per-run step counters and rings of recent deltas, for the runs stepped in this process."""
+
+    def __init__(self, size: int = RUN_RING_SIZE, max_runs: int = RUN_RING_MAX_RUNS):
+        self.size = size
+        self.max_runs = max_runs
+        self._lock = threading.Lock()
+        self._runs: "OrderedDict[str, RunRing]" = OrderedDict()
+
+    def _ring(self, run_id: str, create: bool = True) -> RunRing | None:
+        with self._lock:
+            ring = self._runs.get(run_id)
+            if ring is None and create:
+                ring = self._runs[run_id] = RunRing(self.size)
+                while len(self._runs) > self.max_runs:
+                    self._runs.popitem(last=False)
+            elif ring is not None:
+                self._runs.move_to_end(run_id)
+            return ring
+
+    async def next_seq(self, agent_id: str, session_id: str | None) -> int:
+        ring = self._ring(run_id_for(agent_id, session_id))
+        if not ring.seeded:
+            stored = await max_step_seq_async(agent_id, session_id)
+            with self._lock:
+                if not ring.seeded:
+                    ring.seq = max(ring.seq, stored)
+                    ring.floor = ring.seq
+                    ring.seeded = True
+        with self._lock:
+            ring.seq += 1
+            return ring.seq
+
+    def record(self, delta: dict):
+        ring = self._ring(delta["run_id"])
+        with self._lock:
+            if len(ring.deltas) == ring.deltas.maxlen:
+                ring.floor = ring.deltas[0]["seq"]
+            ring.deltas.append(delta)
+
+    def replay(self, run_id: str, since_seq: int) -> list[dict] | None:
+        """Deltas after since_seq from the ring, or None if the ring doesn't reach back that far."""
+        ring = self._ring(run_id, create=False)
+        if ring is None:
+            return None
+        with self._lock:
+            if not ring.seeded or since_seq < ring.floor:
+                return None
+            return [d for d in ring.deltas if d["seq"] > since_seq]
+
+    def latest(self, run_id: str) -> dict | None:
+        ring = self._ring(run_id, create=False)
+        if ring is None:
+            return None
+        with self._lock:
+            return ring.deltas[-1] if ring.deltas else None
+
+
+RUN_STREAMS = RunStreams()
+
+
+async def replay_run_async(run_id: str, since_seq: int, limit: int = RUN_REPLAY_MAX) -> dict:
+    """
+    {"run_id", "since_seq", "updates": [delta, ...], "has_more", "last_seq"}: the steps
+    after since_seq, from the ring when it covers them, else from agent_steps.
+    """
+    since_seq = max(0, int(since_seq))
+    updates = RUN_STREAMS.replay(run_id, since_seq)
+    has_more = False
+    if updates is None:
+        agent_id, session_id = split_run_id(run_id)
+        updates, has_more = await list_step_deltas_async(agent_id, session_id, since_seq, limit)
+    elif len(updates) > limit:
+        updates, has_more = updates[:limit], True
+    return {
+        "run_id": run_id,
+        "since_seq": since_seq,
+        "updates": updates,
+        "has_more": has_more,
+        "last_seq": updates[-1]["seq"] if updates else since_seq,
+    }
+
+
+def replay_run(run_id: str, since_seq: int, limit: int = RUN_REPLAY_MAX) -> dict:
+    return run_sync(replay_run_async(run_id, since_seq, limit))
+
+
+async def run_snapshot_async(run_id: str) -> dict | None:
+    """The run's latest delta (ring first, then agent_steps), or None if it has no steps."""
+    delta = RUN_STREAMS.latest(run_id)
+    if delta is None:
+        delta = await latest_step_delta_async(*split_run_id(run_id))
+    return delta
+
+
+def run_snapshot(run_id: str) -> dict | None:
+    return run_sync(run_snapshot_async(run_id))
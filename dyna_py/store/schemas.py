@@ -1,12 +1,6 @@
 
 import pyarrow as pa
-import lancedb
-import os
-from dotenv import load_dotenv
-load_dotenv()
-
-AGENTS_URI = os.getenv('AGENTS_URI')
-AGENTS_DB = lancedb.connect(AGENTS_URI)
+from .db import AGENTS_URI, open_table, table_names, create_table, drop_table
 
 
 AGENT_STEPS_NAME = "agent_steps"
@@ -27,15 +21,16 @@ AGENT_STEPS_SCHEMA = pa.schema([
     pa.field("notes", pa.string(), nullable=True),
     pa.field("latency_ms", pa.int32(), nullable=True),
     pa.field("error", pa.string(), nullable=True),
+    pa.field("seq", pa.int64(), nullable=True),              # per-run step sequence (store.run_stream)
 ])
 
 def create_agent_steps_schema():
     print("creating agent_steps_schema")
-    AGENTS_DB.create_table(AGENT_STEPS_NAME, schema=AGENT_STEPS_SCHEMA)
+    create_table(AGENT_STEPS_NAME, schema=AGENT_STEPS_SCHEMA)
 
 def delete_agent_steps_schema():
     print("deleting agent_steps_schema")
-    AGENTS_DB.drop_table(AGENT_STEPS_NAME)
+    drop_table(AGENT_STEPS_NAME)
 
 
 
@@ -60,8 +55,14 @@ QUEUE_SCHEMA = pa.schema([
     pa.field("payload", pa.string()),
     pa.field("metadata", pa.string()),
     pa.field("session_id", pa.string(), nullable=True),  # NEW
+    pa.field("lease_owner", pa.string(), nullable=True),       # worker currently holding the claim
+    pa.field("lease_expires_at", pa.string(), nullable=True),  # ISO timestamp; claim is free after this
+    pa.field("shard", pa.int32(), nullable=True),              # shards.shard_for(session_id); NULL when no session
 ])
 
+# Processed queue rows past the retention window are moved here by store.maintenance
+QUEUE_ARCHIVE_NAME = "queue_archive"
+
 
 AGENT_STATE_NAME = "agent_state"
 
@@ -94,6 +95,7 @@ MESSAGES_SCHEMA = pa.schema([
     pa.field("created_at", pa.string(), nullable=False),
     pa.field("reply_to", pa.string(), nullable=True),
     pa.field("meta", pa.string(), nullable=True),        # JSON
+    pa.field("seq", pa.int64(), nullable=True),          # monotonic per-table sequence (see store.messages)
 ])
 
 PARTICIPANTS_NAME = "participants"
@@ -105,16 +107,138 @@ PARTICIPANTS_SCHEMA = pa.schema([
     pa.field("joined_at", pa.string(), nullable=False),
 ])
 
+# Persisted read positions for background consumers (e.g. conversation fan-out)
+CURSORS_NAME = "cursors"
+CURSORS_SCHEMA = pa.schema([
+    pa.field("cursor_id", pa.string(), nullable=False),
+    pa.field("position", pa.int64(), nullable=False),
+    pa.field("updated_at", pa.string(), nullable=False),
+])
+
+# One row per conversation with a message / participant rollup for the conversation list
+# (kept current by store.summaries; seq is the last message folded in)
+CONVERSATION_SUMMARIES_NAME = "conversation_summaries"
+CONVERSATION_SUMMARIES_SCHEMA = pa.schema([
+    pa.field("conversation_id", pa.string(), nullable=False),
+    pa.field("last_seq", pa.int64(), nullable=False),
+    pa.field("last_msg_at", pa.string(), nullable=True),
+    pa.field("preview", pa.string(), nullable=True),
+    pa.field("message_count", pa.int64(), nullable=False),
+    pa.field("participant_count", pa.int64(), nullable=False),
+    pa.field("updated_at", pa.string(), nullable=False),
+])
+
+# Optional embeddings of messages.text for vector search (store.search); the vector
+# width depends on the embedding model, so the table is created on the first batch
+MESSAGE_EMBEDDINGS_NAME = "message_embeddings"
+
+def message_embeddings_schema(dim: int) -> pa.Schema:
+    return pa.schema([
+        pa.field("message_id", pa.string(), nullable=False),
+        pa.field("conversation_id", pa.string(), nullable=False),
+        pa.field("seq", pa.int64(), nullable=False),
+        pa.field("vector", pa.list_(pa.float32(), dim), nullable=False),
+    ])
+
+# Episodic memories per (conversation, agent): a compact summary of a stretch of
+# messages (store.memories). The vector column is only present when the table is
+# created with embeddings enabled, since its width depends on the model.
+MEMORY_EPISODES_NAME = "memory_episodes"
+
+def memory_episodes_schema(dim: int | None = None) -> pa.Schema:
+    fields = [
+        pa.field("episode_id", pa.string(), nullable=False),
+        pa.field("conversation_id", pa.string(), nullable=False),
+        pa.field("agent_id", pa.string(), nullable=False),
+        pa.field("session_id", pa.string(), nullable=True),
+        pa.field("start_at", pa.string(), nullable=True),
+        pa.field("end_at", pa.string(), nullable=True),
+        pa.field("summary", pa.string(), nullable=False),
+        pa.field("salient_points", pa.list_(pa.string()), nullable=True),
+        pa.field("topics", pa.list_(pa.string()), nullable=True),
+        pa.field("novelty_hint", pa.float64(), nullable=True),
+        pa.field("token_count", pa.int32(), nullable=False),    # rough size of summary + points
+        pa.field("created_at", pa.string(), nullable=False),
+    ]
+    if dim:
+        fields.append(pa.field("vector", pa.list_(pa.float32(), dim), nullable=False))
+    return pa.schema(fields)
+
+# Live agent worker processes (sharded runtime, see shards.py); one row per worker
+WORKERS_NAME = "workers"
+WORKERS_SCHEMA = pa.schema([
+    pa.field("worker_id", pa.string(), nullable=False),
+    pa.field("host", pa.string(), nullable=True),
+    pa.field("pid", pa.int64(), nullable=True),
+    pa.field("started_at", pa.string(), nullable=False),
+    pa.field("heartbeat_at", pa.string(), nullable=False),
+])
+
 def create_conversation_schemas():
-    AGENTS_DB.create_table(CONVERSATIONS_NAME, schema=CONVERSATIONS_SCHEMA)
-    AGENTS_DB.create_table(MESSAGES_NAME, schema=MESSAGES_SCHEMA)
-    AGENTS_DB.create_table(PARTICIPANTS_NAME, schema=PARTICIPANTS_SCHEMA)
+    create_table(CONVERSATIONS_NAME, schema=CONVERSATIONS_SCHEMA)
+    create_table(MESSAGES_NAME, schema=MESSAGES_SCHEMA)
+    create_table(PARTICIPANTS_NAME, schema=PARTICIPANTS_SCHEMA)
+    create_table(CONVERSATION_SUMMARIES_NAME, schema=CONVERSATION_SUMMARIES_SCHEMA)
+    create_cursors_schema()
+    ensure_fts_indexes()
 
 
 def delete_conversation_schemas():
-    AGENTS_DB.drop_table(CONVERSATIONS_NAME)
-    AGENTS_DB.drop_table(MESSAGES_NAME)
-    AGENTS_DB.drop_table(PARTICIPANTS_NAME)
+    drop_table(CONVERSATIONS_NAME)
+    drop_table(MESSAGES_NAME)
+    drop_table(PARTICIPANTS_NAME)
+    drop_table(CONVERSATION_SUMMARIES_NAME)
+    drop_table(CURSORS_NAME)   # positions are meaningless without the messages
+
+def create_cursors_schema():
+    print("creating cursors schema")
+    create_table(CURSORS_NAME, schema=CURSORS_SCHEMA)
+
+def migrate_messages_schema():
+    """
+    Add the `seq` column to a messages table created before it existed and number the
+    existing rows in created_at order, so sequence readers see the full history.
+    """
+    if MESSAGES_NAME not in table_names():
+        return
+    tbl = open_table(MESSAGES_NAME)
+    if "seq" in tbl.schema.names:
+        return
+    print("migrating messages schema: adding seq")
+    tbl.add_columns({"seq": "CAST(NULL AS BIGINT)"})
+    rows = tbl.search().select(["message_id", "created_at"]).limit(None).to_pandas()
+    if rows.empty:
+        return
+    rows = rows.sort_values("created_at", kind="stable").reset_index(drop=True)
+    rows["seq"] = rows.index.astype("int64") + 1
+    (
+        tbl.merge_insert("message_id")
+        .when_matched_update_all()
+        .execute(pa.Table.from_pandas(rows[["message_id", "seq"]], preserve_index=False))
+    )
+
+def migrate_agent_steps_schema():
+    """
+    Add the per-run `seq` column to an agent_steps table created before it existed and
+    number the existing steps of each (agent_id, session_id) run in created_at order.
+    """
+    if AGENT_STEPS_NAME not in table_names():
+        return
+    tbl = open_table(AGENT_STEPS_NAME)
+    if "seq" in tbl.schema.names:
+        return
+    print("migrating agent_steps schema: adding seq")
+    tbl.add_columns({"seq": "CAST(NULL AS BIGINT)"})
+    rows = tbl.search().select(["id", "agent_id", "session_id", "created_at"]).limit(None).to_pandas()
+    if rows.empty:
+        return
+    rows = rows.sort_values("created_at", kind="stable")
+    rows["seq"] = rows.groupby(["agent_id", rows["session_id"].fillna("")]).cumcount().astype("int64") + 1
+    (
+        tbl.merge_insert("id")
+        .when_matched_update_all()
+        .execute(pa.Table.from_pandas(rows[["id", "seq"]], preserve_index=False))
+    )
 
 # Optionally call from create_all_schemas()
 
@@ -124,37 +248,124 @@ def delete_conversation_schemas():
 
 
 
+def create_workers_schema():
+    print("creating workers schema")
+    create_table(WORKERS_NAME, schema=WORKERS_SCHEMA)
+
 def create_agent_state_schema():
     print("creating agent state schema")
-    AGENTS_DB.create_table(AGENT_STATE_NAME, schema=AGENT_STATE_SCHEMA)
+    create_table(AGENT_STATE_NAME, schema=AGENT_STATE_SCHEMA)
 
 def delete_agent_state_schema():
     print("deleting agent state schema")
-    AGENTS_DB.drop_table(AGENT_STATE_NAME)
+    drop_table(AGENT_STATE_NAME)
 
 
 def create_agents_config_schema():
     print("creating agent config schema")
-    AGENTS_DB.create_table(AGENTS_CONFIG_NAME, schema=AGENTS_CONFIG_SCHEMA)
+    create_table(AGENTS_CONFIG_NAME, schema=AGENTS_CONFIG_SCHEMA)
 
 def delete_agents_schema():
     print("deleting agent config schema")
-    AGENTS_DB.drop_table(AGENTS_CONFIG_NAME)
+    drop_table(AGENTS_CONFIG_NAME)
 
 def create_queue_schema():
     print("creating_queue_schema")
-    AGENTS_DB.create_table(QUEUE_NAME, schema=QUEUE_SCHEMA)
+    create_table(QUEUE_NAME, schema=QUEUE_SCHEMA)
 
 def delete_queue_schema():
     print("deleting_queue_schema")
-    AGENTS_DB.drop_table(QUEUE_NAME)
+    drop_table(QUEUE_NAME)
+
+def create_queue_archive_schema():
+    print("creating queue archive schema")
+    create_table(QUEUE_ARCHIVE_NAME, schema=QUEUE_SCHEMA)
+
+def delete_queue_archive_schema():
+    print("deleting queue archive schema")
+    drop_table(QUEUE_ARCHIVE_NAME)
+
+def migrate_queue_schema():
+    # Add claim/lease/shard columns to a queue table created before they existed
+    tbl = open_table(QUEUE_NAME)
+    existing = set(tbl.schema.names)
+    missing = {
+        name: "CAST(NULL AS STRING)"
+        for name in ("lease_owner", "lease_expires_at")
+        if name not in existing
+    }
+    if "shard" not in existing:
+        missing["shard"] = "CAST(NULL AS INT)"
+    if missing:
+        print(f"migrating queue schema: adding {sorted(missing)}")
+        tbl.add_columns(missing)
+
+
+
+# --------------------
+# Scalar indexes
+# --------------------
+
+# table -> [(column, index_type)]; BTREE for high-cardinality ids, BITMAP for flags
+SCALAR_INDEXES = {
+    AGENT_STATE_NAME: [("agent_id", "BTREE"), ("session_id", "BTREE")],
+    AGENT_STEPS_NAME: [("agent_id", "BTREE"), ("session_id", "BTREE"), ("seq", "BTREE")],
+    QUEUE_NAME: [("action_id", "BTREE"), ("processed", "BITMAP"), ("shard", "BITMAP")],
+    MESSAGES_NAME: [("seq", "BTREE"), ("conversation_id", "BTREE")],
+    CONVERSATION_SUMMARIES_NAME: [("conversation_id", "BTREE")],
+    MEMORY_EPISODES_NAME: [("conversation_id", "BTREE"), ("agent_id", "BTREE")],
+}
+
+def ensure_scalar_indexes():
+    """
+    Create any missing scalar index from SCALAR_INDEXES. Existing indexes are left alone;
+    new rows are folded into them by Table.optimize() (see store.maintenance).
+    """
+    existing_tables = set(table_names())
+    for table_name, specs in SCALAR_INDEXES.items():
+        if table_name not in existing_tables:
+            continue
+        tbl = open_table(table_name)
+        indexed = {col for idx in tbl.list_indices() for col in idx.columns}
+        for column, index_type in specs:
+            if column in indexed:
+                continue
+            print(f"creating {index_type} index on {table_name}.{column}")
+            tbl.create_scalar_index(column, index_type=index_type)
+
+
+# --------------------
+# Full-text indexes
+# --------------------
 
+# table -> [column]; searched by store.search. Rows added since the last
+# Table.optimize() are still found (scanned flat) until maintenance folds them in.
+FTS_INDEXES = {
+    MESSAGES_NAME: ["text"],
+    CONVERSATIONS_NAME: ["title"],
+    MEMORY_EPISODES_NAME: ["summary"],
+}
+
+def ensure_fts_indexes():
+    """Create any missing FTS index from FTS_INDEXES."""
+    existing_tables = set(table_names())
+    for table_name, columns in FTS_INDEXES.items():
+        if table_name not in existing_tables:
+            continue
+        tbl = open_table(table_name)
+        indexed = {col for idx in tbl.list_indices() for col in idx.columns}
+        for column in columns:
+            if column in indexed:
+                continue
+            print(f"creating FTS index on {table_name}.{column}")
+            tbl.create_fts_index(column, use_tantivy=False)
 
 
 def create_all_schemas():
     create_agent_state_schema()
     create_agent_steps_schema()
     create_queue_schema()
+    ensure_scalar_indexes()
 #    create_agents_config_schema()
 
 def delete_all_schemas():
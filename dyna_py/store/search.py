@@ -0,0 +1,395 @@
+"""
+Search over messages.text and conversation titles.
+
+Full text goes through LanceDB's native FTS indexes (schemas.FTS_INDEXES), so a
+query costs an index lookup rather than a scan of every message. Rows added
+since the last optimize are still found; maintenance folds them into the index.
+
+Vector search is optional. With SEARCH_EMBEDDING_MODEL set (an OpenAI embedding
+model, e.g. text-embedding-3-small) and the openai package importable,
+embedding_indexer_loop tails the messages table by seq and writes one embedding
+per message to message_embeddings, and maintenance adds an ANN index once the
+table passes SEARCH_ANN_MIN_ROWS. Searches then fuse the full-text and vector
+rankings (reciprocal rank fusion); without embeddings they are full text only.
+
+Hits are ranked and paged by limit / offset, each with a snippet of the
+matching text and the [start, end) offsets of the query terms inside it.
+"""
+import asyncio
+import os
+import re
+
+import pyarrow as pa
+
+from .schemas import (
+    MESSAGES_NAME,
+    CONVERSATIONS_NAME,
+    MESSAGE_EMBEDDINGS_NAME,
+    FTS_INDEXES,
+    message_embeddings_schema,
+)
+from .db import open_async_table, async_table_names, create_async_table, run_sync
+from .cursors import get_cursor_async, set_cursor_async
+
+SEARCH_EMBEDDING_MODEL = os.getenv("SEARCH_EMBEDDING_MODEL", "").strip()
+SEARCH_EMBEDDING_BATCH = int(os.getenv("SEARCH_EMBEDDING_BATCH", "64"))
+SEARCH_ANN_MIN_ROWS = int(os.getenv("SEARCH_ANN_MIN_ROWS", "5000"))
+SEARCH_SNIPPET_CHARS = int(os.getenv("SEARCH_SNIPPET_CHARS", "160"))
+SEARCH_RRF_K = 60
+SEARCH_MODES = {"auto", "fts", "vector", "hybrid"}
+SEARCH_TYPES = {"messages", "conversations"}
+EMBEDDING_CURSOR_ID = "search_embeddings"
+
+MESSAGE_HIT_COLUMNS = ["message_id", "conversation_id", "seq", "author_id", "role", "text", "created_at"]
+
+_fts_ready: set[str] = set()
+_openai_client = None
+
+
+def _quote(value) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+# --------------------
+# Indexes / embeddings
+# --------------------
+
+async def open_fts_table(name: str):
+    """Async handle for `name`, creating its FTS index(es) first if this process hasn't seen them."""
+    tbl = await open_async_table(name)
+    if name in _fts_ready:
+        return tbl
+    from lancedb.index import FTS
+    indexed = {col for idx in await tbl.list_indices() for col in idx.columns}
+    for column in FTS_INDEXES.get(name, []):
+        if column not in indexed:
+            print(f"creating FTS index on {name}.{column}")
+            await tbl.create_index(column, config=FTS())
+    _fts_ready.add(name)
+    return tbl
+
+
+def embeddings_enabled() -> bool:
+    return bool(SEARCH_EMBEDDING_MODEL) and _embedding_client() is not None
+
+
+def _embedding_client():
+    global _openai_client
+    if _openai_client is None and SEARCH_EMBEDDING_MODEL:
+        try:
+            from openai import AsyncOpenAI
+        except ImportError:
+            print("SEARCH_EMBEDDING_MODEL is set but openai is not installed; vector search disabled")
+            return None
+        _openai_client = AsyncOpenAI()
+    return _openai_client
+
+
+async def embed_texts(texts: list[str]) -> list[list[float]]:
+    res = await _embedding_client().embeddings.create(model=SEARCH_EMBEDDING_MODEL, input=[t or " " for t in texts])
+    return [d.embedding for d in sorted(res.data, key=lambda d: d.index)]
+
+
+async def _open_embeddings(dim: int | None = None):
+    if MESSAGE_EMBEDDINGS_NAME in await async_table_names():
+        return await open_async_table(MESSAGE_EMBEDDINGS_NAME)
+    if dim is None:
+        return None
+    print("creating message embeddings schema")
+    return await create_async_table(MESSAGE_EMBEDDINGS_NAME, schema=message_embeddings_schema(dim), exist_ok=True)
+
+
+async def index_message_embeddings_async(after_seq: int, batch: int = SEARCH_EMBEDDING_BATCH) -> int | None:
+    """Embed up to `batch` messages past `after_seq`. Returns the last seq embedded (None if none)."""
+    mtbl = await open_async_table(MESSAGES_NAME)
+    # A seq window keeps each batch bounded; on a gap, skip ahead to the next seq (as conversation_fanout does)
+    while True:
+        rows = (
+            await mtbl.query()
+            .where(f"seq > {int(after_seq)} AND seq <= {int(after_seq) + batch}")
+            .select(["message_id", "conversation_id", "seq", "text"])
+            .to_arrow()
+        ).to_pylist()
+        if rows:
+            break
+        ahead = (await mtbl.query().where(f"seq > {int(after_seq) + batch}").select(["seq"]).to_arrow())["seq"]
+        if len(ahead) == 0:
+            return None
+        after_seq = min(ahead.to_pylist()) - 1
+    rows.sort(key=lambda r: r["seq"])
+    vectors = await embed_texts([r["text"] for r in rows])
+    etbl = await _open_embeddings(len(vectors[0]))
+    data = pa.Table.from_pylist(
+        [{"message_id": r["message_id"], "conversation_id": r["conversation_id"], "seq": r["seq"], "vector": v}
+         for r, v in zip(rows, vectors)],
+        schema=message_embeddings_schema(len(vectors[0])),
+    )
+    await etbl.merge_insert("message_id").when_matched_update_all().when_not_matched_insert_all().execute(data)
+    return int(rows[-1]["seq"])
+
+
+async def embedding_indexer_loop(interval_s: float = 2.0, batch: int = SEARCH_EMBEDDING_BATCH):
+    """Keep message_embeddings caught up with messages (returns at once if embeddings are off)."""
+    if not embeddings_enabled():
+        return
+    cursor = await get_cursor_async(EMBEDDING_CURSOR_ID) or 0
+    while True:
+        try:
+            last = await index_message_embeddings_async(cursor, batch)
+            if last is None:
+                await asyncio.sleep(interval_s)
+                continue
+            cursor = last
+            await set_cursor_async(EMBEDDING_CURSOR_ID, cursor)
+        except Exception as e:
+            print(f"embedding_indexer_loop error: {e}")
+            await asyncio.sleep(interval_s)
+
+
+async def ensure_ann_index_async(name: str, min_rows: int = SEARCH_ANN_MIN_ROWS) -> bool:
+    """Build an IVF_PQ index on `name`.vector once the table has `min_rows` rows. True if created."""
+    if name not in await async_table_names():
+        return False
+    tbl = await open_async_table(name)
+    if "vector" not in (await tbl.schema()).names:
+        return False
+    if "vector" in {c for idx in await tbl.list_indices() for c in idx.columns}:
+        return False
+    if await tbl.count_rows() < min_rows:
+        return False
+    from lancedb.index import IvfPq
+    print(f"creating ANN index on {name}.vector")
+    await tbl.create_index("vector", config=IvfPq(distance_type="cosine"))
+    return True
+
+
+async def ensure_embedding_index_async() -> bool:
+    return await ensure_ann_index_async(MESSAGE_EMBEDDINGS_NAME)
+
+
+# --------------------
+# Ranking helpers
+# --------------------
+
+def _terms(q: str) -> list[str]:
+    return [t for t in re.findall(r"\w+", q.lower()) if len(t) > 1]
+
+
+def snippet(text: str, q: str, width: int = SEARCH_SNIPPET_CHARS) -> tuple[str, list[list[int]]]:
+    """A window of `text` around the first query term, plus [start, end) offsets of the terms in it."""
+    text = text or ""
+    terms = _terms(q)
+    pattern = re.compile("|".join(re.escape(t) for t in terms), re.IGNORECASE) if terms else None
+    first = pattern.search(text) if pattern else None
+    start = max(0, first.start() - width // 3) if first else 0
+    end = min(len(text), start + width)
+    start = max(0, end - width)
+    out = text[start:end]
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if end < len(text) else ""
+    highlights = [[m.start() + len(prefix), m.end() + len(prefix)] for m in pattern.finditer(out)] if pattern else []
+    return prefix + out + suffix, highlights
+
+
+def _rrf(*rankings: list[str]) -> list[str]:
+    """Reciprocal rank fusion of id lists (best first)."""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (SEARCH_RRF_K + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def _resolve_mode(mode: str) -> str:
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"mode must be one of {sorted(SEARCH_MODES)}")
+    if mode == "auto":
+        return "hybrid" if embeddings_enabled() else "fts"
+    if mode in ("vector", "hybrid") and not embeddings_enabled():
+        raise ValueError("vector search needs SEARCH_EMBEDDING_MODEL (and the openai package)")
+    return mode
+
+
+# --------------------
+# Queries
+# --------------------
+
+async def _fts_messages(q: str, where: str | None, n: int, offset: int = 0) -> list[dict]:
+    tbl = await open_fts_table(MESSAGES_NAME)
+    query = tbl.query().nearest_to_text(q, columns="text").select([*MESSAGE_HIT_COLUMNS, "_score"])
+    if where:
+        query = query.where(where)
+    return (await query.offset(offset).limit(n).to_arrow()).to_pylist()
+
+
+async def _vector_message_ids(q: str, where: str | None, n: int) -> list[str]:
+    etbl = await _open_embeddings()
+    if etbl is None:
+        return []
+    vec = (await embed_texts([q]))[0]
+    query = etbl.query().nearest_to(vec).distance_type("cosine").select(["message_id", "_distance"])
+    if where:
+        query = query.where(where)
+    return (await query.limit(n).to_arrow())["message_id"].to_pylist()
+
+
+async def _messages_by_id(ids: list[str]) -> dict[str, dict]:
+    if not ids:
+        return {}
+    tbl = await open_async_table(MESSAGES_NAME)
+    rows = (
+        await tbl.query()
+        .where(f"message_id IN ({', '.join(_quote(i) for i in ids)})")
+        .select(MESSAGE_HIT_COLUMNS)
+        .to_arrow()
+    ).to_pylist()
+    return {r["message_id"]: r for r in rows}
+
+
+async def _conversation_titles(ids) -> dict[str, str]:
+    ids = sorted(set(ids))
+    if not ids:
+        return {}
+    tbl = await open_async_table(CONVERSATIONS_NAME)
+    rows = (
+        await tbl.query()
+        .where(f"conversation_id IN ({', '.join(_quote(i) for i in ids)})")
+        .select(["conversation_id", "title"])
+        .to_arrow()
+    ).to_pylist()
+    return {r["conversation_id"]: r["title"] for r in rows}
+
+
+async def search_messages_async(
+    q: str,
+    *,
+    limit: int = 20,
+    offset: int = 0,
+    conversation_id: str | None = None,
+    mode: str = "auto",
+) -> tuple[list[dict], bool]:
+    """Ranked message hits for `q` and whether more follow."""
+    mode = _resolve_mode(mode)
+    where = f"conversation_id == {_quote(conversation_id)}" if conversation_id else None
+
+    if mode == "fts":
+        rows = await _fts_messages(q, where, limit + 1, offset)
+        scored = [(r, r.get("_score")) for r in rows]
+    else:
+        # Fusion needs both rankings from the top; fetch enough of each to cover this page
+        n = offset + limit + 1
+        vector_ids = await _vector_message_ids(q, where, n)
+        fts_rows = await _fts_messages(q, where, n) if mode == "hybrid" else []
+        ranked = _rrf([r["message_id"] for r in fts_rows], vector_ids)[offset:offset + limit + 1]
+        by_id = {r["message_id"]: r for r in fts_rows}
+        by_id.update(await _messages_by_id([i for i in ranked if i not in by_id]))
+        scored = [(by_id[i], None) for i in ranked if i in by_id]
+
+    has_more = len(scored) > limit
+    scored = scored[:limit]
+    titles = await _conversation_titles(r["conversation_id"] for r, _ in scored)
+    hits = []
+    for r, score in scored:
+        snip, highlights = snippet(r["text"], q)
+        hits.append({
+            "type": "message",
+            "message_id": r["message_id"],
+            "conversation_id": r["conversation_id"],
+            "conversation_title": titles.get(r["conversation_id"]),
+            "seq": r["seq"],
+            "author_id": r["author_id"],
+            "role": r["role"],
+            "created_at": r["created_at"],
+            "score": score,
+            "snippet": snip,
+            "highlights": highlights,
+        })
+    return hits, has_more
+
+
+async def search_conversations_async(q: str, *, limit: int = 20, offset: int = 0) -> tuple[list[dict], bool]:
+    """Ranked conversation hits on title for `q` and whether more follow."""
+    tbl = await open_fts_table(CONVERSATIONS_NAME)
+    rows = (
+        await tbl.query()
+        .nearest_to_text(q, columns="title")
+        .select(["conversation_id", "title", "status", "created_at", "_score"])
+        .offset(offset)
+        .limit(limit + 1)
+        .to_arrow()
+    ).to_pylist()
+    hits = []
+    for r in rows[:limit]:
+        snip, highlights = snippet(r["title"], q)
+        hits.append({
+            "type": "conversation",
+            "conversation_id": r["conversation_id"],
+            "title": r["title"],
+            "status": r["status"],
+            "created_at": r["created_at"],
+            "score": r.get("_score"),
+            "snippet": snip,
+            "highlights": highlights,
+        })
+    return hits, len(rows) > limit
+
+
+async def search_async(
+    q: str,
+    *,
+    type: str = "messages",
+    limit: int = 20,
+    offset: int = 0,
+    conversation_id: str | None = None,
+    mode: str = "auto",
+) -> dict:
+    """{"hits": [...], "meta": {...}} for the /api/search endpoint."""
+    if type not in SEARCH_TYPES:
+        raise ValueError(f"type must be one of {sorted(SEARCH_TYPES)}")
+    q = (q or "").strip()
+    if not q:
+        hits, has_more = [], False
+    elif type == "conversations":
+        hits, has_more = await search_conversations_async(q, limit=limit, offset=offset)
+    else:
+        hits, has_more = await search_messages_async(q, limit=limit, offset=offset, conversation_id=conversation_id, mode=mode)
+    return {
+        "hits": hits,
+        "meta": {
+            "q": q,
+            "type": type,
+            "mode": _resolve_mode(mode) if type == "messages" else "fts",
+            "returned": len(hits),
+            "limit": limit,
+            "offset": offset,
+            "has_more": has_more,
+            "next_offset": (offset + len(hits)) if has_more else None,
+        },
+    }
+
+
+def search(q: str, **kwargs) -> dict:
+    return run_sync(search_async(q, **kwargs))
+
+
+async def matching_conversation_ids_async(q: str, page: int = 500) -> set[str]:
+    """
+    Conversations whose title or any message matches `q` (the conversation list filter).
+
+    Every matching conversation is returned, not only those among the best-ranked hits:
+    hits are read `page` at a time, each read excluding the conversations already found,
+    until one comes back short. The reads are bounded by the number of matching
+    conversations, however many of their messages match.
+    """
+    found: set[str] = set()
+    for name, column in ((CONVERSATIONS_NAME, "title"), (MESSAGES_NAME, "text")):
+        tbl = await open_fts_table(name)
+        while True:
+            query = tbl.query().nearest_to_text(q, columns=column).select(["conversation_id", "_score"])
+            if found:
+                query = query.where(f"conversation_id NOT IN ({', '.join(_quote(c) for c in found)})")
+            ids = (await query.limit(page).to_arrow())["conversation_id"].to_pylist()
+            found.update(ids)
+            if len(ids) < page:
+                break
+    return found
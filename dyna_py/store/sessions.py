@@ -1,4 +1,3 @@
-import lancedb
 import json
 import pandas as pd
 from datetime import datetime
@@ -6,7 +5,8 @@ from datetime import datetime
 from .schemas import AGENTS_URI, AGENT_STATE_NAME
 from .schemas import AGENT_STEPS_NAME  # fallback if agent_state lacks session_id
 
-AGENTS_DB = lancedb.connect(AGENTS_URI)
+from .db import open_async_table, run_sync
+from .run_stream import run_id_for, run_snapshot_async
 
 ACTIVE_STATUSES = {"starting", "running", "paused", "stopping"}
 
@@ -23,7 +23,7 @@ def _safe_json_loads(s, default=None):
 def _has_column(df: pd.DataFrame, col: str) -> bool:
     return df is not None and not df.empty and (col in df.columns)
 
-def list_sessions_for_agent(
+async def list_sessions_for_agent_async(
     agent_id: str,
     *,
     active_only: bool = False,
@@ -38,8 +38,13 @@ def list_sessions_for_agent(
     # Try from agent_state (preferred)
     try:
         #print(agent_id)
-        state_tbl = AGENTS_DB.open_table(AGENT_STATE_NAME)
-        df = state_tbl.search().where(f"agent_id == '{agent_id}'").to_pandas()
+        state_tbl = await open_async_table(AGENT_STATE_NAME)
+        df = await (
+            state_tbl.query()
+            .where(f"agent_id == '{agent_id}'")
+            .select(["agent_id", "session_id", "status", "iteration", "last_updated", "result", "context"])
+            .to_pandas()
+        )
         #print(df)
     except Exception as e:
         print(e)
@@ -77,8 +82,13 @@ def list_sessions_for_agent(
 
     # Fallback: derive sessions from agent_steps (distinct session_id)
     try:
-        steps_tbl = AGENTS_DB.open_table(AGENT_STEPS_NAME)
-        sdf = steps_tbl.query().where(f"agent_id == '{agent_id}'").to_pandas()
+        steps_tbl = await open_async_table(AGENT_STEPS_NAME)
+        sdf = await (
+            steps_tbl.query()
+            .where(f"agent_id == '{agent_id}'")
+            .select(["session_id", "created_at", "iteration"])
+            .to_pandas()
+        )
     except Exception:
         sdf = pd.DataFrame()
 
@@ -115,12 +125,15 @@ def list_sessions_for_agent(
         })
     return rows
 
-def get_agent_id_for_session_id(session_id:str) -> str|None:
+def list_sessions_for_agent(agent_id: str, **kwargs):
+    return run_sync(list_sessions_for_agent_async(agent_id, **kwargs))
+
+async def get_agent_id_for_session_id_async(session_id:str) -> str|None:
 
     try:
         #print(agent_id)
-        state_tbl = AGENTS_DB.open_table(AGENT_STATE_NAME)
-        df = state_tbl.search().where(f"session_id == '{session_id}'").to_pandas()
+        state_tbl = await open_async_table(AGENT_STATE_NAME)
+        df = await state_tbl.query().where(f"session_id == '{session_id}'").select(["agent_id"]).limit(1).to_pandas()
         if len(df) > 0:
             return df.iloc[0].agent_id
         else: 
@@ -128,20 +141,19 @@ def get_agent_id_for_session_id(session_id:str) -> str|None:
     except Exception as e:
         return None        
     
+def get_agent_id_for_session_id(session_id:str) -> str|None:
+    return run_sync(get_agent_id_for_session_id_async(session_id))
 
-def get_last_step_for_session_id(session_id): 
-    AGENTS_DB = lancedb.connect(AGENTS_URI)
-
-    agent_id = get_agent_id_for_session_id(session_id=session_id)
 
+async def get_last_step_for_session_id_async(session_id): 
+    agent_id = await get_agent_id_for_session_id_async(session_id=session_id)
+    if agent_id is None:
+        return ""
     try:
-        steps_tbl = AGENTS_DB.open_table(AGENT_STEPS_NAME)
-        sdf = steps_tbl.search().where(f"agent_id == '{agent_id}' AND session_id == '{session_id}'").to_pandas()
-        
+        delta = await run_snapshot_async(run_id_for(agent_id, session_id))
     except Exception:
-        sdf = pd.DataFrame()
+        delta = None
+    return (delta or {}).get("last_text") or ""
 
-    if len(sdf) > 0:
-        df_sorted = sdf.sort_values(by="iteration", ascending=False)
-        return df_sorted.iloc[0].text
-    return ""
+def get_last_step_for_session_id(session_id): 
+    return run_sync(get_last_step_for_session_id_async(session_id))
@@ -0,0 +1,108 @@
+"""
+Write-behind cache for agent_state.
+
+Agents update their state several times per tick. Instead of one LanceDB
+update (plus add fallback) per call, the latest state per (agent_id, session_id)
+is kept in memory, served to readers straight away, and dirty entries are
+flushed in one merge-insert every STATE_FLUSH_INTERVAL_S seconds, or right away
+when an agent goes starting/stopped/error so lifecycle changes are durable.
+"""
+import asyncio
+import os
+from datetime import datetime, timezone
+
+from .agent_state import build_agent_state_record, upsert_agent_states_async, _safe_json_loads
+
+STATE_FLUSH_INTERVAL_S = float(os.getenv("STATE_FLUSH_INTERVAL_S", "2.0"))
+IMMEDIATE_FLUSH_STATUSES = {"starting", "stopped", "error"}
+
+
+class AgentStateCache:
+    def __init__(self, flush_interval_s: float = STATE_FLUSH_INTERVAL_S):
+        self.flush_interval_s = flush_interval_s
+        self._entries: dict[tuple, dict] = {}   # (agent_id, session_id) -> state record
+        self._dirty: set[tuple] = set()
+        self._flush_event: asyncio.Event | None = None
+        self._inflight: asyncio.Future | None = None
+        self._running = False
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def get(self, agent_id, session_id=None) -> dict | None:
+        """Return the cached state in get_agent_state() shape, or None if not cached."""
+        rec = self._entries.get((agent_id, session_id))
+        if rec is None:
+            return None
+        return {
+            **rec,
+            "result": _safe_json_loads(rec["result"], default_if_fail=rec["result"]),
+            "history": _safe_json_loads(rec["history"], default_if_fail=[]),
+            "context": _safe_json_loads(rec["context"], default_if_fail={}),
+        }
+
+    def put(self, agent_id, status, *, session_id=None, iteration=None, result=None, context=None, history=None):
+        rec = build_agent_state_record(
+            agent_id,
+            status,
+            session_id=session_id,
+            iteration=iteration,
+            result=result,
+            context=context,
+            history=history,
+        )
+        key = (agent_id, session_id)
+        self._entries[key] = rec
+        self._dirty.add(key)
+        if status in IMMEDIATE_FLUSH_STATUSES and self._flush_event is not None:
+            self._flush_event.set()
+
+    async def flush(self) -> int:
+        if not self._dirty:
+            return 0
+        keys = list(self._dirty)
+        self._dirty.clear()
+        records = [self._entries[k] for k in keys if k in self._entries]
+        try:
+            # Shielded: cancelling run() must not abort a merge-insert halfway through
+            self._inflight = asyncio.ensure_future(upsert_agent_states_async(records))
+            n = await asyncio.shield(self._inflight)
+        except Exception as e:
+            print(f"AgentStateCache flush failed for {len(records)} row(s): {e}")
+            self._dirty.update(keys)
+            return 0
+        # Finished sessions don't need to stay resident once durable
+        for k in keys:
+            rec = self._entries.get(k)
+            if rec is not None and rec["status"] == "stopped" and k not in self._dirty:
+                self._entries.pop(k, None)
+        print(f"AgentStateCache flushed {n} state row(s) @ {datetime.now(timezone.utc).isoformat()}")
+        return n
+
+    async def run(self):
+        """Background flusher; drains on cancellation so shutdown doesn't lose state."""
+        self._flush_event = asyncio.Event()
+        self._running = True
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                # call_later + Event rather than wait_for, which can swallow a cancel on 3.10
+                timer = loop.call_later(self.flush_interval_s, self._flush_event.set)
+                try:
+                    await self._flush_event.wait()
+                finally:
+                    timer.cancel()
+                self._flush_event.clear()
+                await self.flush()
+        finally:
+            self._running = False
+            if self._inflight is not None and not self._inflight.done():
+                try:
+                    await self._inflight
+                except Exception as e:
+                    print(f"AgentStateCache in-flight flush failed during shutdown: {e}")
+            await self.flush()
+
+
+STATE_CACHE = AgentStateCache()
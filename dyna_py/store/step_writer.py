@@ -0,0 +1,111 @@
+"""
+Buffered writer for agent_steps.
+
+Each tick used to open the table and add a single row on a worker thread.
+StepWriter instead emits the websocket update immediately, puts the row on a
+bounded asyncio queue, and a background flusher groups rows into one Arrow
+batch per flush (bounded by STEP_BATCH_MAX_ROWS or STEP_FLUSH_INTERVAL_S).
+
+- Backpressure: when STEP_QUEUE_MAX rows are pending, append() waits.
+- Shutdown: cancelling run() drains everything still queued before returning.
+"""
+import asyncio
+import os
+
+from .agent_steps import build_step_record_async, emit_step_update, append_agent_steps_async
+
+STEP_BATCH_MAX_ROWS = int(os.getenv("STEP_BATCH_MAX_ROWS", "500"))
+STEP_FLUSH_INTERVAL_S = float(os.getenv("STEP_FLUSH_INTERVAL_S", "0.5"))
+STEP_QUEUE_MAX = int(os.getenv("STEP_QUEUE_MAX", "5000"))
+STEP_WRITE_RETRIES = 3
+
+
+class StepWriter:
+    def __init__(
+        self,
+        max_batch: int = STEP_BATCH_MAX_ROWS,
+        flush_interval_s: float = STEP_FLUSH_INTERVAL_S,
+        max_pending: int = STEP_QUEUE_MAX,
+    ):
+        self.max_batch = max_batch
+        self.flush_interval_s = flush_interval_s
+        self.max_pending = max_pending
+        self._queue: asyncio.Queue | None = None
+        self._batch_ready: asyncio.Event | None = None
+        self._inflight: asyncio.Future | None = None
+        self._running = False
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def append(self, agent_id: str, iteration: int, **fields) -> dict:
+        rec = await build_step_record_async(agent_id, iteration, **fields)
+        # UI sees the step now; durability follows with the next flush
+        emit_step_update(rec)
+        await self._queue.put(rec)
+        if self._queue.qsize() >= self.max_batch:
+            self._batch_ready.set()
+        return rec
+
+    async def _write(self, batch: list[dict]):
+        for attempt in range(1, STEP_WRITE_RETRIES + 1):
+            try:
+                # Shielded: cancelling run() must not abort a batch halfway through its add
+                self._inflight = asyncio.ensure_future(append_agent_steps_async(batch))
+                await asyncio.shield(self._inflight)
+                return
+            except Exception as e:
+                print(f"StepWriter write failed ({attempt}/{STEP_WRITE_RETRIES}) for {len(batch)} row(s): {e}")
+                await asyncio.sleep(0.2 * attempt)
+        print(f"StepWriter dropped {len(batch)} step row(s) after {STEP_WRITE_RETRIES} attempts")
+
+    def _take_nowait(self, batch: list[dict]):
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+
+    async def run(self):
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._batch_ready = asyncio.Event()
+        self._running = True
+        loop = asyncio.get_running_loop()
+        collecting: list[dict] = []   # rows taken off the queue but not yet handed to _write
+        try:
+            while True:
+                collecting.append(await self._queue.get())
+                self._take_nowait(collecting)
+                if len(collecting) < self.max_batch:
+                    # Let the batch fill until the interval elapses or append() reports a full batch.
+                    # (call_later + Event rather than wait_for, which can swallow a cancel on 3.10)
+                    self._batch_ready.clear()
+                    timer = loop.call_later(self.flush_interval_s, self._batch_ready.set)
+                    try:
+                        await self._batch_ready.wait()
+                    finally:
+                        timer.cancel()
+                    self._take_nowait(collecting)
+                batch, collecting = collecting, []
+                await self._write(batch)
+        finally:
+            self._running = False
+            if self._inflight is not None and not self._inflight.done():
+                try:
+                    await self._inflight
+                except Exception as e:
+                    print(f"StepWriter in-flight write failed during shutdown: {e}")
+            # Drain whatever is still queued so shutdown doesn't lose steps
+            while True:
+                self._take_nowait(collecting)
+                if not collecting:
+                    break
+                batch, collecting = collecting, []
+                await self._write(batch)
+
+
+STEP_WRITER = StepWriter()
@@ -1,5 +1,7 @@
-import asyncio
-from .agent_steps import append_agent_step as _append
+from .agent_steps import append_agent_step_async as _append
+from .step_writer import STEP_WRITER
 
 async def append_step_async(agent_id: str, iteration: int, **fields):
-    return await asyncio.to_thread(_append, agent_id, iteration, **fields)
+    if STEP_WRITER.running:
+        return await STEP_WRITER.append(agent_id, iteration, **fields)
+    return await _append(agent_id, iteration, **fields)
@@ -0,0 +1,239 @@
+"""
+Per-conversation rollup for the conversation list (conversation_summaries table).
+
+list_conversations_for_window used to load every message ever written to find
+each conversation's last message. The summaries table holds, per conversation,
+the last message time and preview, message_count and participant_count, so the
+list reads one row per conversation.
+
+append_message / add_participant call SUMMARIES.note_*; the touched conversations
+are folded in together on the store loop after SUMMARY_FLUSH_S (one read of
+each table, one merge_insert). A fold reads the messages with seq > the row's
+last_seq, so it is idempotent: any process may fold any conversation, a fold
+that lost a race is caught up by the next one, and a row never moves back to an
+older last_seq (the merge is conditional on it).
+
+A database that predates the table gets it built from the messages on first
+use (ensure_conversation_summaries_async).
+"""
+import asyncio
+import atexit
+import os
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+
+import pyarrow as pa
+
+from .schemas import (
+    CONVERSATION_SUMMARIES_NAME,
+    CONVERSATION_SUMMARIES_SCHEMA,
+    MESSAGES_NAME,
+    PARTICIPANTS_NAME,
+)
+from .db import open_async_table, async_table_names, create_async_table, run_sync, spawn_on_store_loop
+from .table_versions import note_write
+
+SUMMARY_FLUSH_S = float(os.getenv("SUMMARY_FLUSH_S", "0.5"))
+SUMMARY_PREVIEW_CHARS = int(os.getenv("SUMMARY_PREVIEW_CHARS", "280"))
+SUMMARY_FOLD_COLUMNS = ["conversation_id", "seq", "created_at", "text"]
+
+
+def _quote(value) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _sql_in(values) -> str:
+    return ", ".join(_quote(v) for v in values)
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _empty_row(conversation_id: str) -> dict:
+    return {
+        "conversation_id": conversation_id,
+        "last_seq": 0,
+        "last_msg_at": None,
+        "preview": None,
+        "message_count": 0,
+        "participant_count": 0,
+        "updated_at": _now_iso(),
+    }
+
+
+async def _participant_counts(conversation_ids=None) -> Counter:
+    ptbl = await open_async_table(PARTICIPANTS_NAME)
+    q = ptbl.query().select(["conversation_id"])
+    if conversation_ids is not None:
+        q = q.where(f"conversation_id IN ({_sql_in(conversation_ids)})")
+    return Counter((await q.to_arrow())["conversation_id"].to_pylist())
+
+
+def _fold_messages(row: dict, messages: list[dict]) -> dict:
+    """Apply `messages` (any order) past row["last_seq"] to a summary row."""
+    fresh = [m for m in messages if m["seq"] > row["last_seq"]]
+    if not fresh:
+        return row
+    last = max(fresh, key=lambda m: m["seq"])
+    return {
+        **row,
+        "last_seq": int(last["seq"]),
+        "last_msg_at": last["created_at"],
+        "preview": (last["text"] or "")[:SUMMARY_PREVIEW_CHARS],
+        "message_count": row["message_count"] + len(fresh),
+    }
+
+
+async def _write_rows(tbl, rows: list[dict]):
+    if not rows:
+        return
+    data = pa.Table.from_pylist(rows, schema=CONVERSATION_SUMMARIES_SCHEMA)
+    await (
+        tbl.merge_insert("conversation_id")
+        .when_matched_update_all(where="target.last_seq <= source.last_seq")
+        .when_not_matched_insert_all()
+        .execute(data)
+    )
+    note_write(CONVERSATION_SUMMARIES_NAME)
+
+
+async def rebuild_conversation_summaries_async() -> int:
+    """Recompute every summary from the messages and participants tables. Returns rows written."""
+    tbl = await _open_summaries(rebuild=False)
+    mtbl = await open_async_table(MESSAGES_NAME)
+    msgs = (await mtbl.query().where("seq IS NOT NULL").select(SUMMARY_FOLD_COLUMNS).to_arrow()).to_pylist()
+    by_conv: dict[str, list[dict]] = {}
+    for m in msgs:
+        by_conv.setdefault(m["conversation_id"], []).append(m)
+    counts = await _participant_counts()
+    rows = []
+    for cid in by_conv.keys() | counts.keys():
+        row = _fold_messages(_empty_row(cid), by_conv.get(cid, []))
+        rows.append({**row, "participant_count": counts.get(cid, 0)})
+    await _write_rows(tbl, rows)
+    return len(rows)
+
+
+async def _open_summaries(rebuild: bool = True):
+    if CONVERSATION_SUMMARIES_NAME in await async_table_names():
+        return await open_async_table(CONVERSATION_SUMMARIES_NAME)
+    print("creating conversation summaries schema")
+    tbl = await create_async_table(CONVERSATION_SUMMARIES_NAME, schema=CONVERSATION_SUMMARIES_SCHEMA, exist_ok=True)
+    if rebuild and MESSAGES_NAME in await async_table_names():
+        print(f"built {await rebuild_conversation_summaries_async()} conversation summaries")
+    return tbl
+
+
+async def ensure_conversation_summaries_async():
+    await _open_summaries()
+
+
+def ensure_conversation_summaries():
+    return run_sync(ensure_conversation_summaries_async())
+
+
+async def get_conversation_summaries_async(conversation_ids=None) -> dict[str, dict]:
+    """{conversation_id: summary row} for the given ids (all conversations if None)."""
+    tbl = await _open_summaries()
+    q = tbl.query()
+    if conversation_ids is not None:
+        ids = list(conversation_ids)
+        if not ids:
+            return {}
+        q = q.where(f"conversation_id IN ({_sql_in(ids)})")
+    return {r["conversation_id"]: r for r in (await q.to_arrow()).to_pylist()}
+
+
+def get_conversation_summaries(conversation_ids=None) -> dict[str, dict]:
+    return run_sync(get_conversation_summaries_async(conversation_ids))
+
+
+class ConversationSummaries:
+    """Collects conversations touched in this process and folds them on the store loop."""
+
+    def __init__(self, flush_interval_s: float = SUMMARY_FLUSH_S):
+        self.flush_interval_s = flush_interval_s
+        self._lock = threading.Lock()
+        self._messages: set[str] = set()       # conversations with new messages
+        self._participants: set[str] = set()   # conversations with new participants
+        self._scheduled = False
+
+    def note_message(self, conversation_id: str):
+        self._note(self._messages, conversation_id)
+
+    def note_participant(self, conversation_id: str):
+        self._note(self._participants, conversation_id)
+
+    def _note(self, target: set, conversation_id: str):
+        with self._lock:
+            target.add(conversation_id)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        spawn_on_store_loop(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval_s)
+        with self._lock:
+            self._scheduled = False
+        try:
+            await self.flush_async()
+        except Exception as e:
+            print(f"conversation summary fold failed: {e}")
+
+    def _take(self) -> tuple[set[str], set[str]]:
+        with self._lock:
+            msgs, parts = self._messages, self._participants
+            self._messages, self._participants = set(), set()
+            return msgs, parts
+
+    async def flush_async(self):
+        msg_cids, part_cids = self._take()
+        cids = msg_cids | part_cids
+        if not cids:
+            return
+        try:
+            await self._fold(msg_cids, cids)
+        except Exception:
+            # Put them back for the next fold
+            with self._lock:
+                self._messages |= msg_cids
+                self._participants |= part_cids
+            raise
+
+    async def _fold(self, msg_cids: set[str], cids: set[str]):
+        tbl = await _open_summaries()
+        current = await get_conversation_summaries_async(cids)
+        new_msgs: list[dict] = []
+        if msg_cids:
+            mtbl = await open_async_table(MESSAGES_NAME)
+            since = " OR ".join(
+                f"(conversation_id == {_quote(c)} AND seq > {int((current.get(c) or {}).get('last_seq') or 0)})"
+                for c in sorted(msg_cids)
+            )
+            new_msgs = (await mtbl.query().where(since).select(SUMMARY_FOLD_COLUMNS).to_arrow()).to_pylist()
+        by_conv: dict[str, list[dict]] = {}
+        for m in new_msgs:
+            by_conv.setdefault(m["conversation_id"], []).append(m)
+        # Participant counts are recounted (not incremented) so every write carries a current value
+        counts = await _participant_counts(cids)
+        rows = []
+        for cid in cids:
+            row = _fold_messages(current.get(cid) or _empty_row(cid), by_conv.get(cid, []))
+            rows.append({**row, "participant_count": counts.get(cid, 0), "updated_at": _now_iso()})
+        await _write_rows(tbl, rows)
+
+    def flush(self):
+        """Fold whatever is pending now (sync; used at exit)."""
+        if not (self._messages or self._participants):
+            return
+        try:
+            run_sync(self.flush_async())
+        except Exception as e:
+            print(f"conversation summary fold failed: {e}")
+
+
+SUMMARIES = ConversationSummaries()
+atexit.register(SUMMARIES.flush)
@@ -0,0 +1,38 @@
+"""
+Change tokens for tables, for caches of derived reads (routes.response_cache).
+
+table_versions_async(names) returns, per table, its LanceDB version and a
+counter that writers in this process bump with note_write(). The version moves
+with every commit from any process, as soon as the handle sees it (see
+LANCEDB_READ_CONSISTENCY_S in store.db); the counter covers what the version
+can't: handles that refresh lazily, and state readers see before it is
+committed (the run ring in store.run_stream is ahead of the StepWriter flush).
+
+A version() call reads only the table's latest manifest, so checking a few
+tables costs a fraction of a millisecond, far less than the scans it guards.
+"""
+import threading
+
+from .db import open_async_table
+
+_lock = threading.Lock()
+_writes: dict[str, int] = {}   # table name -> writes noted in this process
+
+
+def note_write(*names: str):
+    with _lock:
+        for name in names:
+            _writes[name] = _writes.get(name, 0) + 1
+
+
+async def table_versions_async(names) -> tuple:
+    """((name, version, writes), ...) for `names`; a missing table has version -1."""
+    out = []
+    for name in names:
+        try:
+            version = await (await open_async_table(name)).version()
+        except Exception:
+            version = -1
+        with _lock:
+            out.append((name, version, _writes.get(name, 0)))
+    return tuple(out)
@@ -0,0 +1,54 @@
+from datetime import datetime, timezone, timedelta
+
+import pyarrow as pa
+
+from .schemas import WORKERS_NAME, WORKERS_SCHEMA
+from .db import open_async_table, async_table_names, create_async_table, run_sync
+
+
+async def _open_workers():
+    if WORKERS_NAME in await async_table_names():
+        return await open_async_table(WORKERS_NAME)
+    print("creating workers schema")
+    return await create_async_table(WORKERS_NAME, schema=WORKERS_SCHEMA, exist_ok=True)
+
+
+async def ensure_workers_async():
+    # Called by agents.migrate_schemas, so the table exists before any worker heartbeats
+    await _open_workers()
+
+
+async def heartbeat_async(worker_id: str, *, host: str | None = None, pid: int | None = None, started_at: str | None = None):
+    """Insert or refresh this worker's row."""
+    tbl = await _open_workers()
+    now = datetime.now(timezone.utc).isoformat()
+    rec = pa.Table.from_pylist(
+        [{"worker_id": worker_id, "host": host, "pid": pid, "started_at": started_at or now, "heartbeat_at": now}],
+        schema=WORKERS_SCHEMA,
+    )
+    await tbl.merge_insert("worker_id").when_matched_update_all().when_not_matched_insert_all().execute(rec)
+
+
+def heartbeat(worker_id: str, **kwargs):
+    return run_sync(heartbeat_async(worker_id, **kwargs))
+
+
+async def list_live_workers_async(ttl_s: float) -> list[dict]:
+    """Workers whose last heartbeat is within `ttl_s` seconds, ordered by worker_id."""
+    tbl = await _open_workers()
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=ttl_s)).isoformat()
+    rows = (await tbl.query().where(f"heartbeat_at >= '{cutoff}'").to_arrow()).to_pylist()
+    return sorted(rows, key=lambda r: r["worker_id"])
+
+
+def list_live_workers(ttl_s: float) -> list[dict]:
+    return run_sync(list_live_workers_async(ttl_s))
+
+
+async def remove_worker_async(worker_id: str):
+    tbl = await _open_workers()
+    await tbl.delete(f"worker_id == '{worker_id}'")
+
+
+def remove_worker(worker_id: str):
+    return run_sync(remove_worker_async(worker_id))
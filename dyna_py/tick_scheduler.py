@@ -0,0 +1,123 @@
+# tick_scheduler.py
+"""
+Shared tick timer for LoopingAgentBase.
+
+Each agent used to wait with asyncio.wait_for(tick_event.wait(), loop_interval):
+one timer handle plus a wait_for wrapper per agent, re-created every tick. Here
+every agent on a loop shares one TickScheduler: a heap of (due, future) with a
+single loop timer armed for the earliest deadline. When it fires, everything
+due within TICK_BATCH_WINDOW_S is woken together and the timer is re-armed for
+the next deadline, so the loop sees one timer callback per batch instead of one
+per agent.
+
+Intervals are jittered by +/- TICK_JITTER (a fraction of the interval) so agents
+started together drift apart instead of hitting LanceDB and the LLM provider in
+lock-step.
+
+Interrupts still wake an agent at once: LoopingAgentBase._tick_event is a
+TickSignal, and set() resolves the pending wait directly. A wait woken early
+leaves its heap entry behind; it is dropped when it comes due.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import weakref
+
+TICK_JITTER = float(os.getenv("TICK_JITTER", "0.1"))
+TICK_BATCH_WINDOW_S = float(os.getenv("TICK_BATCH_WINDOW_S", "0.005"))
+
+
+class TickScheduler:
+    def __init__(self, loop: asyncio.AbstractEventLoop, *, jitter: float = TICK_JITTER, batch_window_s: float = TICK_BATCH_WINDOW_S):
+        self._loop = loop
+        self.jitter = jitter
+        self.batch_window_s = batch_window_s
+        self._heap: list = []              # (due, seq, future)
+        self._seq = itertools.count()      # tie-break so futures are never compared
+        self._timer: asyncio.TimerHandle | None = None
+        self._timer_due: float | None = None
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def jittered(self, delay: float) -> float:
+        if self.jitter <= 0:
+            return delay
+        return max(0.0, delay * (1.0 + random.uniform(-self.jitter, self.jitter)))
+
+    def schedule(self, fut: asyncio.Future, delay: float):
+        """Resolve `fut` with False after about `delay` seconds (unless it is done by then)."""
+        due = self._loop.time() + self.jittered(delay)
+        heapq.heappush(self._heap, (due, next(self._seq), fut))
+        if self._timer_due is None or due < self._timer_due:
+            self._arm(due)
+
+    def _arm(self, due: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer_due = due
+        self._timer = self._loop.call_at(due, self._fire)
+
+    def _fire(self):
+        self._timer = self._timer_due = None
+        horizon = self._loop.time() + self.batch_window_s
+        heap = self._heap
+        while heap and heap[0][0] <= horizon:
+            fut = heapq.heappop(heap)[2]
+            if not fut.done():
+                fut.set_result(False)
+        if heap:
+            self._arm(heap[0][0])
+
+
+_schedulers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, TickScheduler]" = weakref.WeakKeyDictionary()
+
+
+def get_tick_scheduler() -> TickScheduler:
+    """The scheduler for the running event loop."""
+    loop = asyncio.get_running_loop()
+    sched = _schedulers.get(loop)
+    if sched is None:
+        sched = _schedulers[loop] = TickScheduler(loop)
+    return sched
+
+
+class TickSignal:
+    """
+    Stands in for the per-agent asyncio.Event: set() / clear() / is_set() as before
+    (InterruptMixin, PauseMixin and callers keep using them), plus wait(timeout),
+    which parks on the shared scheduler instead of a private timer.
+    """
+
+    __slots__ = ("_flag", "_waiter")
+
+    def __init__(self):
+        self._flag = False
+        self._waiter: asyncio.Future | None = None
+
+    def is_set(self) -> bool:
+        return self._flag
+
+    def set(self):
+        self._flag = True
+        fut = self._waiter
+        if fut is not None and not fut.done():
+            fut.set_result(True)
+
+    def clear(self):
+        self._flag = False
+
+    async def wait(self, timeout: float | None = None) -> bool:
+        """Until set() or `timeout` (jittered) elapses; True if set."""
+        if self._flag:
+            return True
+        fut = asyncio.get_running_loop().create_future()
+        self._waiter = fut
+        if timeout is not None:
+            get_tick_scheduler().schedule(fut, timeout)
+        try:
+            return await fut
+        finally:
+            self._waiter = None
@@ -1,19 +1,196 @@
+"""
+Run updates for Socket.IO clients (room run::<run_id>).
+
+emit_run_update is called for every agent step from agent threads and event
+loops. It no longer talks to Socket.IO: it records the payload as the latest
+snapshot for its room (thread-safe, O(1)) and returns. One pump task, started
+with socketio.start_background_task so it runs on the server's own async model,
+sends every WS_FRAME_S the newest snapshot of each room that changed:
+
+- updates to a run within a frame are coalesced; superseded snapshots are
+  dropped, never queued, so a slow client sees fewer, fresher updates
+- pending work is bounded by the number of rooms, whatever the step rate
+- at most WS_MAX_ROOMS_PER_FRAME rooms go out per frame (oldest change first);
+  the rest wait, still holding only their newest snapshot
+- rooms nobody has joined are skipped without serialising anything
+
+init() takes either the Flask-SocketIO server (app.py) or a python-socketio
+AsyncServer (asgi_app.py); with the latter the pump is a task on the server's
+event loop and emits are awaited.
+
+Steps taken in other processes (sharded agent workers, where socketio is None
+and emit_run_update does nothing) reach their rooms through a sweep: every
+WS_RUN_SWEEP_S the pump reads, for each watched run, the newest agent_steps row
+past the seq last sent to its room and queues it like a local update. The
+subscribe handlers start a room's cursor with watch_run; local updates move it,
+so steps already sent are not read back.
+"""
+import asyncio
+import os
+import threading
+import time
+
+from store.db import run_sync
+from store.run_stream import newest_step_delta_async, split_run_id
+
+WS_FRAME_S = float(os.getenv("WS_FRAME_S", "0.1"))
+WS_MAX_ROOMS_PER_FRAME = int(os.getenv("WS_MAX_ROOMS_PER_FRAME", "500"))
+WS_RUN_SWEEP_S = float(os.getenv("WS_RUN_SWEEP_S", "1.0"))   # 0 disables the sweep
+WS_NAMESPACE = "/"
+RUN_ROOM_PREFIX = "run::"
+
 socketio = None
+_lock = threading.Lock()
+_pending: dict = {}   # room -> newest payload; dict order = order rooms first changed
+_run_cursors: dict = {}   # room -> highest seq sent or queued (watched runs only)
+_stats = {"received": 0, "coalesced": 0, "emitted": 0, "unwatched": 0, "swept": 0}
+_last_sweep = 0.0
+_pump_started = False
+
 
 def init(sio):
-    global socketio
+    global socketio, _pump_started
     socketio = sio
+    if sio is not None and not _pump_started:
+        _pump_started = True
+        sio.start_background_task(_pump_async if is_async(sio) else _pump)
+
+def is_async(sio) -> bool:
+    return asyncio.iscoroutinefunction(getattr(sio, "emit", None))
 
 def room_for_run(run_id: str) -> str:
-    return f"run::{run_id}"
+    return f"{RUN_ROOM_PREFIX}{run_id}"
+
+def watch_run(run_id: str, seq):
+    """Sweep the run for its subscribers; `seq` is the last one the subscribe reply carried."""
+    room = room_for_run(run_id)
+    with _lock:
+        _run_cursors[room] = max(_run_cursors.get(room, 0), int(seq or 0))
 
 def emit_run_update(run_id: str, payload: dict):
-# safe no-op if socketio not initialized yet
+    # safe no-op if socketio not initialized yet
     if socketio is None:
         return
+    room = room_for_run(run_id)
+    with _lock:
+        _stats["received"] += 1
+        if room in _pending:
+            _stats["coalesced"] += 1
+        _pending[room] = payload   # replacing keeps the room's place in line
+        if room in _run_cursors and payload.get("seq"):
+            _run_cursors[room] = max(_run_cursors[room], payload["seq"])
+
+def stats() -> dict:
+    with _lock:
+        return dict(_stats, pending=len(_pending))
+
+def _take_frame(limit: int) -> list:
+    with _lock:
+        rooms = list(_pending)[:limit]
+        return [(room, _pending.pop(room)) for room in rooms]
+
+def has_subscribers(room: str) -> bool:
     try:
-        print(f"now emiting: {payload}")
-        socketio.emit("run_update", payload, to=room_for_run(run_id))
-    except Exception as e:
-        print(f"emit_run_update error for {run_id}: {e}")
+        # Flask-SocketIO wraps the python-socketio server; an AsyncServer is used directly
+        manager = getattr(socketio, "server", socketio).manager
+        return bool(manager.rooms.get(WS_NAMESPACE, {}).get(room))
+    except Exception:
+        return True   # can't tell: send it
+
+def _watched_frame(limit: int) -> list:
+    frame = []
+    for room, payload in _take_frame(limit):
+        if not has_subscribers(room):
+            with _lock:
+                _stats["unwatched"] += 1
+            continue
+        frame.append((room, payload))
+    return frame
+
+def _sweep_targets() -> dict:
+    with _lock:
+        # Forget runs nobody watches any more
+        for room in [r for r in _run_cursors if not has_subscribers(r)]:
+            _run_cursors.pop(room, None)
+        return dict(_run_cursors)
+
+async def _sweep_async(targets: dict) -> int:
+    """Queue the newest stored step of each target run past its cursor. Returns how many were queued."""
+    async def one(room, cursor):
+        return room, await newest_step_delta_async(*split_run_id(room[len(RUN_ROOM_PREFIX):]), cursor)
+    results = await asyncio.gather(*(one(r, c) for r, c in targets.items()), return_exceptions=True)
+    queued = 0
+    with _lock:
+        for res in results:
+            if isinstance(res, Exception):
+                print(f"ws_bus sweep read failed: {res}")
+                continue
+            room, delta = res
+            # A local update may have moved the cursor past it meanwhile
+            if delta is None or room not in _run_cursors or delta["seq"] <= _run_cursors[room]:
+                continue
+            _run_cursors[room] = delta["seq"]
+            _pending[room] = delta
+            queued += 1
+        _stats["swept"] += queued
+    return queued
+
+def _sweep_due() -> bool:
+    global _last_sweep
+    if WS_RUN_SWEEP_S <= 0:
+        return False
+    now = time.monotonic()
+    if now - _last_sweep < WS_RUN_SWEEP_S:
+        return False
+    _last_sweep = now
+    return True
+
+def flush(limit: int = WS_MAX_ROOMS_PER_FRAME, sweep: bool = False) -> int:
+    """Send one frame now (after a sweep, if asked). Returns the number of rooms emitted to."""
+    if sweep:
+        targets = _sweep_targets()
+        if targets:
+            run_sync(_sweep_async(targets))
+    sent = 0
+    for room, payload in _watched_frame(limit):
+        try:
+            socketio.emit("run_update", payload, to=room)
+            sent += 1
+        except Exception as e:
+            print(f"emit_run_update error for {room}: {e}")
+    with _lock:
+        _stats["emitted"] += sent
+    return sent
+
+async def flush_async(limit: int = WS_MAX_ROOMS_PER_FRAME, sweep: bool = False) -> int:
+    """flush() for an AsyncServer (sweep reads on the server's own loop)."""
+    if sweep:
+        targets = _sweep_targets()
+        if targets:
+            await _sweep_async(targets)
+    sent = 0
+    for room, payload in _watched_frame(limit):
+        try:
+            await socketio.emit("run_update", payload, to=room)
+            sent += 1
+        except Exception as e:
+            print(f"emit_run_update error for {room}: {e}")
+    with _lock:
+        _stats["emitted"] += sent
+    return sent
+
+def _pump():
+    while True:
+        socketio.sleep(WS_FRAME_S)
+        try:
+            flush(sweep=_sweep_due())
+        except Exception as e:
+            print(f"ws_bus pump error: {e}")
 
+async def _pump_async():
+    while True:
+        await socketio.sleep(WS_FRAME_S)
+        try:
+            await flush_async(sweep=_sweep_due())
+        except Exception as e:
+            print(f"ws_bus pump error: {e}")